@@ -1,4 +1,4 @@
-from core.models.MemberModels import Member
+from core.models.RfidModels import RfidRegistry, resolve_rfid
 from django.db import models
 
 # Create your models here.
@@ -8,17 +8,12 @@ class RfidCheckManager(models.Manager):
     @staticmethod
     def create(rfid=None):
 
-        matching_members = list(Member.objects.filter(rfid=rfid))
-        num_members = len(matching_members)
+        kind, member = resolve_rfid(rfid)
 
-        if num_members > 1:
-            message = "Multiple Members with this RFID!"
-            is_valid = False
-        elif num_members == 0:
+        if kind != RfidRegistry.MEMBER:
             message = "Not a member RFID"
             is_valid = False
         else:
-            member = matching_members[0]
             message = f"{member.get_full_name()}: {member.group}"
             if member.is_active_member:
                 is_valid = True
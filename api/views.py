@@ -21,8 +21,7 @@ class ActiveMemberView(LoginRequiredMixin, UserPassesTestMixin,TemplateView):
     def get_context_data(self, **kwargs):
         context = super(ActiveMemberView, self).get_context_data(**kwargs)
 
-        members = Member.objects.all()
-        emails = [f"{member.email}\n" for member in members if member.is_active_member]
+        emails = [f"{email}\n" for email in Member.objects.active().values_list("email", flat=True)]
 
         context['emails'] = emails
         return context
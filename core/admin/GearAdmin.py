@@ -1,26 +1,81 @@
-import json
+import re
 from collections import OrderedDict
 
 from core.admin.ViewableAdmin import ViewableModelAdmin
 from core.forms.GearForms import GearAddForm, GearChangeForm
-from core.views.GearViews import GearDetailView, GearTypeDetailView, GearViewList
-from django.contrib.admin import ModelAdmin
+from core.views.GearViews import GearDetailView, GearHistoryView, GearTypeDetailView, GearViewList
+from core.models.GearModels import CustomDataField, GearAttribute, GearConflict, GearType
+from django.contrib import messages
+from django.contrib.admin import ModelAdmin, SimpleListFilter
 from django.contrib.admin.utils import quote
 from django.http import HttpResponseRedirect
-from django.urls import reverse
+from django.urls import path, reverse
+
+
+#: A search for the value of a data field, like "size = M" or "length >= 170"
+GEAR_DATA_SEARCH = re.compile(r"^\s*(\w+)\s*(=|>=|<=|>|<)\s*(.+?)\s*$")
+
+GEAR_DATA_OPERATORS = {">": "gt", ">=": "gte", "<": "lt", "<=": "lte"}
+
+
+def build_gear_data_filter(field, choices):
+    """Build a list filter that filters gear by the value of a choice data field, i.e. all size M gear"""
+
+    class GearDataFilter(SimpleListFilter):
+        title = field.label or str(field)
+        parameter_name = f"data_{field.name}"
+
+        def lookups(self, request, model_admin):
+            return choices.items()
+
+        def queryset(self, request, queryset):
+            if self.value():
+                return queryset.filter(gear_data__contains={field.name: self.value()})
+            return queryset
+
+    return GearDataFilter
+
+
+def build_gear_attribute_filter(field, geartype):
+    """Build a list filter that filters gear by any of the values of the data field present on gear of the geartype"""
+
+    class GearAttributeFilter(SimpleListFilter):
+        title = field.label or str(field)
+        parameter_name = f"attr_{field.name}"
+
+        def lookups(self, request, model_admin):
+            values = (
+                GearAttribute.objects.filter(field=field, gear__geartype=geartype)
+                .order_by(field.attribute_column)
+                .values_list(field.attribute_column, flat=True)
+                .distinct()
+            )
+            if field.data_type == "boolean":
+                return [(str(value), "Yes" if value else "No") for value in values]
+            return [(str(value), field.get_str(value) or value) for value in values]
+
+        def queryset(self, request, queryset):
+            if self.value():
+                return queryset.with_attr(**{field.name: self.value()})
+            return queryset
+
+    return GearAttributeFilter
 
 
 class GearAdmin(ViewableModelAdmin):
     # Make all the data about a certification be shown in the list display
-    list_display = ("name", "status", "get_department", "checked_out_to", "due_date")
+    list_display = ("display_name", "status", "get_department", "checked_out_to", "due_date")
+
+    # Every row of the list needs the geartype (for the name) and its department, so fetch them with the gear
+    list_select_related = ("geartype__department", "checked_out_to")
 
     # Choose which fields appear on the side as filters
     list_filter = ("status", "geartype__department", "geartype")
 
     # Choose which fields can be searched for
     search_fields = (
+        "display_name",
         "geartype__name",
-        "gear_data",
         "rfid",
         "checked_out_to__first_name",
         "checked_out_to__last_name",
@@ -40,6 +95,13 @@ class GearAdmin(ViewableModelAdmin):
     list_view = GearViewList
     detail_view_class = GearDetailView
 
+    def get_urls(self):
+        """Add the url that the transaction history on the detail page loads more transactions from"""
+        history_url = path(
+            "<int:pk>/history/", self.admin_site.admin_view(GearHistoryView.as_view()), name="core_gear_history"
+        )
+        return [history_url] + super(GearAdmin, self).get_urls()
+
     def get_fieldsets(self, request, obj=None):
         """Add in the dynamic fields defined by geartype into the fieldsets (so django knows how to display them)"""
         fieldsets = super(GearAdmin, self).get_fieldsets(request, obj=obj)
@@ -47,7 +109,8 @@ class GearAdmin(ViewableModelAdmin):
         # Only get the extra fieldsets if we already have an object created
         if obj:
             fieldsets = fieldsets + [
-                obj.get_extra_fieldset()
+                obj.get_extra_fieldset(),
+                (None, {"classes": ("hidden",), "fields": ("gear_version",)}),
             ]  # Using append gives multiple copies of the extra fields
 
         return tuple(fieldsets)
@@ -63,13 +126,12 @@ class GearAdmin(ViewableModelAdmin):
             extended_form.authorizer_rfid = request.user.rfid
 
             # Load all the fields that need to be added dynamically from the geartype
-            gear_data = json.loads(obj.gear_data)
-            extra_fields = obj.geartype.data_fields.all()
+            gear_data = obj.get_gear_data()
+            extra_fields = obj.geartype.get_data_fields().values()
 
             # For each dynamic field, add it to declared fields and the fields list (returned here)
             for field in extra_fields:
-                field_data = gear_data[field.name]
-                form_field = field.get_field(**field_data)
+                form_field = field.get_field(current=gear_data.get(field.name))
                 extended_form.declared_fields.update({field.name: form_field})
             return super(GearAdmin, self).get_form(
                 request, obj=obj, form=extended_form, **kwargs
@@ -87,6 +149,61 @@ class GearAdmin(ViewableModelAdmin):
                 request, obj=None, form=add_form, **kwargs
             )
 
+    def save_model(self, request, obj, form, change):
+        """Changed gear was already saved by the override transaction, which the change form makes"""
+        if not change:
+            super(GearAdmin, self).save_model(request, obj, form, change)
+
+    def changeform_view(self, request, object_id=None, form_url="", extra_context=None):
+        """Send the admin back to the gear if it was changed by someone else in the instant before the save"""
+        try:
+            return super(GearAdmin, self).changeform_view(request, object_id, form_url, extra_context)
+        except GearConflict as e:
+            self.message_user(request, e.message, messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+    def get_list_filter(self, request):
+        """Once a gear type is selected, also allow filtering by the values of each of its data fields"""
+        list_filter = super(GearAdmin, self).get_list_filter(request)
+
+        geartype_id = request.GET.get("geartype__id__exact")
+        if geartype_id and geartype_id.isdigit():
+            geartype = GearType(pk=int(geartype_id))
+            schema = geartype.get_schema()
+            data_filters = []
+            for name, field in schema.fields.items():
+                if name in schema.choices:
+                    data_filters.append(build_gear_data_filter(field, schema.choices[name]))
+                elif field.data_type in ("int", "float", "boolean", "string"):
+                    data_filters.append(build_gear_attribute_filter(field, geartype))
+            list_filter = tuple(list_filter) + tuple(data_filters)
+
+        return list_filter
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Searches in the form "<field name> <operator> <value>" (i.e. "size = M" or "length >= 170") are run against the
+        gear data directly, any other searches are run against the search fields as usual
+        """
+        match = GEAR_DATA_SEARCH.match(search_term)
+        if match:
+            name, operator, value = match.groups()
+            field = CustomDataField.objects.filter(name=name).first()
+            if field is not None:
+                try:
+                    value = field.parse_value(value)
+                except ValueError:
+                    return queryset.none(), False
+
+                if operator == "=":
+                    # Exact matches can use the GIN index
+                    return queryset.filter(gear_data__contains={name: value}), False
+                # Comparisons use the typed attribute index instead
+                lookup = f"{name}__{GEAR_DATA_OPERATORS[operator]}"
+                return queryset.with_attr(**{lookup: value}), False
+
+        return super(GearAdmin, self).get_search_results(request, queryset, search_term)
+
     def response_add(self, request, obj, post_url_continue=None):
         """After adding a new piece of gear, always go to the 'change' page to finish filling out gear data"""
         change_url = reverse(
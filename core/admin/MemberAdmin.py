@@ -5,6 +5,7 @@ from core.forms.MemberForms import MemberChangeForm, MemberCreationForm, Staffer
 from core.views.MemberViews import (
     MemberDetailView,
     MemberFinishView,
+    MemberHistoryView,
     MemberListView,
     StafferDetailView,
     ResendIntroEmailView
@@ -99,7 +100,12 @@ class MemberAdmin(ViewableModelAdmin, BaseUserAdmin):
                 "<int:pk>/email/",
                 self.wrap(ResendIntroEmailView.as_view()),
                 name="core_member_resendemail",
-            )
+            ),
+            path(
+                "<int:pk>/history/",
+                self.wrap(MemberHistoryView.as_view()),
+                name="core_member_history",
+            ),
         ]
 
         # Return all of our newly created urls along with all of the defaults
@@ -1,6 +1,7 @@
 """This file is intended to contain only the admin classes for models that do not require much admin functionality"""
 
 from core.admin.ViewableAdmin import ViewableModelAdmin
+from core.models.TaskModels import CHART_DAYS, TaskRun
 from core.views.OtherModelViews import CertificationDetailView, DepartmentDetailView
 from django.contrib.admin import ModelAdmin
 
@@ -24,3 +25,42 @@ class AlreadyUploadedImageAdmin(ModelAdmin):
     list_display = ("image_tag", "name", "image_type", "sub_type", "upload_date")
     list_filter = ("image_type", "sub_type")
     readonly_fields = ("image_tag",)
+
+
+class OutboundEmailAdmin(ModelAdmin):
+
+    # Show where every email is in being delivered, so that failed ones can be found and retried
+    list_display = ("subject", "to_email", "status", "attempts", "queued_at", "next_attempt_at", "sent_at")
+    list_filter = ("status", "from_email")
+    search_fields = ("to_email", "to_name", "subject")
+    readonly_fields = ("status", "attempts", "last_error", "queued_at", "next_attempt_at", "sent_at")
+    actions = ("retry",)
+
+    def retry(self, request, queryset):
+        retried = queryset.retry()
+        self.message_user(request, f"Queued {retried} emails to be sent again")
+    retry.short_description = "Send the selected emails again"
+
+
+class TaskRunAdmin(ModelAdmin):
+
+    # Runs are only ever recorded by the tasks themselves, the admin just shows them along with a chart of their times
+    list_display = ("name", "status", "started_at", "duration", "rows_examined", "rows_changed", "emails_queued")
+    list_filter = ("name", "status")
+    readonly_fields = (
+        "name", "status", "started_at", "finished_at", "rows_examined", "rows_changed", "emails_queued", "error"
+    )
+    date_hierarchy = "started_at"
+    change_list_template = "admin/core/taskrun/change_list.html"
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = extra_context or {}
+        extra_context["chart_data"] = TaskRun.objects.chart_data()
+        extra_context["chart_days"] = CHART_DAYS
+        return super(TaskRunAdmin, self).changelist_view(request, extra_context=extra_context)
@@ -0,0 +1,48 @@
+"""
+The templates of all the emails the system sends, in Django template syntax
+
+Every template is read and compiled once per process, the first time it is needed. Emails are plain text, so nothing
+is escaped unless the template turns autoescaping on itself (as the html emails do with {% autoescape on %}). Dates
+should be formatted with the strftime filter from email_filters, which is much faster than Django's date filter.
+"""
+import os
+from functools import lru_cache
+
+from django.template import Context, Engine
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "emails")
+
+engine = Engine(
+    dirs=[TEMPLATES_DIR],
+    autoescape=False,
+    libraries={"email_filters": "core.templatetags.email_filters"},
+)
+
+
+@lru_cache(maxsize=None)
+def get_template(name):
+    """Get the compiled email template of the given name"""
+    return engine.get_template(f"{name}.txt")
+
+
+def render(name, **context):
+    """Render a single email body from the named template"""
+    return get_template(name).render(Context(context, autoescape=False))
+
+
+def render_many(name, contexts):
+    """
+    Render an email body for each of many recipients from the same template
+
+    The template is compiled once, and a single context is reused with each recipient's values pushed on top of it.
+
+    :param contexts: iterable of dicts of the values for each recipient
+    :return: list of the rendered bodies, in the same order as contexts
+    """
+    template = get_template(name)
+    context = Context(autoescape=False)
+    bodies = []
+    for values in contexts:
+        with context.push(values):
+            bodies.append(template.render(context))
+    return bodies
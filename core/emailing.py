@@ -1,15 +1,29 @@
+import logging
 import smtplib
-from uwccsystem import settings
+import threading
 
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+#: Errors after which the connection to the mail server can not be used anymore, and has to be opened again
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError)
+
+#: How long to wait for the mail server before giving up, in seconds
+SMTP_TIMEOUT = 30
+
+_active = threading.local()
+
+
+def get_smtp_password(from_email):
+    """Get the password to log in to the mail server as the given sender"""
+    if from_email == settings.MEMBERSHIP_EMAIL_HOST_USER:
+        return settings.MEMBERSHIP_EMAIL_HOST_PASSWORD
+    return settings.EMAIL_HOST_PASSWORD
 
-def send_email(to_emails, title, body,
-               from_email=None, smtp_password=None, from_name='Excursion Club', receiver_names=None):
 
-    # If SMTP credentials are not given, use defaults
-    if from_email is None:
-        from_email = settings.EMAIL_HOST_USER
-    if smtp_password is None:
-        smtp_password = settings.EMAIL_HOST_PASSWORD
+def format_email(to_emails, title, body, from_email, from_name='Excursion Club', receiver_names=None):
+    """Prepare the formatted email message, ready to be sent"""
 
     # Prepare the list of recipients, optionally including names
     if receiver_names is None:
@@ -17,17 +31,125 @@ def send_email(to_emails, title, body,
     else:
         recipients = ", ".join([f'{receiver[0]} <{receiver[1]}>' for receiver in zip(receiver_names, to_emails)])
 
-    # Prepare the formatted email message ready to be sent
-    email = f"From: {from_name} <{from_email}> \n" \
+    return f"From: {from_name} <{from_email}> \n" \
         f"To: {recipients} \n" \
         f"Subject: {title} \n" \
         f"{body} \n"
 
-    smtp_obj = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT)
-    if settings.EMAIL_USE_TLS:
-        smtp_obj.starttls()
-        smtp_obj.login(from_email, smtp_password)
-    smtp_obj.sendmail(from_email, to_emails, email)
+
+class SmtpConnection:
+    """A connection to the mail server, logged in as a single sender, that is opened again whenever it drops"""
+
+    def __init__(self, from_email, smtp_password):
+        self.from_email = from_email
+        self.smtp_password = smtp_password
+        self.smtp = None
+
+    def open(self):
+        self.smtp = smtplib.SMTP(settings.EMAIL_HOST, settings.EMAIL_PORT, timeout=SMTP_TIMEOUT)
+        if settings.EMAIL_USE_TLS:
+            self.smtp.starttls()
+            self.smtp.login(self.from_email, self.smtp_password)
+
+    def close(self):
+        if self.smtp is None:
+            return
+        try:
+            self.smtp.quit()
+        except (smtplib.SMTPException, OSError):
+            # The server already hung up, so there is nothing left to close politely
+            self.smtp.close()
+        self.smtp = None
+
+    def sendmail(self, to_emails, message):
+        """Send the message, opening the connection again once if it was dropped (i.e. by an idle timeout)"""
+        if self.smtp is None:
+            self.open()
+        try:
+            return self.smtp.sendmail(self.from_email, to_emails, message)
+        except CONNECTION_ERRORS:
+            logger.info(f"The connection to the mail server as {self.from_email} dropped, reconnecting")
+            self.close()
+            self.open()
+            return self.smtp.sendmail(self.from_email, to_emails, message)
+
+
+class EmailTransport:
+    """
+    Sends emails over one connection to the mail server for each sender, instead of a new connection for every email
+
+    Use it as a context manager around anything that sends many emails. Inside the block every call to send_email (no
+    matter how deeply nested) goes through the transport, and all the connections are closed at the end:
+
+        with EmailTransport():
+            for member in members:
+                member.send_expired_email()
+    """
+
+    def __init__(self):
+        self.connections = {}
+        self._outer = None
+
+    def __enter__(self):
+        self._outer = getattr(_active, "transport", None)
+        _active.transport = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active.transport = self._outer
+        self.close()
+
+    def get_connection(self, from_email, smtp_password):
+        connection = self.connections.get(from_email)
+        if connection is None:
+            connection = SmtpConnection(from_email, smtp_password)
+            self.connections[from_email] = connection
+        return connection
+
+    def send(self, to_emails, title, body,
+             from_email=None, smtp_password=None, from_name='Excursion Club', receiver_names=None):
+        """Send a single email, see send_email"""
+
+        # If SMTP credentials are not given, use defaults
+        if from_email is None:
+            from_email = settings.EMAIL_HOST_USER
+        if smtp_password is None:
+            smtp_password = get_smtp_password(from_email)
+
+        message = format_email(to_emails, title, body, from_email, from_name, receiver_names)
+        self.get_connection(from_email, smtp_password).sendmail(to_emails, message)
+
+    def send_many(self, emails):
+        """
+        Send a whole batch of emails, carrying on past any that fail
+
+        :param emails: iterable of dicts of the keyword arguments of send
+        :return: list of (email, exception) for all the emails that could not be sent
+        """
+        failures = []
+        for email in emails:
+            try:
+                self.send(**email)
+            except (smtplib.SMTPException, OSError) as error:
+                logger.warning(f"Failed to send {email.get('title')} to {email.get('to_emails')}: {error}")
+                failures.append((email, error))
+        return failures
+
+    def close(self):
+        for connection in self.connections.values():
+            connection.close()
+        self.connections = {}
+
+
+def send_email(to_emails, title, body,
+               from_email=None, smtp_password=None, from_name='Excursion Club', receiver_names=None):
+    """Send an email, through the active EmailTransport if there is one, or over a connection of its own otherwise"""
+    transport = getattr(_active, "transport", None)
+    if transport is not None:
+        transport.send(to_emails, title, body, from_email, smtp_password, from_name, receiver_names)
+    else:
+        with EmailTransport() as transport:
+            transport.send(to_emails, title, body, from_email, smtp_password, from_name, receiver_names)
     print("Successfully sent email")
 
 
@@ -1,10 +1,9 @@
-import json
-
 from core.forms.widgets import GearImageWidget
 from core.models.FileModels import AlreadyUploadedImage
-from core.models.GearModels import Gear
+from core.models.GearModels import Gear, GearConflict
+from core.models.RfidModels import RfidRegistry
 from core.models.TransactionModels import Transaction
-from django.forms import ModelChoiceField, ModelForm, ValidationError
+from django.forms import HiddenInput, IntegerField, ModelChoiceField, ModelForm, ValidationError
 
 
 class GearChangeForm(ModelForm):
@@ -16,26 +15,34 @@ class GearChangeForm(ModelForm):
     existing_images = AlreadyUploadedImage.objects.filter(image_type="gear")
     image = ModelChoiceField(existing_images, widget=GearImageWidget)
 
+    # The version of the gear when the page was loaded, so that changes made since are not silently overwritten
+    gear_version = IntegerField(widget=HiddenInput)
+
     def __init__(self, *args, **kwargs):
         super(GearChangeForm, self).__init__(*args, **kwargs)
 
         # Make gear type non-editable. Necessary to avoid data corruption
         self.fields["geartype"].disabled = True
+        self.fields["gear_version"].initial = self.instance.version
+
+    def clean(self):
+        cleaned_data = super(GearChangeForm, self).clean()
+        version = cleaned_data.get("gear_version")
+        if version is not None and Gear.objects.filter(pk=self.instance.pk).exclude(version=version).exists():
+            raise GearConflict(
+                f"The {self.instance.name} was changed by someone else since this page was loaded, please reload it"
+            )
+        return cleaned_data
 
     def clean_gear_data(self):
         """Compile the data from all the custom fields to be saved into gear_data"""
-        # TODO: Fix this
-        gear_data_dict = {}
-        original_gear_data = json.loads(self.instance.gear_data)
+        gear_data = dict(self.instance.gear_data)
         for name in self.declared_fields.keys():
-            if name == "image":
+            if name in ("image", "gear_version"):
                 continue
-            value = self.cleaned_data[name]
-            field_data = original_gear_data[name]
-            field_data["initial"] = value
-            gear_data_dict[name] = field_data
+            gear_data[name] = self.cleaned_data[name]
 
-        return json.dumps(gear_data_dict)
+        return gear_data
 
     def save(self, commit=True):
         """Save using the Transactions instead of using the gear object directly"""
@@ -45,9 +52,10 @@ class GearChangeForm(ModelForm):
 
         self.cleaned_data["gear_data"] = self.clean_gear_data()
         gear_rfid = self.cleaned_data.pop("rfid")
+        version = self.cleaned_data.pop("gear_version")
         change_data = self.cleaned_data
         transaction, gear = Transaction.objects.override(
-            self.authorizer_rfid, gear_rfid, **change_data
+            self.authorizer_rfid, gear_rfid, version=version, **change_data
         )
         return gear
 
@@ -70,7 +78,7 @@ class GearAddForm(ModelForm):
         self.fields["status"].initial = 0
 
     def build_gear_data(self):
-        """During the initial creation of the gear, the gear data JSON must be created."""
+        """During the initial creation of the gear, the gear data must be created with an empty value for each field"""
         geartype = self.instance.geartype
         return geartype.build_empty_data()
 
@@ -83,7 +91,8 @@ class GearAddForm(ModelForm):
             int(cleaned_rfid)
         except ValueError:
             raise ValidationError("The rfid can only contain digits")
-        # TODO: Validate that the rfid isn't already in use
+        if RfidRegistry.objects.is_in_use(cleaned_rfid):
+            raise ValidationError("This rfid is already in use!")
         return cleaned_rfid
 
     def save(self, commit=True):
@@ -1,10 +1,9 @@
 from collections import OrderedDict
 import json
 
-from core.convinience import get_all_rfids
 from core.forms.fields.RFIDField import RFIDField
 from core.forms.widgets import ExCEmailWidget
-from core.models import Member, Staffer
+from core.models import Member, RfidRegistry, Staffer
 from core.models.QuizModels import Question
 from django import forms
 from django.contrib.auth.forms import ReadOnlyPasswordHashField
@@ -76,7 +75,7 @@ class MemberCreationForm(forms.ModelForm):
     def clean_rfid(self):
         rfid = self.cleaned_data["rfid"]
 
-        if rfid in get_all_rfids():
+        if rfid and RfidRegistry.objects.is_in_use(rfid):
             raise forms.ValidationError(f"The RFID '{rfid}' is already in use!")
 
         # If a member is renewing, the RFID can either be a new rfid, or empty
@@ -156,7 +155,7 @@ class MemberCreationForm(forms.ModelForm):
         finish_url = WEB_BASE + reverse(
             "admin:core_member_finish", kwargs={"pk": member.pk}
         )
-        member.send_intro_email(finish_url)
+        member.queue_intro_email(finish_url)
         member.save()
         return member
 
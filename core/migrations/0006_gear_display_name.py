@@ -0,0 +1,57 @@
+# Generated by Django 3.0.1 on 2026-10-18 11:03
+
+import json
+
+from django.db import migrations, models
+
+
+def build_display_names(apps, schema_editor):
+    """
+    Fill in the display name of all existing gear
+
+    This uses the historical models, so the logic of Gear.build_name is repeated here in simplified form
+    """
+    Gear = apps.get_model("core", "Gear")
+    GearType = apps.get_model("core", "GearType")
+
+    schemas = {}
+    for geartype in GearType.objects.all():
+        links = GearType.data_fields.through.objects.filter(geartype_id=geartype.pk).order_by("id")
+        schemas[geartype.pk] = (geartype.name, [link.customdatafield for link in links])
+
+    for gear in Gear.objects.all().iterator():
+        geartype_name, fields = schemas[gear.geartype_id]
+        gear_data = json.loads(gear.gear_data)
+        attributes = []
+        for field in fields:
+            field_data = gear_data.get(field.name)
+            if field.data_type == "rfid" or not field_data or not field_data.get("initial"):
+                continue
+            value = field_data["initial"]
+            if field.data_type == "choice":
+                value = dict(field_data["choices"]).get(value, value)
+                attributes.append(str(value))
+            else:
+                attributes.append(" ".join([str(value), field.suffix]).strip())
+
+        if attributes:
+            name = f"{geartype_name} - {', '.join(attributes)}"
+        else:
+            name = geartype_name
+        Gear.objects.filter(pk=gear.pk).update(display_name=name[:255])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_cacheversion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gear',
+            name='display_name',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255, verbose_name='Name'),
+        ),
+        migrations.RunPython(build_display_names, migrations.RunPython.noop),
+    ]
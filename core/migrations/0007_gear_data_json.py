@@ -0,0 +1,74 @@
+# Generated by Django 3.0.1 on 2026-10-18 14:22
+
+import json
+
+import core.models.fields.JSONField
+from django.db import migrations
+
+
+def shrink_gear_data(apps, schema_editor):
+    """Strip the serialized field definitions out of the gear data, leaving only the value of each field"""
+    Gear = apps.get_model("core", "Gear")
+    for gear in Gear.objects.all().iterator():
+        gear_data = json.loads(gear.gear_data or "{}")
+        values = {
+            name: field_data["initial"] if isinstance(field_data, dict) else field_data
+            for name, field_data in gear_data.items()
+        }
+        Gear.objects.filter(pk=gear.pk).update(gear_data=json.dumps(values))
+
+
+def expand_gear_data(apps, schema_editor):
+    """Rebuild the old style gear data, where each value is stored along with the definition of its field"""
+    Gear = apps.get_model("core", "Gear")
+    CustomDataField = apps.get_model("core", "CustomDataField")
+    fields = {field.name: field for field in CustomDataField.objects.all()}
+
+    for gear in Gear.objects.all().iterator():
+        gear_data = {}
+        for name, value in json.loads(gear.gear_data or "{}").items():
+            field = fields[name]
+            field_data = {
+                "initial": value,
+                "data_type": field.data_type,
+                "name": field.name,
+                "required": field.required,
+                "label": field.label,
+                "help_text": field.help_text,
+            }
+            if field.data_type == "choice":
+                field_data["choices"] = [
+                    [part.strip() for part in choice.split(";")] for choice in field.choices.split("\n")
+                ]
+            gear_data[name] = field_data
+        Gear.objects.filter(pk=gear.pk).update(gear_data=json.dumps(gear_data))
+
+
+def create_gin_index(apps, schema_editor):
+    """Only Postgres stores gear data as jsonb, so the index can't be created anywhere else"""
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute(
+            "CREATE INDEX IF NOT EXISTS core_gear_gear_data_gin ON core_gear USING gin (gear_data jsonb_path_ops)"
+        )
+
+
+def drop_gin_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS core_gear_gear_data_gin")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_gear_display_name'),
+    ]
+
+    operations = [
+        migrations.RunPython(shrink_gear_data, expand_gear_data),
+        migrations.AlterField(
+            model_name='gear',
+            name='gear_data',
+            field=core.models.fields.JSONField.JSONField(default=dict),
+        ),
+        migrations.RunPython(create_gin_index, drop_gin_index),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 3.0.1 on 2026-10-18 15:40
+
+import json
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def index_gear_attributes(apps, schema_editor):
+    """
+    Build the typed index of the data of all existing gear
+
+    This uses the historical models, so the logic of GearAttribute.from_value is repeated here
+    """
+    Gear = apps.get_model("core", "Gear")
+    GearType = apps.get_model("core", "GearType")
+    GearAttribute = apps.get_model("core", "GearAttribute")
+
+    schemas = {}
+    for geartype in GearType.objects.all():
+        links = GearType.data_fields.through.objects.filter(geartype_id=geartype.pk)
+        schemas[geartype.pk] = [link.customdatafield for link in links]
+
+    attributes = []
+    for gear in Gear.objects.all().iterator():
+        gear_data = gear.gear_data
+        if isinstance(gear_data, str):
+            gear_data = json.loads(gear_data)
+        for field in schemas[gear.geartype_id]:
+            value = gear_data.get(field.name)
+            if value is None:
+                continue
+            if field.data_type in ("int", "boolean"):
+                column, value = "int_value", int(value)
+            elif field.data_type == "float":
+                column, value = "float_value", float(value)
+            else:
+                column, value = "str_value", str(value)[:300]
+            attributes.append(GearAttribute(gear_id=gear.pk, field_id=field.pk, **{column: value}))
+
+    GearAttribute.objects.bulk_create(attributes, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_gear_data_json'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GearAttribute',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('int_value', models.BigIntegerField(blank=True, null=True)),
+                ('float_value', models.FloatField(blank=True, null=True)),
+                ('str_value', models.CharField(blank=True, max_length=300, null=True)),
+                ('field', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.CustomDataField')),
+                ('gear', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attributes', to='core.Gear')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='gearattribute',
+            index=models.Index(fields=['field', 'int_value'], name='core_gearattr_int_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gearattribute',
+            index=models.Index(fields=['field', 'float_value'], name='core_gearattr_float_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gearattribute',
+            index=models.Index(fields=['field', 'str_value'], name='core_gearattr_str_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='gearattribute',
+            unique_together={('gear', 'field')},
+        ),
+        migrations.RunPython(index_gear_attributes, migrations.RunPython.noop),
+    ]
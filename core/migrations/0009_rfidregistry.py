@@ -0,0 +1,45 @@
+# Generated by Django 3.0.1 on 2026-10-18 16:31
+
+import core.models.fields.RFIDField
+from django.db import migrations, models
+
+
+def register_rfids(apps, schema_editor):
+    """Register the rfids of all existing members and gear"""
+    Member = apps.get_model("core", "Member")
+    Gear = apps.get_model("core", "Gear")
+    RfidRegistry = apps.get_model("core", "RfidRegistry")
+
+    entries = [
+        RfidRegistry(kind="member", object_pk=pk, rfid=rfid)
+        for pk, rfid in Member.objects.exclude(rfid="").values_list("pk", "rfid")
+    ]
+    entries += [
+        RfidRegistry(kind="gear", object_pk=pk, rfid=rfid)
+        for pk, rfid in Gear.objects.exclude(rfid="").values_list("pk", "rfid")
+    ]
+    RfidRegistry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_gearattribute'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RfidRegistry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rfid', core.models.fields.RFIDField.RFIDField(verbose_name='RFID')),
+                ('kind', models.CharField(choices=[('member', 'Member'), ('gear', 'Gear')], max_length=10)),
+                ('object_pk', models.BigIntegerField()),
+            ],
+            options={
+                'verbose_name_plural': 'RFID Registry',
+                'unique_together': {('kind', 'object_pk')},
+            },
+        ),
+        migrations.RunPython(register_rfids, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.0.1 on 2026-10-18 17:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_rfidregistry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gear',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
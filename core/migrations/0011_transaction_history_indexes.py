@@ -0,0 +1,25 @@
+# Generated by Django 3.0.1 on 2026-10-18 18:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_gear_version'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['gear', 'timestamp', 'primary_key'], name='core_trans_gear_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['member', 'timestamp', 'primary_key'], name='core_trans_member_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['authorizer', 'timestamp', 'primary_key'], name='core_trans_auth_time_idx'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 3.0.1 on 2026-10-18 19:02
+
+import core.models.fields.JSONField
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_transaction_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GearSnapshot',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(unique=True)),
+                ('state', core.models.fields.JSONField.JSONField(default=dict)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['timestamp', 'primary_key'], name='core_trans_time_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.0.1 on 2026-10-18 19:41
+
+import core.models.fields.PrimaryKeyField
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_gearsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('primary_key', core.models.fields.PrimaryKeyField.PrimaryKeyField(default=core.models.fields.PrimaryKeyField.make_id, primary_key=True, serialize=False)),
+                ('type', models.CharField(choices=[('Rental', (('CheckOut', 'Check Out'), ('CheckIn', 'Check In'), ('Inventory', 'In Stock'))), ('Admin Actions', (('Create', 'New Gear'), ('Delete', 'Remove Gear'), ('ReTag', 'Change Tag'), ('Break', 'Set Broken'), ('Fix', 'Set Fixed'), ('Override', 'Admin Change'))), ('Auto Updates', (('Missing', 'Gear Missing'), ('Expire', 'Gear Expiration')))], max_length=20)),
+                ('comments', models.TextField(default='')),
+                ('timestamp', models.DateTimeField()),
+                ('authorizer', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_authorized', to=settings.AUTH_USER_MODEL)),
+                ('gear', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='archived_transactions', to='core.Gear')),
+                ('member', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['gear', 'timestamp', 'primary_key'], name='core_arch_gear_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['member', 'timestamp', 'primary_key'], name='core_arch_member_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['authorizer', 'timestamp', 'primary_key'], name='core_arch_auth_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='archivedtransaction',
+            index=models.Index(fields=['timestamp', 'primary_key'], name='core_arch_time_idx'),
+        ),
+    ]
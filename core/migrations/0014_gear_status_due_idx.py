@@ -0,0 +1,17 @@
+# Generated by Django 3.0.1 on 2026-10-18 20:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_archivedtransaction'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gear',
+            index=models.Index(fields=['status', 'due_date'], name='core_gear_status_due_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.0.1 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_gear_status_due_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('to_email', models.EmailField(max_length=254)),
+                ('to_name', models.CharField(blank=True, max_length=101)),
+                ('from_email', models.EmailField(max_length=254)),
+                ('from_name', models.CharField(max_length=50)),
+                ('subject', models.CharField(max_length=200)),
+                ('body', models.TextField()),
+                ('queued_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='member',
+            index=models.Index(fields=['group', 'date_expires'], name='core_member_group_exp_idx'),
+        ),
+    ]
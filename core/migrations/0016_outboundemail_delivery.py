@@ -0,0 +1,45 @@
+# Generated by Django 3.0.1 on 2026-10-18 21:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def mark_sent(apps, schema_editor):
+    """Emails that were sent before the outbox kept a status should not be sent again"""
+    OutboundEmail = apps.get_model('core', 'OutboundEmail')
+    OutboundEmail.objects.exclude(sent_at=None).update(status=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_outboundemail_member_expiry_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboundemail',
+            name='attempts',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='outboundemail',
+            name='last_error',
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name='outboundemail',
+            name='next_attempt_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='outboundemail',
+            name='status',
+            field=models.IntegerField(choices=[(0, 'Queued'), (1, 'Sent'), (2, 'Failed')], default=0),
+        ),
+        migrations.AddIndex(
+            model_name='outboundemail',
+            index=models.Index(fields=['status', 'next_attempt_at'], name='core_email_due_idx'),
+        ),
+        migrations.RunPython(mark_sent, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 3.0.1 on 2026-10-18 23:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_outboundemail_delivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskRun',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('status', models.IntegerField(choices=[(0, 'Running'), (1, 'Succeeded'), (2, 'Failed'), (3, 'Skipped')], default=0)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('rows_examined', models.IntegerField(default=0)),
+                ('rows_changed', models.IntegerField(default=0)),
+                ('emails_queued', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='taskrun',
+            index=models.Index(fields=['name', 'started_at'], name='core_taskrun_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrun',
+            index=models.Index(fields=['started_at'], name='core_taskrun_started_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.0.1 on 2026-10-18 23:55
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_taskwatermark'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListservSubscriber',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('email', models.EmailField(max_length=254, unique=True)),
+                ('pushed_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
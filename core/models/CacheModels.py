@@ -0,0 +1,83 @@
+import time
+
+from django.db import models
+from django.db.models import F
+
+
+class CacheVersionManager(models.Manager):
+    def get_version(self, name):
+        """Get the current version of the named cache, caches that were never invalidated are at version 0"""
+        version = self.filter(name=name).values_list("version", flat=True).first()
+        return version or 0
+
+    def bump(self, name):
+        """Increment the version of the named cache, telling every process that their copy of it is out of date"""
+        updated = self.filter(name=name).update(version=F("version") + 1)
+        if not updated:
+            self.get_or_create(name=name, defaults={"version": 1})
+
+
+class CacheVersion(models.Model):
+    """
+    A named counter that is incremented every time the data behind an in-process cache changes
+
+    Every worker process keeps its own copy of the cached data, so the workers compare the version they loaded against
+    the one stored here to find out when their copy went stale.
+    """
+
+    objects = CacheVersionManager()
+
+    name = models.CharField(max_length=50, unique=True)
+    version = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} v{self.version}"
+
+
+class VersionedCache:
+    """
+    A process-wide cache of rarely changing data, kept coherent between processes by a CacheVersion counter
+
+    Values are loaded by the loader function the first time a key is requested, and are then served from memory.
+    Calling invalidate() empties the cache in this process and bumps the version counter, which other processes will
+    notice the next time they check it (at most once every check_interval seconds) and empty their caches as well.
+    """
+
+    def __init__(self, name, loader, check_interval=5):
+        self.name = name
+        self.loader = loader
+        self.check_interval = check_interval
+        self.version = None
+        self.checked_at = 0
+        self.data = {}
+
+    def get(self, key):
+        """Get the cached value for the key, loading it if it is not yet cached"""
+        self.sync()
+        try:
+            return self.data[key]
+        except KeyError:
+            value = self.loader(key)
+            self.data[key] = value
+            return value
+
+    def update(self, values):
+        """Cache the values of several keys at once, i.e. after loading all of them in a single query"""
+        self.sync()
+        self.data.update(values)
+
+    def sync(self, force=False):
+        """Throw away the cached data if another process invalidated it since it was last checked"""
+        now = time.monotonic()
+        if force or now - self.checked_at >= self.check_interval:
+            version = CacheVersion.objects.get_version(self.name)
+            if version != self.version:
+                self.data = {}
+                self.version = version
+            self.checked_at = now
+
+    def invalidate(self):
+        """Empty the cache in this process and notify all other processes that their copies are stale"""
+        self.data = {}
+        CacheVersion.objects.bump(self.name)
+        self.checked_at = 0
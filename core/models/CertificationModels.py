@@ -24,3 +24,27 @@ class Certification(models.Model):
         return WEB_BASE + reverse(
             "admin:core_certification_detail", kwargs={"pk": self.pk}
         )
+
+
+def cert_mask(cert_ids):
+    """
+    Build the bitmask of a set of certifications, where bit n is set if the certification with id n is in the set
+
+    Comparing two masks answers "does this set contain all of those certifications" without looking at the database.
+    """
+    mask = 0
+    for cert_id in cert_ids:
+        mask |= 1 << cert_id
+    return mask
+
+
+def cert_ids_in(mask):
+    """Get the ids of all the certifications in the bitmask"""
+    cert_ids = []
+    cert_id = 0
+    while mask:
+        if mask & 1:
+            cert_ids.append(cert_id)
+        mask >>= 1
+        cert_id += 1
+    return cert_ids
@@ -0,0 +1,200 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import models, transaction
+from django.utils.timezone import now, timedelta
+
+from core import emailing
+
+logger = logging.getLogger(__name__)
+
+#: How many emails are sent at the same time, each over its own connection to the mail server
+SEND_WORKERS = 4
+
+#: How many emails a worker claims from the outbox at once
+CLAIM_SIZE = 100
+
+#: How long a claimed email is left alone by other workers before it is assumed the worker sending it died
+CLAIM_TIMEOUT = timedelta(minutes=10)
+
+#: The wait before the first retry of an email that failed to send, doubling after every further failure
+RETRY_DELAY = timedelta(minutes=1)
+
+#: The longest wait between two attempts to send an email
+MAX_RETRY_DELAY = timedelta(hours=6)
+
+#: After this many failed attempts an email is dead-lettered, and only sent again when retried from the admin
+MAX_ATTEMPTS = 8
+
+#: How long the worker sleeps when the outbox is empty, in seconds
+POLL_INTERVAL = 5
+
+
+def retry_delay(attempts):
+    """How long to wait before trying to send an email again, after it failed the given number of times"""
+    return min(RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def deliver(emails):
+    """
+    Send the emails over one transport, without touching the database (this runs in the worker threads)
+
+    :return: list of (email, error) with error None for all the emails that were sent
+    """
+    results = []
+    with emailing.EmailTransport():
+        for email in emails:
+            try:
+                emailing.send_email(
+                    [email.to_email],
+                    email.subject,
+                    email.body,
+                    from_email=email.from_email,
+                    smtp_password=emailing.get_smtp_password(email.from_email),
+                    from_name=email.from_name,
+                    receiver_names=[email.to_name] if email.to_name else None,
+                )
+            except Exception as error:
+                logger.warning(f"Failed to send {email}: {error}")
+                results.append((email, error))
+            else:
+                results.append((email, None))
+    return results
+
+
+class OutboundEmailQuerySet(models.QuerySet):
+    def retry(self):
+        """Queue these emails (i.e. dead-lettered ones) to be sent again right away, with a fresh set of attempts"""
+        return self.exclude(status=OutboundEmail.SENT).update(
+            status=OutboundEmail.QUEUED, attempts=0, next_attempt_at=now()
+        )
+
+
+class OutboundEmailManager(models.Manager.from_queryset(OutboundEmailQuerySet)):
+    def build(self, to_email, subject, body, from_email, from_name="Excursion Club", to_name=""):
+        """Make an email ready to be queued, but do not save it yet (i.e. to queue many at once with bulk_create)"""
+        return self.model(
+            to_email=to_email, to_name=to_name, from_email=from_email, from_name=from_name, subject=subject, body=body
+        )
+
+    def queue(self, to_email, subject, body, from_email, from_name="Excursion Club", to_name=""):
+        """Queue an email to be sent by the email worker"""
+        email = self.build(to_email, subject, body, from_email, from_name, to_name)
+        email.save()
+        return email
+
+    def due(self, at=None):
+        """All the queued emails whose next attempt is due, the longest waiting first"""
+        at = now() if at is None else at
+        return self.filter(status=OutboundEmail.QUEUED, next_attempt_at__lte=at).order_by("next_attempt_at")
+
+    def claim(self, limit=CLAIM_SIZE):
+        """
+        Take the next due emails out of the reach of other workers until CLAIM_TIMEOUT passes
+
+        If the worker dies before sending them, the claim runs out and another worker picks them up again.
+        """
+        claimed_at = now()
+        with transaction.atomic():
+            emails = list(self.due(claimed_at).select_for_update(skip_locked=True)[:limit])
+            self.filter(pk__in=[email.pk for email in emails]).update(next_attempt_at=claimed_at + CLAIM_TIMEOUT)
+        return emails
+
+    def record_results(self, results):
+        """Mark the emails that were sent as such, and schedule the others to be tried again or dead-letter them"""
+        sent_at = now()
+        sent = [email.pk for email, error in results if error is None]
+        self.filter(pk__in=sent).update(status=OutboundEmail.SENT, sent_at=sent_at, last_error="")
+
+        for email, error in results:
+            if error is None:
+                continue
+            email.attempts += 1
+            email.last_error = f"{type(error).__name__}: {error}"
+            if email.attempts >= MAX_ATTEMPTS:
+                email.status = OutboundEmail.DEAD
+                logger.error(f"Gave up on sending {email} after {email.attempts} attempts")
+            else:
+                email.next_attempt_at = sent_at + retry_delay(email.attempts)
+            email.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
+        return len(sent)
+
+    def send_queued(self, workers=SEND_WORKERS, limit=CLAIM_SIZE):
+        """
+        Send the emails that are due, at most workers of them at the same time
+
+        The emails are split between the workers, each sending its share over its own connection per sender. Only the
+        worker threads talk to the mail server, the database is only touched from the calling thread.
+
+        :return: the number of emails sent
+        """
+        emails = self.claim(limit)
+        if not emails:
+            return 0
+
+        shares = [emails[i::workers] for i in range(min(workers, len(emails)))]
+        with ThreadPoolExecutor(max_workers=len(shares)) as pool:
+            results = [result for share in pool.map(deliver, shares) for result in share]
+        return self.record_results(results)
+
+    def drain(self, workers=SEND_WORKERS, limit=CLAIM_SIZE):
+        """Send all the emails that are due, claim by claim, until none are left"""
+        sent = 0
+        while self.due().exists():
+            sent += self.send_queued(workers, limit)
+        return sent
+
+    def run_worker(self, workers=SEND_WORKERS, poll_interval=POLL_INTERVAL):
+        """Keep sending the emails as they become due, forever"""
+        while True:
+            sent = self.send_queued(workers)
+            if sent:
+                logger.info(f"Sent {sent} emails")
+            else:
+                time.sleep(poll_interval)
+
+
+class OutboundEmail(models.Model):
+    """
+    An email waiting to be sent (or that was already sent) to a single recipient
+
+    Anything that sends an email should queue it here instead of sending it right away, so that the request or task
+    doing it is not held up (or broken) by the mail server. The queue is sent by the email worker task, which retries
+    failed emails with a growing delay, and eventually gives up on them so that they can be looked at in the admin.
+    """
+
+    objects = OutboundEmailManager()
+
+    QUEUED = 0
+    SENT = 1
+    DEAD = 2
+    status_choices = [
+        (QUEUED, "Queued"),
+        (SENT, "Sent"),
+        (DEAD, "Failed"),
+    ]
+
+    to_email = models.EmailField()
+    to_name = models.CharField(max_length=101, blank=True)
+    from_email = models.EmailField()
+    from_name = models.CharField(max_length=50)
+    subject = models.CharField(max_length=200)
+    body = models.TextField()
+
+    status = models.IntegerField(choices=status_choices, default=QUEUED)
+    queued_at = models.DateTimeField(auto_now_add=True)
+
+    #: When the email should next be tried, pushed back after every failed attempt
+    next_attempt_at = models.DateTimeField(default=now)
+    attempts = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+
+    #: When the email was sent, None while it is still waiting in the queue
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="core_email_due_idx")]
+
+    def __str__(self):
+        return f'"{self.subject}" to {self.to_email}'
@@ -1,11 +1,16 @@
-import json
+from collections import OrderedDict
 from datetime import date
 
 from core.forms.fields.RFIDField import RFIDField
 from core.forms.widgets import ExistingImageWidget
 from core.models.fields.PrimaryKeyField import PrimaryKeyField
 from core.models.FileModels import AlreadyUploadedImage
-from django.db import models
+from core.models.fields.JSONField import JSONField
+from django.core.exceptions import FieldError, ValidationError
+from django.db import models, transaction
+from django.db.models import Exists, OuterRef
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.forms.fields import (
     BooleanField,
     CharField,
@@ -17,11 +22,22 @@ from django.forms.widgets import CheckboxInput, NumberInput, Select, Textarea, T
 from django.urls import reverse
 from datetime import date
 
-from .CertificationModels import Certification
+from .CacheModels import VersionedCache
+from .CertificationModels import Certification, cert_mask
 from .DepartmentModels import Department
 from .MemberModels import Member
+from .RfidModels import RfidRegistry, rfid_cache
 from uwccsystem.settings import GEAR_EXPIRE_TIME
 
+DISPLAY_NAME_LENGTH = 255
+
+ATTRIBUTE_STRING_LENGTH = 300
+
+
+class GearConflict(ValidationError):
+    """Raised when a piece of gear was changed by someone else between being read and being written"""
+
+
 class CustomDataField(models.Model):
     data_types = (
         ("rfid", "10 digit RFID"),
@@ -102,14 +118,19 @@ class CustomDataField(models.Model):
     def serialize_float(self, value, min_value=-1000000, max_value=1000000, **kwargs):
         return {"initial": value, "min_value": min_value, "max_value": max_value}
 
+    def parse_choices(self):
+        """Parse the choices text into a tuple of (name, description) pairs"""
+        choices = []
+        choice_list = self.choices.split("\n")
+        for choice_pair in choice_list:
+            choice = choice_pair.split(";")
+            choices.append((choice[0].strip(), choice[1].strip()))
+        return tuple(choices)
+
     def serialize_choice(self, value, choices=None, **kwargs):
         # If a set of choices is not given, then try to parse out the choices from the choice field
         if not choices:
-            choices = []
-            choice_list = self.choices.split("\n")
-            for choice_pair in choice_list:
-                choice = choice_pair.split(";")
-                choices.append((choice[0].strip(), choice[1].strip()))
+            choices = self.parse_choices()
 
         return {"initial": value, "choices": tuple(choices)}
 
@@ -126,22 +147,46 @@ class CustomDataField(models.Model):
         serialized["help_text"] = help_text if help_text else self.help_text
         return serialized
 
-    def get_value(self, data_dict):
-        """Returns the object currently stored by this field"""
-        return data_dict["initial"]
+    @property
+    def attribute_column(self):
+        """The column of GearAttribute in which the values of this field are indexed"""
+        if self.data_type in ("int", "boolean"):
+            return "int_value"
+        elif self.data_type == "float":
+            return "float_value"
+        else:
+            return "str_value"
+
+    def parse_value(self, string):
+        """Convert a string (i.e. typed into a search box) into a value of the type stored by this field"""
+        string = string.strip()
+        if self.data_type == "int":
+            return int(string)
+        elif self.data_type == "float":
+            return float(string)
+        elif self.data_type == "boolean":
+            return string.lower() in ("true", "yes", "1")
+        else:
+            return string
+
+    def get_str(self, value, choices=None):
+        """
+        Get the string representation of a value of this field
 
-    def get_str(self, data_dict):
-        """Get the string representation of the value of this field"""
-        value = self.get_value(data_dict)
+        For choice fields, an already parsed dict of {name: description} can be passed as choices, otherwise the choices
+        of this field are parsed.
+        """
 
         # The string of choice should be the human readable version, not the actual value
         if value and self.data_type == "choice":
-            for choice in data_dict["choices"]:
-                if choice[0] == value:
-                    return choice[1]
-            raise KeyError(
-                f"Selected choice ({value}) not found for {self.name} field!"
-            )
+            if choices is None:
+                choices = dict(self.parse_choices())
+            try:
+                return choices[value]
+            except KeyError:
+                raise KeyError(
+                    f"Selected choice ({value}) not found for {self.name} field!"
+                )
 
         # If we got a value, connect it with the suffix to get the string representation
         elif value:
@@ -150,7 +195,13 @@ class CustomDataField(models.Model):
             return None
 
     def get_field(self, current=None, **init_data):
-        """Returns the appropriate FormField for the current data type"""
+        """
+        Returns the appropriate FormField for the current data type
+
+        If no init_data is given, the form field is set up from the definition of this data field
+        """
+        if not init_data:
+            init_data = self.serialize()
 
         # If a current field value is passed, set it as the initial value for the returned form field
         if current is not None:
@@ -168,6 +219,44 @@ class CustomDataField(models.Model):
         return field
 
 
+class GearTypeSchema:
+    """The custom data fields of a gear type in order, along with the parsed choices of all the choice fields"""
+
+    def __init__(self, data_fields):
+        self.fields = OrderedDict((field.name, field) for field in data_fields)
+        self.choices = {
+            field.name: dict(field.parse_choices())
+            for field in self.fields.values()
+            if field.data_type == "choice"
+        }
+
+
+def load_gear_schema(geartype_pk):
+    """Load the schema of the gear type from the database, with the fields in the order they were added"""
+    links = (
+        GearType.data_fields.through.objects.filter(geartype_id=geartype_pk)
+        .select_related("customdatafield")
+        .order_by("id")
+    )
+    return GearTypeSchema(link.customdatafield for link in links)
+
+
+#: Process-wide cache of the schema of each gear type, keyed by GearType pk. Invalidated by the signals at the bottom
+gear_schema_cache = VersionedCache("gear_schema", load_gear_schema)
+
+
+def load_required_cert_mask(geartype_pk):
+    """Load the bitmask of the certifications required to rent gear of the gear type"""
+    cert_ids = GearType.min_required_certs.through.objects.filter(geartype_id=geartype_pk).values_list(
+        "certification_id", flat=True
+    )
+    return cert_mask(cert_ids)
+
+
+#: Process-wide cache of the required certification mask of each gear type, keyed by GearType pk
+required_certs_cache = VersionedCache("required_certs", load_required_cert_mask)
+
+
 class GearType(models.Model):
 
     name = models.CharField(max_length=30)
@@ -192,22 +281,112 @@ class GearType(models.Model):
     def requires_certs(self):
         return True if self.min_required_certs else False
 
+    def get_schema(self):
+        """
+        Get the schema (all the CustomDataFields) of this gear type
+
+        The schema is shared by all the GearType instances in this process and is only re-loaded when some part of the
+        schema of any gear type is changed, so this is cheap to call as often as needed.
+        """
+        if self.pk is None:
+            return GearTypeSchema([])
+        return gear_schema_cache.get(self.pk)
+
+    def get_required_cert_mask(self):
+        """Get the bitmask of the certifications required to rent gear of this type (see cert_mask)"""
+        if self.pk is None:
+            return 0
+        return required_certs_cache.get(self.pk)
+
+    def get_data_fields(self):
+        """Return an ordered dict of all the CustomDataFields of this gear type, keyed by field name"""
+        return self.get_schema().fields
+
     def get_field_names(self):
         """Return a list of the names of fields included in this gear type"""
-        field_names = []
-        for field in self.data_fields.all():
-            field_names.append(field.name)
-        return field_names
+        return list(self.get_data_fields().keys())
 
     def build_empty_data(self):
         """Construct a empty gear data dict that contains no gear data"""
-        data_dict = {}
-        for field in self.data_fields.all():
-            data_dict[field.name] = field.serialize()
-        return data_dict
+        return {name: None for name in self.get_field_names()}
 
 
-class GearManager(models.Manager):
+class GearQuerySet(models.QuerySet):
+    def with_attr(self, **lookups):
+        """
+        Filter the gear by the values of their custom data fields, using the typed GearAttribute index
+
+        Each keyword is a field name, optionally followed by a lookup, i.e. with_attr(length__range=(160, 170), size="M")
+        Values given as strings are converted to the type of the data field first.
+        """
+        names = {lookup.split("__", 1)[0] for lookup in lookups}
+        fields = {field.name: field for field in CustomDataField.objects.filter(name__in=names)}
+
+        queryset = self
+        for lookup, value in lookups.items():
+            name, _, comparison = lookup.partition("__")
+            try:
+                field = fields[name]
+            except KeyError:
+                raise FieldError(f"There is no custom data field named {name}")
+
+            value = self._parse_attr_value(field, value)
+            attributes = GearAttribute.objects.filter(
+                gear=OuterRef("pk"),
+                field=field,
+                **{f"{field.attribute_column}__{comparison or 'exact'}": value},
+            )
+            queryset = queryset.filter(Exists(attributes))
+        return queryset
+
+    @staticmethod
+    def _parse_attr_value(field, value):
+        if isinstance(value, str):
+            return field.parse_value(value)
+        if isinstance(value, (list, tuple)):
+            return [field.parse_value(v) if isinstance(v, str) else v for v in value]
+        return value
+
+
+class GearManager(models.Manager.from_queryset(GearQuerySet)):
+    def update_display_names(self, queryset=None, batch_size=500):
+        """
+        Recompute the stored display name of the gear in the queryset (all gear by default)
+
+        This must be run whenever the schema of a gear type changes, since that changes the names of all gear of that
+        type without the gear itself being saved.
+
+        :return: the number of gear whose name changed
+        """
+        if queryset is None:
+            queryset = self.all()
+
+        changed = []
+        for gear in queryset.select_related("geartype").iterator():
+            name = gear.build_name()
+            if name != gear.display_name:
+                gear.display_name = name
+                changed.append(gear)
+
+        self.bulk_update(changed, ["display_name"], batch_size=batch_size)
+        return len(changed)
+
+    def split_by_eligibility(self, member, gear_list):
+        """
+        Sort the gear into the pieces that the member has the certifications to rent, and those that they do not
+
+        Once the member's certifications and the requirements of the gear types are known, this takes no queries.
+
+        :return: list of the gear the member may rent, list of the gear they may not
+        """
+        eligible, ineligible = [], []
+        for gear in gear_list:
+            if gear.get_missing_cert_mask(member):
+                ineligible.append(gear)
+            else:
+                eligible.append(gear)
+        return eligible, ineligible
+
     def _create(self, rfid, geartype, image, **gear_data):
         """
         Create a piece of gear that contains the basic data, and all additional data specified by the geartype
@@ -218,14 +397,8 @@ class GearManager(models.Manager):
         # Create a simple piece of gear without any extra gear data
         gear = Gear(rfid=rfid, status=0, geartype=geartype, image=image)
 
-        # Filter out any passed data that is not referenced by the gear type
-        extra_fields = CustomDataField.objects.filter(geartype=geartype)
-        data_dict = {}
-        for field in extra_fields:
-            data_dict[field.name] = field.serialize(**gear_data[field.name])
-
-        # Add in the additional data as a string before saving the piece of gear
-        gear.gear_data = json.dumps(data_dict)
+        # Filter out any passed data that is not referenced by the gear type, only the values themselves are stored
+        gear.gear_data = {name: gear_data.get(name) for name in geartype.get_field_names()}
         gear.save()
 
         return gear
@@ -249,6 +422,7 @@ class Gear(models.Model):
 
     class Meta:
         verbose_name_plural = "Gear"
+        indexes = [models.Index(fields=["status", "due_date"], name="core_gear_status_due_idx")]
 
     primary_key = PrimaryKeyField()
     rfid = models.CharField(max_length=10, unique=True)
@@ -286,7 +460,16 @@ class Gear(models.Model):
 
     geartype = models.ForeignKey(GearType, on_delete=models.CASCADE)
 
-    gear_data = models.CharField(max_length=2000)
+    #: The values of the CustomDataFields of the geartype, keyed by field name. On Postgres this is GIN indexed jsonb
+    gear_data = JSONField()
+
+    #: The name of this gear, generated from the geartype and gear data. Stored so that it can be sorted and searched
+    display_name = models.CharField(
+        "Name", max_length=DISPLAY_NAME_LENGTH, default="", blank=True, db_index=True
+    )
+
+    #: Incremented every time the gear is changed, so that writes based on an outdated copy of the gear can be refused
+    version = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
@@ -296,24 +479,32 @@ class Gear(models.Model):
         Allows the values of CustomDataFields stored in GearType to be accessed as if they were attributes of Gear
         """
 
-        gear_data = json.loads(self.__getattribute__("gear_data"))
+        # Private and internal attributes (e.g. django's caches) can never be custom data fields, so don't parse for them
+        if item.startswith("_"):
+            raise AttributeError(f"No attribute {item} for {repr(self)}!")
+
+        gear_data = self.get_gear_data()
 
-        if item is None:
-            return self
-        elif item in gear_data.keys():
-            geartype = self.__getattribute__("geartype")
-            field = geartype.data_fields.get(name=item)
-            return field.get_value(gear_data[item])
+        if item in gear_data:
+            return gear_data[item]
         else:
             raise AttributeError(f"No attribute {item} for {repr(self)}!")
 
+    def get_gear_data(self):
+        """
+        Return the gear data as a dict of field_name, value
+
+        Treat the returned dict as read only, to change the gear data assign a new dict to gear_data.
+        """
+        return self.gear_data
+
     def get_display_gear_data(self):
         """Return the gear data as a simple dict of field_name, field_value"""
         simple_data = {}
-        attr_fields = self.geartype.data_fields.all()
-        gear_data = json.loads(self.gear_data)
-        for field in attr_fields:
-            simple_data[field.name] = field.get_str(gear_data[field.name])
+        gear_data = self.get_gear_data()
+        schema = self.geartype.get_schema()
+        for name, field in schema.fields.items():
+            simple_data[name] = field.get_str(gear_data.get(name), schema.choices.get(name))
         return simple_data
 
     @property
@@ -347,17 +538,24 @@ class Gear(models.Model):
     @property
     def name(self):
         """
-        Auto-generate a name that can (semi-uniquely) identify this piece of gear
+        A name that can (semi-uniquely) identify this piece of gear
 
-        Name will be in the form: <GearType> - <attr 1>, <attr 2>, etc...
+        The name is stored in the display_name column whenever the gear is saved, so this does not need to look at the
+        gear type or the gear data. Name will be in the form: <GearType> - <attr 1>, <attr 2>, etc...
         """
+        return self.display_name or self.build_name()
+
+    def build_name(self):
+        """Auto-generate the name of this piece of gear from the gear type and the values of its data fields"""
 
         # Get all custom data fields for this data_type, except those that contain a rfid
-        attr_fields = self.geartype.data_fields.exclude(data_type="rfid")
+        schema = self.geartype.get_schema()
         attributes = []
-        gear_data = json.loads(self.gear_data)
-        for field in attr_fields:
-            string = field.get_str(gear_data[field.name])
+        gear_data = self.get_gear_data()
+        for field in schema.fields.values():
+            if field.data_type == "rfid" or field.name not in gear_data:
+                continue
+            string = field.get_str(gear_data[field.name], schema.choices.get(field.name))
             if string:
                 attributes.append(str(string))
 
@@ -367,13 +565,59 @@ class Gear(models.Model):
         else:
             name = self.geartype.name
 
-        return name
+        return name[:DISPLAY_NAME_LENGTH]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        gear = super(Gear, cls).from_db(db, field_names, values)
+        gear._saved_rfid = gear.__dict__.get("rfid")
+        return gear
+
+    def save(self, *args, **kwargs):
+        """
+        Keep the stored display name in sync with the gear type and gear data every time the gear is saved, and register
+        any change of the rfid in the same database transaction
+
+        Saving existing gear moves it to the next version. If the gear was changed by anyone else since this copy of it
+        was read, the save is refused with a GearConflict and nothing is written.
+        """
+        self.display_name = self.build_name()
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+
+        try:
+            if self.rfid == getattr(self, "_saved_rfid", None):
+                return super(Gear, self).save(*args, **kwargs)
+
+            with transaction.atomic():
+                super(Gear, self).save(*args, **kwargs)
+                RfidRegistry.objects.register(RfidRegistry.GEAR, self.pk, self.rfid)
+        except Exception:
+            if not self._state.adding:
+                self.version -= 1
+            raise
+        rfid_cache.discard(getattr(self, "_saved_rfid", None))
+        self._saved_rfid = self.rfid
+
+    def _do_update(self, base_qs, using, pk_val, values, update_fields, forced_update):
+        """Only overwrite the row if it is still at the version that this copy of the gear was read at"""
+        updated = base_qs.filter(pk=pk_val, version=self.version - 1)._update(values) > 0
+        if not updated and base_qs.filter(pk=pk_val).exists():
+            msg = f"The {self.name} was changed by someone else in the meantime, please try again"
+            raise GearConflict(msg)
+        return updated
 
     def get_department(self):
         return self.geartype.department
 
     get_department.short_description = "Department"
 
+    def get_missing_cert_mask(self, member):
+        """Get the bitmask of the certifications the member is missing to rent this gear, zero if they have them all"""
+        return required_certs_cache.get(self.geartype_id) & ~member.get_cert_mask()
+
     def is_available(self):
         """Returns True if the gear is available for renting"""
         return self.status == 0
@@ -394,3 +638,164 @@ class Gear(models.Model):
             return True
         else:
             return False
+
+
+class GearAttributeManager(models.Manager):
+    def index_gear(self, gear):
+        """
+        Replace the indexed attributes of the piece of gear with the values currently in its gear data
+
+        NOTE: THIS SHOULD ALWAYS BE CALLED THROUGH A TRANSACTION!
+        """
+        gear_data = gear.get_gear_data()
+        attributes = [
+            GearAttribute.from_value(gear, field, gear_data.get(name))
+            for name, field in gear.geartype.get_data_fields().items()
+            if gear_data.get(name) is not None
+        ]
+        self.filter(gear=gear).delete()
+        self.bulk_create(attributes)
+
+    def rebuild(self, queryset=None, batch_size=500):
+        """
+        Rebuild the whole index (or that of the gear in the queryset) from the gear data
+
+        :return: the number of attributes indexed
+        """
+        if queryset is None:
+            queryset = Gear.objects.all()
+
+        self.filter(gear__in=queryset).delete()
+        attributes = []
+        for gear in queryset.select_related("geartype").iterator():
+            gear_data = gear.get_gear_data()
+            for name, field in gear.geartype.get_data_fields().items():
+                if gear_data.get(name) is not None:
+                    attributes.append(GearAttribute.from_value(gear, field, gear_data[name]))
+        self.bulk_create(attributes, batch_size=batch_size)
+        return len(attributes)
+
+
+class GearAttribute(models.Model):
+    """
+    The value of one custom data field of a piece of gear, stored in a column of the appropriate type
+
+    This duplicates Gear.gear_data into a form that the database can index, so that questions like "which 160-170cm
+    skis are in stock" can be answered without loading every piece of gear. Use Gear.objects.with_attr() to query it.
+    """
+
+    objects = GearAttributeManager()
+
+    class Meta:
+        unique_together = ("gear", "field")
+        indexes = [
+            models.Index(fields=["field", "int_value"], name="core_gearattr_int_idx"),
+            models.Index(fields=["field", "float_value"], name="core_gearattr_float_idx"),
+            models.Index(fields=["field", "str_value"], name="core_gearattr_str_idx"),
+        ]
+
+    gear = models.ForeignKey(Gear, on_delete=models.CASCADE, related_name="attributes")
+    field = models.ForeignKey(CustomDataField, on_delete=models.CASCADE)
+
+    #: Only the column matching CustomDataField.attribute_column is filled in, booleans are stored as 0 or 1
+    int_value = models.BigIntegerField(null=True, blank=True)
+    float_value = models.FloatField(null=True, blank=True)
+    str_value = models.CharField(max_length=ATTRIBUTE_STRING_LENGTH, null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.field.name} of {self.gear}"
+
+    @classmethod
+    def from_value(cls, gear, field, value):
+        """Build (but don't save) the attribute holding the value of the field, in the column matching its type"""
+        column = field.attribute_column
+        if column == "int_value":
+            value = int(value)
+        elif column == "float_value":
+            value = float(value)
+        else:
+            value = str(value)[:ATTRIBUTE_STRING_LENGTH]
+        return cls(gear=gear, field=field, **{column: value})
+
+
+@receiver(post_delete, sender=Gear)
+def unregister_gear_rfid(sender, instance, **kwargs):
+    RfidRegistry.objects.unregister(RfidRegistry.GEAR, instance.pk)
+    rfid_cache.discard(instance.rfid)
+
+
+@receiver(post_save, sender=CustomDataField)
+@receiver(post_delete, sender=CustomDataField)
+@receiver(post_save, sender=GearType)
+@receiver(post_delete, sender=GearType)
+def invalidate_gear_schema(sender, **kwargs):
+    """Any change to a data field or gear type could change the schema of some gear type, so reload all of them"""
+    gear_schema_cache.invalidate()
+
+
+@receiver(post_save, sender=CustomDataField)
+def update_field_gear_names(sender, instance, created, **kwargs):
+    """A changed data field (i.e. a new suffix) changes the names of all gear whose gear type uses it"""
+    if not created:
+        Gear.objects.update_display_names(
+            Gear.objects.filter(geartype__data_fields=instance)
+        )
+
+
+@receiver(post_save, sender=GearType)
+def update_geartype_gear_names(sender, instance, created, **kwargs):
+    """Renaming a gear type renames all the gear of that type"""
+    if not created:
+        Gear.objects.update_display_names(Gear.objects.filter(geartype=instance))
+
+
+@receiver(m2m_changed, sender=GearType.data_fields.through)
+def invalidate_gear_schema_fields(sender, instance, action, reverse, pk_set, **kwargs):
+    """Reload the schemas and the affected gear names when data fields are added to or removed from a gear type"""
+    if action in ("post_add", "post_remove", "post_clear"):
+        gear_schema_cache.invalidate()
+
+        # When changed from the data field side, pk_set holds the changed gear types (but is empty for a clear)
+        if not reverse:
+            affected = Gear.objects.filter(geartype=instance)
+        elif pk_set:
+            affected = Gear.objects.filter(geartype__pk__in=pk_set)
+        else:
+            affected = Gear.objects.all()
+        Gear.objects.update_display_names(affected)
+
+
+@receiver(m2m_changed, sender=GearType.data_fields.through)
+def remove_gear_attributes_fields(sender, instance, action, reverse, pk_set, **kwargs):
+    """Forget the indexed values of data fields that were removed from a gear type"""
+    if action in ("post_remove", "post_clear"):
+        if not reverse:
+            removed = GearAttribute.objects.filter(gear__geartype=instance)
+            if pk_set:
+                removed = removed.filter(field__pk__in=pk_set)
+        else:
+            removed = GearAttribute.objects.filter(field=instance)
+            if pk_set:
+                removed = removed.filter(gear__geartype__pk__in=pk_set)
+        removed.delete()
+
+
+@receiver(m2m_changed, sender=GearType.min_required_certs.through)
+def invalidate_required_certs(sender, action, **kwargs):
+    """Reload the required certification masks when certifications are added to or removed from a gear type"""
+    if action in ("post_add", "post_remove", "post_clear"):
+        required_certs_cache.invalidate()
+
+
+@receiver(post_delete, sender=Certification)
+@receiver(post_delete, sender=GearType)
+def invalidate_required_certs_deleted(sender, **kwargs):
+    """Deleting either side removes its links, without sending m2m_changed"""
+    required_certs_cache.invalidate()
+
+
+@receiver(post_save, sender=GearType)
+def invalidate_required_certs_created(sender, instance, created, **kwargs):
+    """A new gear type may reuse the pk of one that was deleted or rolled back, so don't trust a mask cached for it"""
+    if created:
+        required_certs_cache.invalidate()
@@ -0,0 +1,50 @@
+from django.db import models, transaction
+from django.utils.timezone import now
+
+#: How many emails to write or delete per query
+BATCH_SIZE = 500
+
+
+class ListservSubscriberManager(models.Manager):
+    def diff(self, emails):
+        """
+        What has to change on the listserv for it to have exactly the given emails, going by the last pushed emails
+
+        :return: the sets of emails to add to and to remove from the listserv, as (adds, removes)
+        """
+        emails = set(emails)
+        pushed = set(self.values_list("email", flat=True))
+        return emails - pushed, pushed - emails
+
+    def record_added(self, emails):
+        """Remember that the emails were pushed to the listserv"""
+        self.bulk_create([self.model(email=email) for email in emails], batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+    def record_removed(self, emails):
+        """Remember that the emails were taken off the listserv"""
+        emails = list(emails)
+        for start in range(0, len(emails), BATCH_SIZE):
+            self.filter(email__in=emails[start : start + BATCH_SIZE]).delete()
+
+    def record_replaced(self, emails):
+        """Remember that the emails replaced everyone that was on the listserv"""
+        with transaction.atomic():
+            self.all().delete()
+            self.record_added(emails)
+
+
+class ListservSubscriber(models.Model):
+    """
+    An email that was pushed to the listserv, together these are the last known state of the listserv
+
+    Comparing the emails of the active members to these gives the few emails that have to be added or removed, so that
+    only those have to be sent to the listserv instead of the whole list every time.
+    """
+
+    objects = ListservSubscriberManager()
+
+    email = models.EmailField(unique=True)
+    pushed_at = models.DateTimeField(default=now)
+
+    def __str__(self):
+        return self.email
@@ -7,16 +7,21 @@ from django.contrib.auth.models import (
     PermissionsMixin,
 )
 from django.core.mail import send_mail
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, Value, When
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
 from django.urls import reverse
-from django.utils.timezone import datetime, now, timedelta
+from django.utils.timezone import datetime, localdate, now, timedelta
 from uwccsystem import settings
 from phonenumber_field.modelfields import PhoneNumberField
-from core.convinience import get_email_template
 
-from .CertificationModels import Certification
+from .CacheModels import VersionedCache
+from .CertificationModels import Certification, cert_mask
+from .EmailModels import OutboundEmail
 from .fields.RFIDField import RFIDField
-from core import emailing
+from .RfidModels import RfidRegistry, rfid_cache
+from core import email_templates, emailing
 
 
 def get_profile_pic_upload_location(instance, filename):
@@ -33,7 +38,122 @@ def get_profile_pic_upload_location(instance, filename):
     return location
 
 
-class MemberManager(BaseUserManager):
+def load_group_permissions(group_name):
+    """Load the permissions of the group, as the "app_label.codename" strings that has_perm expects"""
+    permissions = Permission.objects.filter(group__name=group_name).values_list("content_type__app_label", "codename")
+    return frozenset(f"{app_label}.{codename}" for app_label, codename in permissions)
+
+
+#: Process-wide matrix of the permissions of each group, keyed by group name. Invalidated by the signals at the bottom
+group_permissions_cache = VersionedCache("group_permissions", load_group_permissions)
+
+
+def build_permission_matrix():
+    """
+    Load the permissions of all the groups in a single query, replacing the permission matrix of every process
+
+    :return: dict of {group name: frozenset of permission names}
+    """
+    group_permissions_cache.invalidate()
+
+    matrix = {name: set() for name in Group.objects.values_list("name", flat=True)}
+    links = Group.permissions.through.objects.values_list(
+        "group__name", "permission__content_type__app_label", "permission__codename"
+    )
+    for group_name, app_label, codename in links:
+        matrix[group_name].add(f"{app_label}.{codename}")
+
+    matrix = {name: frozenset(permissions) for name, permissions in matrix.items()}
+    group_permissions_cache.update(matrix)
+    return matrix
+
+
+#: The groups whose members are excursion staffers
+STAFFER_GROUPS = ["Staff", "Board", "Admin"]
+
+#: The groups whose members lose their membership once it expires (staffers memberships never expire)
+EXPIRING_GROUPS = ["Member", "Just Joined"]
+
+#: How long before their membership expires members are warned about it
+EXPIRY_WARNING_TIME = timedelta(days=7)
+
+#: The number of members changed by each query of the bulk operations, to stay below the query parameter limits
+BULK_BATCH_SIZE = 500
+
+
+def in_batches(items, batch_size=BULK_BATCH_SIZE):
+    """Split the list into consecutive batches of at most batch_size items"""
+    return (items[start:start + batch_size] for start in range(0, len(items), batch_size))
+
+
+class MemberQuerySet(models.QuerySet):
+    def with_permission(self, permission_name):
+        """
+        Filter the members down to those who have the permission, exactly like has_permission would
+
+        The groups that have the permission are found in a subquery, so this is a single query however many members
+        there are, and the permissions of each member never have to be evaluated in python.
+        """
+        app_label, codename = permission_name.split(".", 1)
+        groups = Group.objects.filter(
+            permissions__content_type__app_label=app_label, permissions__codename=codename
+        ).values("name")
+        return self.filter(models.Q(is_superuser=True) | models.Q(group__in=groups), is_active=True)
+
+    def active(self):
+        """Members with a valid membership (see Member.is_active_member)"""
+        return self.with_permission("core.is_active_member")
+
+    def can_rent(self):
+        """Members who are allowed to check out gear"""
+        return self.with_permission("core.rent_gear")
+
+    def staffers(self):
+        """Members who are excursion staffers (see Member.is_staffer)"""
+        return self.filter(group__in=STAFFER_GROUPS)
+
+    def move_to_group(self, group_name):
+        """
+        Move all the members to the group at once, exactly like Member.move_to_group does for a single member
+
+        :return: the number of members moved
+        """
+        group = Group.objects.get(name=group_name)
+        links = self.model.groups.through
+        member_pks = list(self.values_list("pk", flat=True))
+        with transaction.atomic():
+            for batch in in_batches(member_pks):
+                links.objects.filter(member_id__in=batch).delete()
+                links.objects.bulk_create(links(member_id=member_pk, group_id=group.pk) for member_pk in batch)
+                self.model.objects.filter(pk__in=batch).update(group=group.name)
+        return len(member_pks)
+
+    def renew(self, duration, group_name="Just Joined"):
+        """
+        Extend the membership of all the members at once, exactly like Member.extend_membership does for a single member
+
+        Memberships that already expired run for the given duration from today, all others are extended by it.
+
+        :param duration: timedelta, the length of the renewed membership
+        :param group_name: the group to move the renewed members to
+        :return: the number of members renewed
+        """
+        today = localdate()
+        member_pks = list(self.values_list("pk", flat=True))
+        with transaction.atomic():
+            for batch in in_batches(member_pks):
+                renewed = self.model.objects.filter(pk__in=batch)
+                current_dates = renewed.filter(date_expires__gte=today).values_list("date_expires", flat=True)
+                extensions = [
+                    When(date_expires=date_expires, then=Value(date_expires + duration))
+                    for date_expires in set(current_dates)
+                ]
+                renewed.update(date_expires=Case(*extensions, default=Value(today + duration)))
+                renewed.move_to_group(group_name)
+        return len(member_pks)
+
+
+class MemberManager(BaseUserManager.from_queryset(MemberQuerySet)):
     def create_member(self, email, rfid, membership_duration, password=None):
         """
         Creates and saves a Member with the given email, date of
@@ -58,6 +178,30 @@ class MemberManager(BaseUserManager):
 
         return member
 
+    def expire_all(self, today=None):
+        """
+        Expire all the members whose membership ran out before today, and queue an email to let each of them know
+
+        :return: list of the members that were expired
+        """
+        today = today or localdate()
+        with transaction.atomic():
+            expired = list(self.filter(group__in=EXPIRING_GROUPS, date_expires__lt=today).select_for_update())
+            self.filter(group__in=EXPIRING_GROUPS, date_expires__lt=today).move_to_group("Expired")
+            OutboundEmail.objects.bulk_create(self.model.build_expired_emails(expired))
+        return expired
+
+    def warn_expiring(self, today=None):
+        """
+        Queue an email to all the members whose membership will expire in a week, warning them about it
+
+        :return: list of the members that were warned
+        """
+        today = today or localdate()
+        expiring = list(self.filter(group__in=EXPIRING_GROUPS, date_expires=today + EXPIRY_WARNING_TIME))
+        OutboundEmail.objects.bulk_create(self.model.build_expires_soon_emails(expiring))
+        return expiring
+
     def create_superuser(self, email, rfid, password):
         """
         Creates and saves a superuser with the given email, date of
@@ -101,7 +245,7 @@ class StafferManager(models.Manager):
             staffer.autobiography = None
         staffer.save()
 
-        member.send_new_staff_email(staffer)
+        member.queue_new_staff_email(staffer)
         return staffer
 
 
@@ -145,6 +289,26 @@ class Member(AbstractBaseUser, PermissionsMixin):
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["date_expires"]
 
+    class Meta:
+        indexes = [models.Index(fields=["group", "date_expires"], name="core_member_group_exp_idx")]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        member = super(Member, cls).from_db(db, field_names, values)
+        member._saved_rfid = member.__dict__.get("rfid")
+        return member
+
+    def save(self, *args, **kwargs):
+        """Save the member, registering any change to their rfid in the same database transaction"""
+        if self.rfid == getattr(self, "_saved_rfid", None):
+            return super(Member, self).save(*args, **kwargs)
+
+        with transaction.atomic():
+            super(Member, self).save(*args, **kwargs)
+            RfidRegistry.objects.register(RfidRegistry.MEMBER, self.pk, self.rfid)
+        rfid_cache.discard(getattr(self, "_saved_rfid", None))
+        self._saved_rfid = self.rfid
+
     @property
     def is_active_member(self):
         """Return true if the member has a valid membership"""
@@ -160,7 +324,7 @@ class Member(AbstractBaseUser, PermissionsMixin):
     @property
     def is_staffer(self):
         """Property to check if a member is a excursion staffer or not"""
-        return self.group in ['Staff', 'Board', 'Admin']
+        return self.group in STAFFER_GROUPS
 
     @property
     def edit_profile_url(self):
@@ -198,6 +362,19 @@ class Member(AbstractBaseUser, PermissionsMixin):
     def has_no_certifications(self):
         return len(self.certifications.all()) == 0
 
+    def get_cert_mask(self):
+        """
+        Get the bitmask of all the certifications of this member (see cert_mask)
+
+        The mask is computed once per member instance, and forgotten when the certifications of the member are changed
+        """
+        if getattr(self, "_cert_mask", None) is None:
+            cert_ids = self.certifications.through.objects.filter(member_id=self.pk).values_list(
+                "certification_id", flat=True
+            )
+            self._cert_mask = cert_mask(cert_ids)
+        return self._cert_mask
+
     def __str__(self):
         """
         If we know the name of the user, then display their name, otherwise use their email
@@ -261,59 +438,112 @@ class Member(AbstractBaseUser, PermissionsMixin):
             receiver_names=[self.get_full_name()]
         )
 
-    def send_intro_email(self, finish_signup_url):
-        """Send the introduction email with the link to finish signing up to the member"""
+    def queue_intro_email(self, finish_signup_url):
+        """Queue the introduction email with the link to finish signing up to the member"""
         title = "Finish Signing Up"
-        template = get_email_template('intro_email')
-        body = template.format(finish_signup_url=finish_signup_url)
-        self.send_membership_email(title, body)
+        body = email_templates.render('intro_email', finish_signup_url=finish_signup_url)
+        return self.queue_membership_email(title, body)
+
+    def build_membership_email(self, title, body):
+        """Make an email to the member from the membership email, ready to be queued"""
+        return OutboundEmail.objects.build(
+            self.email,
+            title,
+            body,
+            from_email=settings.MEMBERSHIP_EMAIL_HOST_USER,
+            from_name='UWCC Membership',
+            to_name=self.get_full_name(),
+        )
+
+    def queue_membership_email(self, title, body):
+        """Queue an email to the member from the membership email, to be sent by the email worker"""
+        email = self.build_membership_email(title, body)
+        email.save()
+        return email
+
+    @staticmethod
+    def build_expires_soon_emails(members):
+        """Make the emails warning each of the members that their membership will soon expire, in one batch"""
+        title = "Climbing Club Membership Expiring Soon!"
+        bodies = email_templates.render_many('expire_soon_email', (
+            {"member_name": member.get_full_name(), "expiration_date": member.date_expires} for member in members
+        ))
+        return [member.build_membership_email(title, body) for member, body in zip(members, bodies)]
+
+    @staticmethod
+    def build_expired_emails(members):
+        """Make the emails letting each of the members know that their membership has expired, in one batch"""
+        title = "Climbing Club Membership Expired!"
+        bodies = email_templates.render_many('expired_email', (
+            {"member_name": member.get_full_name(), "today": member.date_expires} for member in members
+        ))
+        return [member.build_membership_email(title, body) for member, body in zip(members, bodies)]
+
+    @staticmethod
+    def build_missing_gear_emails(members_gear):
+        """
+        Make the emails listing the overdue gear of each member, in one batch
+
+        :param members_gear: list of (member, list of their overdue gear) pairs
+        """
+        title = 'Gear Overdue'
+        bodies = email_templates.render_many('missing_gear', (
+            {"first_name": member.first_name, "all_gear": all_gear} for member, all_gear in members_gear
+        ))
+        return [
+            OutboundEmail.objects.build(member.email, title, body, 'info@excursionclubucsb.org',
+                                        to_name=member.get_full_name())
+            for (member, _), body in zip(members_gear, bodies)
+        ]
+
+    def build_expires_soon_email(self):
+        """Make the email warning the member that their membership will soon expire"""
+        return self.build_expires_soon_emails([self])[0]
+
+    def build_expired_email(self):
+        """Make the email letting the member know that their membership has expired"""
+        return self.build_expired_emails([self])[0]
 
     def send_expires_soon_email(self):
         """Send an email warning the member that their membership will soon expire"""
-        title = "Climbing Club Membership Expiring Soon!"
-        template = get_email_template('expire_soon_email')
-        body = template.format(member_name=self.get_full_name(), expiration_date=self.date_expires)
-        self.send_membership_email(title, body)
+        email = self.build_expires_soon_email()
+        self.send_membership_email(email.subject, email.body)
 
     def send_expired_email(self):
         """Send an email warning the member that their membership will soon expire"""
-        title = "Climbing Club Membership Expired!"
-        template = get_email_template('expired_email')
-        body = template.format(member_name=self.get_full_name(), today=self.date_expires)
-        self.send_membership_email(title, body)
-
-    def send_missing_gear_email(self, all_gear):
-        """Send an email to member that they have gear to return"""
-        gear_rows = []
-        for gear in all_gear:
-            gear_rows.append(f"<tr><td>{gear.name}</td><td>{gear.due_date.strftime('%a, %b %d, %Y')}</td></tr>")
-        template = get_email_template('missing_gear')
-        body = template.format(first_name=self.first_name, gear_rows="".join(gear_rows))
-        title = 'Gear Overdue'
-        self.send_email(
-            title,
-            body,
-            'info@excursionclubucsb.org',
-            settings.MEMBERSHIP_EMAIL_HOST_PASSWORD,
-        )
+        email = self.build_expired_email()
+        self.send_membership_email(email.subject, email.body)
 
-    def send_new_staff_email(self, staffer):
-        """Sen an email welcoming the member to staff"""
+    def queue_new_staff_email(self, staffer):
+        """Queue an email welcoming the member to staff"""
         title = "Welcome to staff!"
-        template = get_email_template('new_staffer')
-        body = template.format(
+        body = email_templates.render(
+            'new_staffer',
             member_name=self.first_name,
             finish_url=settings.WEB_BASE+staffer.edit_profile_url,
             staffer_email=staffer.exc_email
         )
-        self.send_membership_email(title, body)
+        return self.queue_membership_email(title, body)
 
     def has_module_perms(self, app_label):
         """This is required by django, determine whether the user is allowed to view the app"""
         return True
 
+    def has_perm(self, perm, obj=None):
+        """
+        Check the permission against the permission matrix entry of the member's group, which takes no queries
+
+        Permissions are only ever given to groups, never to individual members, so the group of the member decides all
+        of their permissions. Object level permissions are still left to the authentication backends.
+        """
+        if obj is not None:
+            return super(Member, self).has_perm(perm, obj)
+        if not self.is_active:
+            return False
+        return self.is_superuser or perm in group_permissions_cache.get(self.group)
+
     def has_permission(self, permission_name):
-        """Loop through all the permissions of the group associated with this member to see if they have this one"""
+        """Check whether the group associated with this member has this permission"""
         return self.has_perm(permission_name)
 
     def move_to_group(self, group_name):
@@ -378,3 +608,31 @@ class Staffer(models.Model):
     @property
     def edit_profile_url(self):
         return reverse("admin:core_staffer_change", kwargs={"object_id": self.pk})
+
+
+@receiver(post_delete, sender=Member)
+def unregister_member_rfid(sender, instance, **kwargs):
+    RfidRegistry.objects.unregister(RfidRegistry.MEMBER, instance.pk)
+    rfid_cache.discard(instance.rfid)
+
+
+@receiver(m2m_changed, sender=Member.certifications.through)
+def forget_cert_mask(sender, instance, action, reverse, **kwargs):
+    """Make the member recompute their certification mask after their certifications change"""
+    if action in ("post_add", "post_remove", "post_clear") and not reverse:
+        instance._cert_mask = None
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def invalidate_group_permissions(sender, action, **kwargs):
+    """Recompute the permission matrix when permissions are added to or removed from a group"""
+    if action in ("post_add", "post_remove", "post_clear"):
+        group_permissions_cache.invalidate()
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def invalidate_group_permissions_changed(sender, **kwargs):
+    """Renaming a group moves its row in the matrix, and deletions remove links without sending m2m_changed"""
+    group_permissions_cache.invalidate()
@@ -0,0 +1,155 @@
+import threading
+from collections import OrderedDict
+
+from django.apps import apps
+from django.db import models
+
+from .fields.RFIDField import RFIDField
+
+
+class RfidRegistryManager(models.Manager):
+    def is_in_use(self, rfid):
+        """Check whether the rfid already belongs to anything in the system"""
+        return self.filter(rfid=rfid).exists()
+
+    def register(self, kind, object_pk, rfid):
+        """
+        Record that the object of the given kind now uses the rfid, replacing any rfid it used before
+
+        If the rfid already belongs to something else this raises an IntegrityError, so call it in the same database
+        transaction as the save of the object to make sure that the save is rolled back as well.
+        """
+        existing = self.filter(kind=kind, object_pk=object_pk)
+        if not rfid:
+            existing.delete()
+        elif not existing.update(rfid=rfid):
+            self.create(kind=kind, object_pk=object_pk, rfid=rfid)
+
+    def unregister(self, kind, object_pk):
+        """Free up the rfid used by the object"""
+        self.filter(kind=kind, object_pk=object_pk).delete()
+
+    def rebuild(self):
+        """
+        Rebuild the whole registry from the rfids stored on members and gear
+
+        :return: the number of rfids registered
+        """
+        from .GearModels import Gear
+        from .MemberModels import Member
+
+        self.all().delete()
+        entries = [
+            self.model(kind=RfidRegistry.MEMBER, object_pk=pk, rfid=rfid)
+            for pk, rfid in Member.objects.exclude(rfid="").values_list("pk", "rfid")
+        ]
+        entries += [
+            self.model(kind=RfidRegistry.GEAR, object_pk=pk, rfid=rfid)
+            for pk, rfid in Gear.objects.exclude(rfid="").values_list("pk", "rfid")
+        ]
+        self.bulk_create(entries, batch_size=500)
+        return len(entries)
+
+
+class RfidRegistry(models.Model):
+    """
+    Every rfid in use in the system, along with the kind and pk of the object that it belongs to
+
+    The rfid column is unique, which guarantees that no rfid can ever be used by two things at once (i.e. by a member and
+    a piece of gear), and makes checking whether an rfid is taken a single indexed lookup. The registry is kept up to
+    date by Member.save and Gear.save, rebuild it with the rebuild_rfid_registry task if it ever gets out of step.
+    """
+
+    MEMBER = "member"
+    GEAR = "gear"
+    kinds = ((MEMBER, "Member"), (GEAR, "Gear"))
+
+    objects = RfidRegistryManager()
+
+    class Meta:
+        verbose_name_plural = "RFID Registry"
+        unique_together = ("kind", "object_pk")
+
+    rfid = RFIDField(verbose_name="RFID")
+    kind = models.CharField(max_length=10, choices=kinds)
+    object_pk = models.BigIntegerField()
+
+    def __str__(self):
+        return f"{self.rfid} ({self.kind})"
+
+
+class RfidCache:
+    """
+    A bounded, least recently used map of rfid -> (kind, pk), local to this process
+
+    Entries are not trusted blindly: resolve_rfid checks that the object found still has the rfid, so an entry made stale
+    by a change in another process just costs a fresh lookup in the registry.
+    """
+
+    def __init__(self, max_size=2048):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, rfid):
+        with self.lock:
+            entry = self.entries.get(rfid)
+            if entry is not None:
+                self.entries.move_to_end(rfid)
+            return entry
+
+    def set(self, rfid, entry):
+        with self.lock:
+            self.entries[rfid] = entry
+            self.entries.move_to_end(rfid)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def discard(self, rfid):
+        with self.lock:
+            self.entries.pop(rfid, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+#: The rfids resolved by this process. Entries are discarded on retag, member rfid changes and gear removal
+rfid_cache = RfidCache()
+
+
+def get_rfid_owner(kind, object_pk):
+    """Get the member or gear with the given pk, or None if it no longer exists"""
+    if kind == RfidRegistry.GEAR:
+        queryset = apps.get_model("core", "Gear").objects.select_related("geartype")
+    else:
+        queryset = apps.get_model("core", "Member").objects.all()
+    return queryset.filter(pk=object_pk).first()
+
+
+def resolve_rfid(rfid):
+    """
+    Find what a scanned rfid belongs to
+
+    Once an rfid has been seen by this process, resolving it again takes a single query by primary key.
+
+    :param rfid: string, the rfid to resolve
+    :return: (kind, object) where kind is RfidRegistry.MEMBER or RfidRegistry.GEAR, or (None, None) if the rfid is not
+        in use
+    """
+    cached = rfid_cache.get(rfid)
+    if cached is not None:
+        owner = get_rfid_owner(*cached)
+        if owner is not None and owner.rfid == rfid:
+            return cached[0], owner
+        rfid_cache.discard(rfid)
+
+    entry = RfidRegistry.objects.filter(rfid=rfid).values_list("kind", "object_pk").first()
+    if entry is None:
+        return None, None
+
+    owner = get_rfid_owner(*entry)
+    if owner is None:
+        return None, None
+    rfid_cache.set(rfid, entry)
+    return entry[0], owner
@@ -0,0 +1,168 @@
+import re
+from collections import namedtuple
+
+from django.db import models
+from django.utils.timezone import now, timedelta
+
+from .fields.JSONField import JSONField
+from .GearModels import Gear
+from .TransactionModels import ArchivedTransaction, Transaction
+
+#: Snapshots are taken this far in the past, so that transactions that are still being committed are not left out
+SNAPSHOT_MARGIN = timedelta(minutes=5)
+
+#: The number of transactions read from the database at once while replaying
+REPLAY_CHUNK_SIZE = 10_000
+
+#: The status that each type of transaction leaves the gear in, when it is the only thing the transaction changes
+STATUS_AFTER = {"Fix": 0, "Inventory": 0, "Break": 2, "Missing": 3, "Dormant": 4, "Expire": 4}
+
+#: The changes an admin override makes that affect the state of the gear, as described in the transaction comments.
+#: Every change starts a line or follows the ";" that ends the change before it, and the values written in the comments
+#: never hold either, so text within the value of a gear data field is never taken for one. Changes of gear data fields
+#: are written as "Changed data <field> ...", so neither is a gear data field that is named like one of these
+OVERRIDE_STATUS = re.compile(r"[\n;]\s*Changed status from \S+ to (\d+);")
+OVERRIDE_DUE_DATE = re.compile(r"[\n;]\s*Changed due_date from \S+ to (\S+);")
+OVERRIDE_CHECKED_OUT_TO = re.compile(r"[\n;]\s*Changed checked_out_to from ")
+
+#: The state of a piece of gear: its status, the pk of the member it is checked out to and its due date (as ISO date)
+GearState = namedtuple("GearState", ["status", "checked_out_to", "due_date"])
+
+#: A piece of gear whose replayed state differs from its actual state, either of which is None if it is not known
+Drift = namedtuple("Drift", ["gear_pk", "replayed", "actual"])
+
+
+def replay(state, transactions):
+    """
+    Apply the transactions to the state of the gear, in the order they are given
+
+    This is the inverse of the TransactionManager functions: each of them changes the gear and records a transaction,
+    while this reads the transaction and makes the same change again. Keep the two in step!
+
+    :param state: dict of {gear pk: GearState}, which is updated in place
+    :param transactions: iterable of (gear pk, type, member pk, comments) tuples, oldest first
+    :return: the number of transactions replayed
+    """
+    replayed = 0
+    for replayed, (gear_pk, kind, member_pk, comments) in enumerate(transactions, start=1):
+        if kind == "CheckOut":
+            # The comment is always "Return date = YYYY-MM-DD"
+            state[gear_pk] = GearState(1, member_pk, comments[-10:])
+        elif kind in ("CheckIn", "Create"):
+            state[gear_pk] = GearState(0, None, None)
+        elif kind in STATUS_AFTER:
+            old = state.get(gear_pk) or GearState(None, None, None)
+            state[gear_pk] = old._replace(status=STATUS_AFTER[kind])
+        elif kind == "Delete":
+            old = state.get(gear_pk) or GearState(None, None, None)
+            state[gear_pk] = old._replace(status=5, checked_out_to=None)
+        elif kind == "Override":
+            state[gear_pk] = replay_override(state.get(gear_pk) or GearState(None, None, None), member_pk, comments)
+    return replayed
+
+
+def replay_override(old, member_pk, comments):
+    """Work out the state of the gear after an admin override from the changes listed in its comments"""
+    new = old
+    status = OVERRIDE_STATUS.search(comments)
+    if status:
+        new = new._replace(status=int(status.group(1)))
+    due_date = OVERRIDE_DUE_DATE.search(comments)
+    if due_date:
+        new = new._replace(due_date=None if due_date.group(1) == "None" else due_date.group(1))
+    if OVERRIDE_CHECKED_OUT_TO.search(comments):
+        # Overrides that change who has the gear record the new holder as the member of the transaction
+        new = new._replace(checked_out_to=member_pk)
+    return new
+
+
+class GearSnapshotManager(models.Manager):
+    def nearest(self, at):
+        """Get the latest snapshot taken at or before the given time, or None if there is none"""
+        return self.filter(taken_at__lte=at).order_by("-taken_at").first()
+
+    def state_at(self, at=None):
+        """
+        Work out the state of every piece of gear at the given time, by replaying the transactions
+
+        Only the transactions made since the nearest snapshot before that time are replayed, on top of the state that
+        was recorded in the snapshot. Gear with no transactions before that time is left out.
+
+        :param at: the time to get the state at, defaults to now
+        :return: dict of {gear pk: GearState}
+        """
+        at = at or now()
+        snapshot = self.nearest(at)
+        state = {} if snapshot is None else snapshot.get_state()
+
+        # All archived transactions are older than the current ones, so they are replayed first
+        for model in (ArchivedTransaction, Transaction):
+            transactions = model.objects.filter(timestamp__lte=at)
+            if snapshot is not None:
+                transactions = transactions.filter(timestamp__gt=snapshot.taken_at)
+            transactions = transactions.order_by("timestamp", "primary_key").values_list(
+                "gear_id", "type", "member_id", "comments"
+            )
+            replay(state, transactions.iterator(chunk_size=REPLAY_CHUNK_SIZE))
+        return state
+
+    def take(self, at=None):
+        """
+        Record the state of all gear at the given time, so that later replays can start from there
+
+        :param at: the time to take the snapshot at, defaults to a few minutes ago
+        :return: GearSnapshot
+        """
+        at = at or now() - SNAPSHOT_MARGIN
+        state = self.state_at(at)
+        snapshot, _ = self.update_or_create(
+            taken_at=at, defaults={"state": {str(pk): list(gear_state) for pk, gear_state in state.items()}}
+        )
+        return snapshot
+
+    def find_drift(self):
+        """
+        Compare the state of all gear replayed from the transactions with the actual state of the gear
+
+        Any difference means that the gear was changed without a transaction (or that the transactions are wrong), which
+        would make the transaction log useless for audits.
+
+        :return: list of Drift, sorted by the gear pk
+        """
+        actual = {
+            pk: GearState(status, member_pk, due_date.isoformat() if due_date else None)
+            for pk, status, member_pk, due_date in Gear.objects.values_list(
+                "pk", "status", "checked_out_to_id", "due_date"
+            )
+        }
+        replayed = self.state_at()
+
+        drift = []
+        for pk in sorted(actual.keys() | replayed.keys()):
+            if actual.get(pk) != replayed.get(pk):
+                drift.append(Drift(pk, replayed.get(pk), actual.get(pk)))
+        return drift
+
+
+class GearSnapshot(models.Model):
+    """
+    The state of every piece of gear at some point in time, as replayed from the transactions
+
+    Snapshots are only a shortcut for replaying the transactions: finding the state of the gear at any time only needs
+    the transactions made since the snapshot before that time. Take one every night with the take_gear_snapshot task.
+    """
+
+    objects = GearSnapshotManager()
+
+    #: The time of the state recorded in the snapshot, it includes all transactions made up to and at this time
+    taken_at = models.DateTimeField(unique=True)
+
+    #: The state of each piece of gear, as {gear pk: [status, checked out to member pk, due date]}
+    state = JSONField()
+
+    def __str__(self):
+        return f"Gear snapshot at {self.taken_at}"
+
+    def get_state(self):
+        """Get the recorded state as a dict of {gear pk: GearState}"""
+        return {int(pk): GearState(*gear_state) for pk, gear_state in self.state.items()}
@@ -0,0 +1,178 @@
+import functools
+import logging
+import threading
+import traceback
+import zlib
+from contextlib import contextmanager
+
+from django.db import connection, models
+from django.utils.timezone import now, timedelta
+
+logger = logging.getLogger(__name__)
+
+#: A run that has not finished after this long is assumed to have died, and no longer keeps other runs from starting
+STALE_RUN_TIME = timedelta(hours=6)
+
+#: How far back the admin chart of the task run times goes
+CHART_DAYS = 90
+
+_current = threading.local()
+
+
+def record_progress(examined=0, changed=0, emails_queued=0):
+    """Add to the counts of the task run that is going on in this thread (if any), call this from within a task"""
+    run = getattr(_current, "run", None)
+    if run is not None:
+        run.rows_examined += examined
+        run.rows_changed += changed
+        run.emails_queued += emails_queued
+
+
+def lock_key(name):
+    """The key of the database advisory lock held while the named task runs"""
+    return zlib.crc32(f"task:{name}".encode())
+
+
+class TaskRunQuerySet(models.QuerySet):
+    def chart_data(self, days=CHART_DAYS):
+        """The run times of the finished runs of the last days, as {task name: [[started at, seconds], ...]}"""
+        runs = self.filter(started_at__gte=now() - timedelta(days=days), finished_at__isnull=False)
+        data = {}
+        for name, started_at, finished_at in runs.order_by("started_at").values_list(
+            "name", "started_at", "finished_at"
+        ):
+            data.setdefault(name, []).append([started_at.isoformat(), (finished_at - started_at).total_seconds()])
+        return data
+
+
+class TaskRunManager(models.Manager.from_queryset(TaskRunQuerySet)):
+    @contextmanager
+    def __lock(self, name):
+        """
+        Hold the lock of the named task, yielding whether it could be taken (without waiting for it)
+
+        On Postgres this is a session advisory lock, which the database lets go of by itself if the process dies. Other
+        databases (i.e. SQLite in development) have no such locks, so there a recent unfinished run counts as the lock.
+        """
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_key(name)])
+                locked = cursor.fetchone()[0]
+            try:
+                yield locked
+            finally:
+                if locked:
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_key(name)])
+        else:
+            yield not self.filter(
+                name=name, status=TaskRun.RUNNING, started_at__gte=now() - STALE_RUN_TIME
+            ).exists()
+
+    def run(self, name, func, *args, **kwargs):
+        """
+        Run the task, recording how it went, unless another run of it is going on right now
+
+        :return: whatever the task returns, or None if the run was skipped
+        """
+        with self.__lock(name) as locked:
+            if not locked:
+                logger.warning(f"Skipped {name}, another run of it is still going")
+                self.create(name=name, status=TaskRun.SKIPPED, finished_at=now())
+                return None
+
+            run = self.create(name=name)
+            outer, _current.run = getattr(_current, "run", None), run
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                run.status = TaskRun.FAILED
+                run.error = traceback.format_exc()
+                raise
+            else:
+                run.status = TaskRun.SUCCEEDED
+                return result
+            finally:
+                _current.run = outer
+                run.finished_at = now()
+                run.save()
+
+
+def tracked_task(func):
+    """Record every run of the decorated task as a TaskRun, and skip it while another run of it is still going"""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return TaskRun.objects.run(func.__name__, func, *args, **kwargs)
+
+    return wrapper
+
+
+class TaskRun(models.Model):
+    """A single run of one of the scheduled tasks, with how long it took and how much it did"""
+
+    objects = TaskRunManager()
+
+    RUNNING = 0
+    SUCCEEDED = 1
+    FAILED = 2
+    SKIPPED = 3
+    status_choices = [
+        (RUNNING, "Running"),
+        (SUCCEEDED, "Succeeded"),
+        (FAILED, "Failed"),
+        (SKIPPED, "Skipped"),
+    ]
+
+    name = models.CharField(max_length=50)
+    status = models.IntegerField(choices=status_choices, default=RUNNING)
+    started_at = models.DateTimeField(default=now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    rows_examined = models.IntegerField(default=0)
+    rows_changed = models.IntegerField(default=0)
+    emails_queued = models.IntegerField(default=0)
+
+    #: The traceback of the exception the run failed with
+    error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["name", "started_at"], name="core_taskrun_name_idx"),
+            models.Index(fields=["started_at"], name="core_taskrun_started_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name} at {self.started_at}"
+
+    @property
+    def duration(self):
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+
+class TaskWatermarkManager(models.Manager):
+    def get_value(self, name):
+        """How far the named task got the last time it ran, None if it never ran"""
+        return self.filter(name=name).values_list("value", flat=True).first()
+
+    def advance(self, name, value):
+        """Remember how far the named task got, so that its next run can carry on from there"""
+        self.update_or_create(name=name, defaults={"value": value})
+
+
+class TaskWatermark(models.Model):
+    """
+    How far an incremental task has got through its input (i.e. the time expire_gear last started)
+
+    The next run of the task only has to look at what changed since then, instead of at everything all over again.
+    """
+
+    objects = TaskWatermarkManager()
+
+    name = models.CharField(max_length=50, unique=True)
+    value = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} up to {self.value}"
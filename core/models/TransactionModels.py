@@ -1,17 +1,29 @@
-import json
 import logging
 
 from datetime import date
-from core.convinience import get_all_rfids
-from core.models.fields.PrimaryKeyField import PrimaryKeyField
-from core.models.GearModels import Gear
+from core.models.fields.PrimaryKeyField import PrimaryKeyField, make_ids
+from core.models.CertificationModels import Certification, cert_ids_in
+from core.models.GearModels import Gear, GearAttribute, GearConflict
 from core.models.MemberModels import Member
+from core.models.RfidModels import RfidRegistry, rfid_cache
 from django.core.exceptions import ValidationError
-from django.db import models
+from django.db import models, transaction as db_transaction
+from django.db.models import F, Q, Subquery
 from django.urls import reverse
 
 logger = logging.getLogger(__name__)
 
+#: The number of transactions shown at once in the history of a piece of gear or of a member
+HISTORY_PAGE_SIZE = 25
+
+#: The changes of status that can be made to many pieces of gear at once, as {type: (statuses before, status after)}
+BULK_TRANSITIONS = {"Missing": ((1,), 3), "Dormant": ((2, 3), 4)}
+
+
+def comment_value(value):
+    """Write the value on one line and without the ";" that ends each change, so it reads as part of a single change"""
+    return " ".join(str(value).replace(";", ",").split())
+
 
 def validate_auth(authorizer):
     """Make sure that the person who authorized the transaction is in fact authorized to do so."""
@@ -44,9 +56,17 @@ def validate_available(gear):
         raise ValidationError(msg)
 
 
+def validate_status(gear, allowed_statuses, action):
+    """Ensure that the piece of gear is in one of the statuses that the action can be applied to"""
+    if gear.status not in allowed_statuses:
+        msg = f"The {gear.name} with [{gear.rfid}] can not be {action} because it is {gear.get_status()}"
+        logger.info(msg)
+        raise ValidationError(msg)
+
+
 def validate_rfid(rfid):
     """Ensure that the given rfid is unique across all tables containing rfids."""
-    if rfid in get_all_rfids():
+    if RfidRegistry.objects.is_in_use(rfid):
         msg = "This rfid is already in use!"
         logger.info(msg)
         raise ValidationError(msg)
@@ -54,18 +74,102 @@ def validate_rfid(rfid):
 
 def validate_required_certs(member, gear):
     """Validate that the member has all the certifications required to check out this piece of gear."""
-    missing_certs = []
-    for cert_required in gear.geartype.min_required_certs.all():
-        if cert_required not in member.certifications.all():
-            missing_certs.append(cert_required)
+    missing_certs = gear.get_missing_cert_mask(member)
     if missing_certs:
-        cert_names = [cert.title for cert in missing_certs]
+        missing = Certification.objects.filter(pk__in=cert_ids_in(missing_certs))
+        cert_names = list(missing.values_list("title", flat=True))
         msg = f"{member.get_full_name()} is missing the following certifications: {cert_names}"
         logger.info(msg)
         raise ValidationError(msg)
 
 
-class TransactionManager(models.Manager):
+class TransactionQuerySet(models.QuerySet):
+    def for_gear(self, gear):
+        """All the transactions of the piece of gear"""
+        return self.filter(gear=gear)
+
+    def for_member(self, member):
+        """All the transactions involving the member, either as the member or as the authorizer"""
+        return self.filter(Q(member=member) | Q(authorizer=member))
+
+    def history_page(self, after=None, page_size=HISTORY_PAGE_SIZE):
+        """
+        Get one page of the transactions, newest first
+
+        Pages are found by their position relative to the last transaction of the previous page (a cursor), not by an
+        offset. Using the (gear, timestamp) and (member, timestamp) indexes, every page is then as fast as the first,
+        no matter how long the history is.
+
+        :param after: the pk of the last transaction of the previous page, None for the first page
+        :param page_size: the number of transactions on each page
+        :return: list of transactions, the cursor for the next page (None if this is the last page)
+        """
+        queryset = self.select_related("gear", "member", "authorizer").order_by("-timestamp", "-primary_key")
+        if after is not None:
+            # Transactions made at the same instant are ordered by their pk
+            cursor_time = Subquery(self.model.objects.filter(pk=after).values("timestamp"))
+            queryset = queryset.filter(
+                Q(timestamp__lt=cursor_time) | Q(timestamp=cursor_time, primary_key__lt=after)
+            )
+
+        transactions = list(queryset[: page_size + 1])
+        next_cursor = transactions[page_size - 1].pk if len(transactions) > page_size else None
+        return transactions[:page_size], next_cursor
+
+
+class TransactionHistory:
+    """
+    The transactions of both the Transaction and ArchivedTransaction tables, queried as if they were a single table
+
+    Every archived transaction is older than every current one, so newest first, all the current transactions come
+    before all the archived ones. The archive is therefore only queried once the current transactions run out.
+    """
+
+    def __init__(self, current, archived):
+        self.current = current
+        self.archived = archived
+
+    def filter(self, *args, **kwargs):
+        return TransactionHistory(self.current.filter(*args, **kwargs), self.archived.filter(*args, **kwargs))
+
+    def for_gear(self, gear):
+        return TransactionHistory(self.current.for_gear(gear), self.archived.for_gear(gear))
+
+    def for_member(self, member):
+        return TransactionHistory(self.current.for_member(member), self.archived.for_member(member))
+
+    def count(self):
+        return self.current.count() + self.archived.count()
+
+    def __iter__(self):
+        """Iterate over all the transactions, newest first"""
+        yield from self.current.order_by("-timestamp", "-primary_key").iterator()
+        yield from self.archived.order_by("-timestamp", "-primary_key").iterator()
+
+    def history_page(self, after=None, page_size=HISTORY_PAGE_SIZE):
+        """
+        Get one page of the transactions, newest first, continuing into the archive once the current ones run out
+
+        :param after: the pk of the last transaction of the previous page, None for the first page
+        :param page_size: the number of transactions on each page
+        :return: list of transactions, the cursor for the next page (None if this is the last page)
+        """
+        transactions, next_cursor = self.current.history_page(after, page_size)
+        if next_cursor is not None:
+            return transactions, next_cursor
+        if len(transactions) == page_size:
+            return transactions, transactions[-1].pk if self.archived.exists() else None
+
+        # If nothing current came after the cursor, it is either the last current transaction or an archived one
+        archived_after = None
+        if after is not None and not transactions and self.archived.model.objects.filter(pk=after).exists():
+            archived_after = after
+
+        archived, next_cursor = self.archived.history_page(archived_after, page_size - len(transactions))
+        return transactions + archived, next_cursor
+
+
+class TransactionManager(models.Manager.from_queryset(TransactionQuerySet)):
     """
     Manages Transactions, and ensures their effects are implemented.
 
@@ -74,6 +178,37 @@ class TransactionManager(models.Manager):
     immediately implement the changes described by the transaction.
     """
 
+    def history(self):
+        """All transactions, including the archived ones. Only use this where old transactions are really needed"""
+        return TransactionHistory(self.all(), ArchivedTransaction.objects.all())
+
+    def archive(self, before, batch_size=10_000):
+        """
+        Move all the transactions made before the given time into the archive
+
+        The transactions are moved a batch at a time, each batch in its own database transaction, so that every
+        transaction is always in exactly one of the two tables.
+
+        :param before: the time before which all transactions are archived, should be the start of a year
+        :param batch_size: the number of transactions moved at once
+        :return: the number of transactions archived
+        """
+        field_names = [field.attname for field in self.model._meta.concrete_fields]
+        archived = 0
+        while True:
+            with db_transaction.atomic():
+                batch = list(
+                    self.filter(timestamp__lt=before).order_by("timestamp", "primary_key").values(*field_names)[
+                        :batch_size
+                    ]
+                )
+                if not batch:
+                    return archived
+                ArchivedTransaction.objects.bulk_create(ArchivedTransaction(**values) for values in batch)
+                self.filter(pk__in=[values["primary_key"] for values in batch]).delete()
+            archived += len(batch)
+            logger.info(f"Archived {archived} transactions made before {before}")
+
     def __make_transaction(self, authorizer_rfid, type, gear, member=None, comments=""):
         """
         Make a transaction of any type in a safe and centralized way.
@@ -103,7 +238,25 @@ class TransactionManager(models.Manager):
 
         return transaction
 
-    def make_checkout(self, authorizer_rfid, gear_rfid, member_rfid, return_date):
+    @staticmethod
+    def __lock_gear(gear_rfid, version=None):
+        """
+        Get a piece of gear and lock its row until the end of the current database transaction
+
+        While the row is locked, any other transaction on the same piece of gear waits for this one to finish, and then
+        sees the gear as this one left it. If a version is given, the gear must still be at that version, i.e. it must
+        not have changed since the caller last looked at it.
+
+        NOTE: THIS SHOULD ALWAYS BE CALLED INSIDE A DATABASE TRANSACTION!
+        """
+        gear = Gear.objects.select_for_update(of=("self",)).select_related("geartype").get(rfid=gear_rfid)
+        if version is not None and gear.version != version:
+            msg = f"The {gear.name} was changed by someone else in the meantime, please try again"
+            logger.info(msg)
+            raise GearConflict(msg)
+        return gear
+
+    def make_checkout(self, authorizer_rfid, gear_rfid, member_rfid, return_date, version=None):
         """
         Check out a piece of gear to a member and create a transaction logging the checkout.
 
@@ -115,31 +268,180 @@ class TransactionManager(models.Manager):
         :param member_rfid: string, the 10-digit rfid of the member checking out the gear
         :param authorizer_rfid: string, the 10-digit rfid of entity authorizing the transaction (should be staffer)
         :param return_date: the date by which the gear should be returned
+        :param version: if given, the version of the gear that the checkout was decided on
         :return: transaction
         """
-        # First, get the objects we are concerned with
-        gear = Gear.objects.get(rfid=gear_rfid)
         member = Member.objects.get(rfid=member_rfid)
-
-        # Run all the necessary validations
-        validate_available(gear)
         validate_can_rent(member)
-        validate_required_certs(member, gear)
 
-        # If everything validated, we can try to make the transaction
-        comment = f"Return date = {return_date.date}"
-        transaction = self.__make_transaction(
-            authorizer_rfid, "CheckOut", gear, member=member, comments=comment
-        )
+        with db_transaction.atomic():
+            # Lock the gear, so that no other kiosk can check it out while it is being checked out here
+            gear = self.__lock_gear(gear_rfid, version)
 
-        # If the transaction was validated, then we can actually change the gear status
-        gear.status = 1
-        gear.checked_out_to = member
-        gear.due_date = return_date
-        gear.save()
+            # Run all the necessary validations
+            validate_available(gear)
+            validate_required_certs(member, gear)
+
+            # If everything validated, we can try to make the transaction
+            comment = f"Return date = {return_date}"
+            transaction = self.__make_transaction(
+                authorizer_rfid, "CheckOut", gear, member=member, comments=comment
+            )
+
+            # If the transaction was validated, then we can actually change the gear status
+            gear.status = 1
+            gear.checked_out_to = member
+            gear.due_date = return_date
+            gear.save()
 
         return transaction, gear
 
+    def make_checkout_many(self, authorizer_rfid, member_rfid, gear_rfids, return_date):
+        """
+        Check out a whole batch of gear to one member at once, i.e. all the gear for a trip
+
+        The authorizer and member are validated once for the whole batch, and the gear is locked while it is checked so
+        that no other kiosk can check it out at the same time. All the gear that passed validation is then checked out
+        in a single database transaction, while each piece of gear that failed is reported back with the reason.
+
+        :param authorizer_rfid: string, the 10-digit rfid of entity authorizing the transaction (should be staffer)
+        :param member_rfid: string, the 10-digit rfid of the member checking out the gear
+        :param gear_rfids: list of the 10-digit rfids of all the gear being checked out
+        :param return_date: the date by which the gear should be returned
+        :return: list of the checkout transactions made, dict of {gear_rfid: error message} for all the gear that could
+            not be checked out
+        """
+        authorizer = Member.objects.get(rfid=authorizer_rfid)
+        validate_auth(authorizer)
+        member = Member.objects.get(rfid=member_rfid)
+        validate_can_rent(member)
+
+        # Scanning the same tag twice should not try to check the gear out twice
+        gear_rfids = list(dict.fromkeys(gear_rfids))
+
+        comment = f"Return date = {return_date}"
+        failures = {}
+        with db_transaction.atomic():
+            gear_by_rfid = {
+                gear.rfid: gear
+                for gear in Gear.objects.select_for_update(of=("self",))
+                .select_related("geartype")
+                .filter(rfid__in=gear_rfids)
+            }
+
+            to_check_out = []
+            for rfid in gear_rfids:
+                gear = gear_by_rfid.get(rfid)
+                if gear is None:
+                    failures[rfid] = f"The RFID {rfid} is not registered to a piece of gear"
+                    continue
+
+                missing_certs = gear.get_missing_cert_mask(member)
+                if not gear.is_available():
+                    failures[rfid] = f"The {gear.name} is not available for checkout because it is {gear.get_status()}"
+                elif missing_certs:
+                    cert_names = list(
+                        Certification.objects.filter(pk__in=cert_ids_in(missing_certs)).values_list("title", flat=True)
+                    )
+                    failures[rfid] = f"{member.get_full_name()} is missing the following certifications: {cert_names}"
+                else:
+                    to_check_out.append(gear)
+
+            transactions = self.bulk_create(
+                [
+                    self.model(
+                        primary_key=primary_key,
+                        type="CheckOut",
+                        gear=gear,
+                        member=member,
+                        authorizer=authorizer,
+                        comments=comment,
+                    )
+                    for primary_key, gear in zip(make_ids(len(to_check_out)), to_check_out)
+                ]
+            )
+            Gear.objects.filter(pk__in=[gear.pk for gear in to_check_out]).update(
+                status=1, checked_out_to=member, due_date=return_date, version=F("version") + 1
+            )
+
+        for gear in to_check_out:
+            gear.version += 1
+            gear.status = 1
+            gear.checked_out_to = member
+            gear.due_date = return_date
+            logger.info(f"{gear.name} was CheckOut by {member} authorized by {authorizer} {comment}")
+        for rfid, message in failures.items():
+            logger.info(message)
+
+        return transactions, failures
+
+    def transition_many(self, authorizer_rfid, kind, queryset):
+        """
+        Make the same change of status to many pieces of gear at once, i.e. set all overdue gear missing
+
+        The authorizer is validated once for all the gear. All the gear selected by the queryset that is in a status the
+        transition can be made from is locked, then the transactions are all created at once and the status of all the
+        gear is changed by a single update, all in one database transaction.
+
+        :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transactions
+        :param kind: the type of the transactions, one of BULK_TRANSITIONS
+        :param queryset: a queryset of the gear to change, i.e. Gear.objects.filter(due_date__lt=today)
+        :return: list of the transactions made
+        """
+        authorizer = Member.objects.get(rfid=authorizer_rfid)
+        validate_auth(authorizer)
+        from_statuses, to_status = BULK_TRANSITIONS[kind]
+        today = date.today()
+
+        with db_transaction.atomic():
+            candidates = list(
+                queryset.filter(status__in=from_statuses)
+                .select_for_update(of=("self",))
+                .values_list("pk", "checked_out_to_id", "due_date")
+            )
+            transactions = [
+                self.model(
+                    primary_key=primary_key,
+                    type=kind,
+                    gear_id=gear_pk,
+                    member_id=member_pk,
+                    authorizer=authorizer,
+                    comments=f"Gear has been checked out for {(today - due_date).days} days" if due_date else "",
+                )
+                for primary_key, (gear_pk, member_pk, due_date) in zip(make_ids(len(candidates)), candidates)
+            ]
+            self.bulk_create(transactions)
+            Gear.objects.filter(pk__in=[gear_pk for gear_pk, _, _ in candidates]).update(
+                status=to_status, version=F("version") + 1
+            )
+
+        logger.info(f"{len(transactions)} pieces of gear were {kind} authorized by {authorizer}")
+        return transactions
+
+    def newly_due(self, kind, cutoff, last_cutoff, since, from_statuses=None):
+        """
+        The gear that became due for a bulk transition since it was last made, i.e. the gear that became overdue
+
+        Gear is due once its due date is before the cutoff. Gear that was already due at the last run (due before the
+        last cutoff) was already moved then, so only the gear whose due date fell between the two cutoffs is looked at,
+        which the (status, due_date) index finds directly. Gear that had any transaction since the last run (i.e. was
+        checked out already overdue, or only now set missing) is looked at as well, whatever its due date.
+
+        :param kind: the type of the transition, one of BULK_TRANSITIONS
+        :param cutoff: date, gear due before this is due for the transition
+        :param last_cutoff: date, the cutoff of the last time the transition was made
+        :param since: datetime, when the transition was last made
+        :param from_statuses: only look at gear with these statuses, instead of all that the transition allows
+        :return: a queryset of the gear, ready to be given to transition_many
+        """
+        if from_statuses is None:
+            from_statuses, _ = BULK_TRANSITIONS[kind]
+        due = Gear.objects.filter(status__in=from_statuses, due_date__lt=cutoff)
+
+        crossed = due.filter(due_date__gte=last_cutoff).values_list("pk", flat=True)
+        changed = due.filter(pk__in=self.filter(timestamp__gte=since).values("gear_id")).values_list("pk", flat=True)
+        return Gear.objects.filter(pk__in=set(crossed) | set(changed))
+
     def add_gear(
         self,
         authorizer_rfid,
@@ -175,6 +477,7 @@ class TransactionManager(models.Manager):
         if required_certs:
             gear.min_required_certs.add(required_certs)
         gear.save()
+        GearAttribute.objects.index_gear(gear)
         if is_new:
             comment = "Newly Acquired"
         else:
@@ -197,7 +500,7 @@ class TransactionManager(models.Manager):
         # If everything went smoothly to this point, we can return the transaction logging the addition and the gear
         return transaction, gear
 
-    def check_in_gear(self, authorizer_rfid, gear_rfid):
+    def check_in_gear(self, authorizer_rfid, gear_rfid, version=None):
         """
         Check in a piece of gear and create a transaction logging the return.
 
@@ -206,23 +509,26 @@ class TransactionManager(models.Manager):
 
         :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
         :param gear_rfid: string, 10-digit rfid of the gear being checked in
+        :param version: if given, the version of the gear that the check in was decided on
         :return: Check-in type Transaction
         """
-        # First, retrieve the piece of gear we are concerned with
-        gear = Gear.objects.get(rfid=gear_rfid)
+        with db_transaction.atomic():
+            # First, retrieve and lock the piece of gear we are concerned with
+            gear = self.__lock_gear(gear_rfid, version)
+            validate_status(gear, (1, 3, 4), "checked in")
 
-        # Create a transaction to ensure everything is authorized
-        transaction = self.__make_transaction(authorizer_rfid, "CheckIn", gear)
+            # Create a transaction to ensure everything is authorized
+            transaction = self.__make_transaction(authorizer_rfid, "CheckIn", gear)
 
-        # If the transaction went through, we can go ahead and check in the gear
-        gear.status = 0
-        gear.checked_out_to = None
-        gear.due_date = None
-        gear.save()
+            # If the transaction went through, we can go ahead and check in the gear
+            gear.status = 0
+            gear.checked_out_to = None
+            gear.due_date = None
+            gear.save()
 
         return transaction, gear
 
-    def retag_gear(self, authorizer_rfid, old_rfid, new_rfid):
+    def retag_gear(self, authorizer_rfid, old_rfid, new_rfid, version=None):
         """
         Change the RFID of a piece of gear, and create a transaction logging the change.
 
@@ -232,25 +538,28 @@ class TransactionManager(models.Manager):
         :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
         :param old_rfid: string, the old 10-digit rfid of the piece of gear
         :param new_rfid: string, the new 10-digit rfid to give this piece of gear
+        :param version: if given, the version of the gear that the retag was decided on
         :return: ReTag Transaction
         """
         validate_rfid(new_rfid)
-        gear = Gear.objects.get(rfid=old_rfid)
 
-        # Create a transaction to ensure everything is authorized
-        details = "Changed RFID from {} to {}".format(old_rfid, new_rfid)
-        transaction = self.__make_transaction(
-            authorizer_rfid, "ReTag", gear, comments=details
-        )
+        with db_transaction.atomic():
+            gear = self.__lock_gear(old_rfid, version)
 
-        # If the transaction went through, we can go ahead and remove the gear
-        gear.rfid = new_rfid
-        gear.save()
+            # Create a transaction to ensure everything is authorized
+            details = "Changed RFID from {} to {}".format(old_rfid, new_rfid)
+            transaction = self.__make_transaction(
+                authorizer_rfid, "ReTag", gear, comments=details
+            )
+
+            # If the transaction went through, we can go ahead and remove the gear
+            gear.rfid = new_rfid
+            gear.save()
 
         return transaction, gear
 
     def fix_gear(
-        self, authorizer_rfid, gear_rfid, repairs_description, person_repairing
+        self, authorizer_rfid, gear_rfid, repairs_description, person_repairing, version=None
     ):
         """
         Note that a broken piece of gear was fixed and has been placed back in circulation
@@ -262,22 +571,25 @@ class TransactionManager(models.Manager):
         :param gear_rfid: string, 10-digit rfid of the gear that got broken
         :param repairs_description: a description of the repairs that were made
         :param person_repairing: the name of the person who preformed the repairs
+        :param version: if given, the version of the gear that the fix was decided on
         :return: Fix Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
-
         comment = "{} {}".format(person_repairing, repairs_description)
 
-        # Create a transaction to ensure everything is authorized
-        transaction = self.__make_transaction(
-            authorizer_rfid, "Fix", gear, comments=comment
-        )
+        with db_transaction.atomic():
+            gear = self.__lock_gear(gear_rfid, version)
+            validate_status(gear, (2,), "fixed")
 
-        gear.set_status = 0
-        gear.save()
+            # Create a transaction to ensure everything is authorized
+            transaction = self.__make_transaction(
+                authorizer_rfid, "Fix", gear, comments=comment
+            )
+
+            gear.status = 0
+            gear.save()
         return transaction, gear
 
-    def break_gear(self, authorizer_rfid, gear_rfid, damage_description):
+    def break_gear(self, authorizer_rfid, gear_rfid, damage_description, version=None):
         """
         Note that a piece of gear is damaged and has been removed from circulation
 
@@ -288,21 +600,24 @@ class TransactionManager(models.Manager):
         :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
         :param gear_rfid: string, 10-digit rfid of the gear that got broken
         :param damage_description: a description of the damage and (if known) repairs needed
+        :param version: if given, the version of the gear that the break was decided on
         :return: Break Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
+        with db_transaction.atomic():
+            gear = self.__lock_gear(gear_rfid, version)
+            validate_status(gear, (0, 1, 3, 4), "set broken")
 
-        # Create a transaction to ensure everything is authorized
-        transaction = self.__make_transaction(
-            authorizer_rfid, "Break", gear, comments=damage_description
-        )
+            # Create a transaction to ensure everything is authorized
+            transaction = self.__make_transaction(
+                authorizer_rfid, "Break", gear, comments=damage_description
+            )
 
-        gear.set_status = 2
-        gear.save()
+            gear.status = 2
+            gear.save()
 
         return transaction, gear
 
-    def missing_gear(self, authorizer_rfid, gear_rfid):
+    def missing_gear(self, authorizer_rfid, gear_rfid, version=None):
         """
         Note that a piece of gear has been missing for a while and should be searched for
 
@@ -311,23 +626,28 @@ class TransactionManager(models.Manager):
 
         :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
         :param gear_rfid: string, 10-digit rfid of the gear that got broken
+        :param version: if given, the version of the gear that it was decided to be missing on
         :return: Fix Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
-        last_owner = gear.checked_out_to
-        time_out = date.today()-gear.due_date
-        details = f"Gear has been checked out for {time_out.days} days"
+        with db_transaction.atomic():
+            # The gear may have been checked in since it was found to be overdue, so check again under the lock
+            gear = self.__lock_gear(gear_rfid, version)
+            validate_status(gear, (1,), "set missing")
 
-        # Create a transaction to ensure everything is authorized
-        transaction = self.__make_transaction(
-            authorizer_rfid, "Missing", gear, member=last_owner, comments=details
-        )
+            last_owner = gear.checked_out_to
+            time_out = date.today()-gear.due_date
+            details = f"Gear has been checked out for {time_out.days} days"
 
-        gear.status = 3
-        gear.save()
+            # Create a transaction to ensure everything is authorized
+            transaction = self.__make_transaction(
+                authorizer_rfid, "Missing", gear, member=last_owner, comments=details
+            )
+
+            gear.status = 3
+            gear.save()
         return transaction, gear
 
-    def expire_gear(self, authorizer_rfid, gear_rfid):
+    def expire_gear(self, authorizer_rfid, gear_rfid, version=None):
         """
         Note that a piece of gear has been missing for a very long time and is probably permanently lost
 
@@ -337,23 +657,27 @@ class TransactionManager(models.Manager):
 
         :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
         :param gear_rfid: string, 10-digit rfid of the gear that got broken
+        :param version: if given, the version of the gear that it was decided to be expired on
         :return: Fix Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
-        last_owner = gear.checked_out_to
-        time_out = date.today()-gear.due_date
-        details = f"Gear has been checked out for {time_out.days} days"
+        with db_transaction.atomic():
+            gear = self.__lock_gear(gear_rfid, version)
+            validate_status(gear, (2, 3), "expired")
 
-        # Create a transaction to ensure everything is authorized
-        transaction = self.__make_transaction(
-            authorizer_rfid, "Dormant", gear, member=last_owner, comments=details
-        )
+            last_owner = gear.checked_out_to
+            time_out = date.today()-gear.due_date
+            details = f"Gear has been checked out for {time_out.days} days"
 
-        gear.status = 4
-        gear.save()
+            # Create a transaction to ensure everything is authorized
+            transaction = self.__make_transaction(
+                authorizer_rfid, "Dormant", gear, member=last_owner, comments=details
+            )
+
+            gear.status = 4
+            gear.save()
         return transaction, gear
 
-    def delete_gear(self, authorizer_rfid, gear_rfid, reason):
+    def delete_gear(self, authorizer_rfid, gear_rfid, reason, version=None):
         """
         Permanently remove a piece of gear from circulation
 
@@ -363,28 +687,34 @@ class TransactionManager(models.Manager):
         :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
         :param gear_rfid: string, 10-digit rfid of the gear being deleted
         :param reason: string explaining why this piece of gear is being removed
+        :param version: if given, the version of the gear that the removal was decided on
         :return: transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
+        with db_transaction.atomic():
+            gear = self.__lock_gear(gear_rfid, version)
 
-        # Create a transaction to ensure everything is authorized
-        transaction = self.__make_transaction(
-            authorizer_rfid, "Delete", gear, comments=reason
-        )
+            # Create a transaction to ensure everything is authorized
+            transaction = self.__make_transaction(
+                authorizer_rfid, "Delete", gear, comments=reason
+            )
+
+            # If the transaction went through, we can go ahead and remove the gear
+            gear.status = 5
+            gear.checked_out_to = None
+            gear.save()
 
-        # If the transaction went through, we can go ahead and remove the gear
-        gear.status = 5
-        gear.checked_out_to = None
-        gear.department.notify_gear_removed()
+        rfid_cache.discard(gear.rfid)
+        gear.get_department().notify_gear_removed(gear)
 
         return transaction, gear
 
-    def override(self, authorizer_rfid, gear_rfid, **kwargs):
+    def override(self, authorizer_rfid, gear_rfid, version=None, **kwargs):
         """
         Allows the admin to override the settings on any piece of gear
 
         :param authorizer_rfid: string, the 10-digit rfid of the entity authorizing the transaction
         :param gear_rfid: string, 10-digit rfid of the gear being deleted
+        :param version: if given, the version of the gear that the changes were decided on
 
         available kwargs:
             rfid: (default None), the rfid to set the rfid to. If left None, no change is made
@@ -395,61 +725,73 @@ class TransactionManager(models.Manager):
 
         :return: Admin Override Transaction
         """
-        gear = Gear.objects.get(rfid=gear_rfid)
-
         member = Member.objects.get(rfid=authorizer_rfid)
         if not member.has_permission("core.change_gear"):
             raise ValidationError("You don't have the permission to change gear!")
 
-        # All the changes made will be described here
-        action = f"Admin override on {gear} [{gear_rfid}]: \n"
+        with db_transaction.atomic():
+            gear = self.__lock_gear(gear_rfid, version)
 
-        # Remove the fields that were appended from the geartype, they will be saved in gear_data
-        for field_name in gear.geartype.get_field_names():
-            kwargs.pop(field_name)
+            # All the changes made will be described here
+            action = f"Admin override on {comment_value(gear)} [{gear_rfid}]: \n"
 
-        # Set each of the available kwargs to their desired value if they are not none
-        for kwarg in kwargs.keys():
+            # Remove the fields that were appended from the geartype, they will be saved in gear_data
+            for field_name in gear.geartype.get_field_names():
+                kwargs.pop(field_name)
 
-            new_value = kwargs[kwarg]
-            old_value = gear.__getattribute__(kwarg)
+            # Set each of the available kwargs to their desired value if they are not none
+            checked_out_to_changed = False
+            for kwarg in kwargs.keys():
 
-            if new_value != old_value:
-                gear.__setattr__(kwarg, new_value)
+                new_value = kwargs[kwarg]
+                old_value = gear.__getattribute__(kwarg)
 
-                # Parse gear data action differently to not spew a bunch of unnecessary internal data
-                if kwarg == "gear_data":
-                    old_gear_data = json.loads(old_value)
-                    new_gear_data = json.loads(new_value)
-                    for field_name in new_gear_data.keys():
-                        # Save the action as a change for each data field individually
-                        old_field_value = old_gear_data[field_name]["initial"]
-                        new_field_value = new_gear_data[field_name]["initial"]
-                        if old_field_value != new_field_value:
-                            action += f"  Changed {field_name} from {old_field_value} to {new_field_value}"
+                if new_value != old_value:
+                    gear.__setattr__(kwarg, new_value)
 
-                else:
-                    action += f"  Changed {kwarg} from {old_value} to {new_value};"
+                    # Describe gear data changes field by field, rather than as a whole dict
+                    if kwarg == "gear_data":
+                        for field_name in new_value.keys():
+                            # Save the action as a change for each data field individually, marked as data so that
+                            # a field named like one of the gear's own is never taken for a change of the gear
+                            if old_value.get(field_name) != new_value[field_name]:
+                                old_field_value = comment_value(old_value.get(field_name))
+                                new_field_value = comment_value(new_value[field_name])
+                                action += (
+                                    f"  Changed data {comment_value(field_name)} "
+                                    f"from {old_field_value} to {new_field_value};"
+                                )
+
+                    else:
+                        action += f"  Changed {kwarg} from {comment_value(old_value)} to {comment_value(new_value)};"
+                        checked_out_to_changed |= kwarg == "checked_out_to"
+
+            # Record who the gear went to if that was changed, so that the change can be replayed from the transaction
+            member = gear.checked_out_to if checked_out_to_changed else None
+
+            # Save the changes made in a transaction
+            transaction = self.__make_transaction(
+                authorizer_rfid, "Override", gear, member=member, comments=action
+            )
+
+            gear.save()
+
+            # Keep the typed attribute index in step with the new gear data
+            if "gear_data" in kwargs:
+                GearAttribute.objects.index_gear(gear)
 
-        # Save the changes made in a transaction
-        transaction = self.__make_transaction(
-            authorizer_rfid, "Override", gear, comments=action
-        )
         return transaction, gear
 
 
-class Transaction(models.Model):
-    """
-    Model that stores the data for every transaction, to allow better monitoring of the status of the whole system.
+class ArchivedTransactionManager(models.Manager.from_queryset(TransactionQuerySet)):
+    pass
 
-    Each change to any piece of gear should be done via a transaction manager function. This allows transactions to
-    serve as state change vectors for the system, and the status of the system at any time could be reconstructed from
-    the addition (subsequent application) of these transactions.
 
-    NEVER CREATE TRANSACTIONS MANUALLY, ALWAYS USE THE MANAGER FUNCTIONS
-    """
+class BaseTransaction(models.Model):
+    """The data stored about every transaction, whether it is still current or was archived"""
 
-    objects = TransactionManager()
+    class Meta:
+        abstract = True
 
     transaction_types = [
         (
@@ -512,3 +854,55 @@ class Transaction(models.Model):
     @property
     def detail_url(self):
         return reverse("admin:core_transaction_detail", kwargs={"pk": self.pk})
+
+
+class Transaction(BaseTransaction):
+    """
+    Model that stores the data for every transaction, to allow better monitoring of the status of the whole system.
+
+    Each change to any piece of gear should be done via a transaction manager function. This allows transactions to
+    serve as state change vectors for the system, and the status of the system at any time could be reconstructed from
+    the addition (subsequent application) of these transactions. GearSnapshot.objects.state_at does exactly that.
+
+    Transactions from past years are moved to the ArchivedTransaction table by the archive_transactions task, so that
+    this table only holds the recent ones. Use Transaction.objects.history() to query both tables together.
+
+    NEVER CREATE TRANSACTIONS MANUALLY, ALWAYS USE THE MANAGER FUNCTIONS
+    """
+
+    objects = TransactionManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["gear", "timestamp", "primary_key"], name="core_trans_gear_time_idx"),
+            models.Index(fields=["member", "timestamp", "primary_key"], name="core_trans_member_time_idx"),
+            models.Index(fields=["authorizer", "timestamp", "primary_key"], name="core_trans_auth_time_idx"),
+            models.Index(fields=["timestamp", "primary_key"], name="core_trans_time_idx"),
+        ]
+
+
+class ArchivedTransaction(BaseTransaction):
+    """
+    A transaction from a past year, moved out of the Transaction table so that the everyday queries stay fast
+
+    Archived transactions are exactly like the current ones, but they are never changed or added to except by the
+    archive_transactions task. Since only whole years are archived, every archived transaction is older than every
+    current one.
+    """
+
+    objects = ArchivedTransactionManager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["gear", "timestamp", "primary_key"], name="core_arch_gear_time_idx"),
+            models.Index(fields=["member", "timestamp", "primary_key"], name="core_arch_member_time_idx"),
+            models.Index(fields=["authorizer", "timestamp", "primary_key"], name="core_arch_auth_time_idx"),
+            models.Index(fields=["timestamp", "primary_key"], name="core_arch_time_idx"),
+        ]
+
+    #: The time at which the transaction was originally made, kept as is when it is archived
+    timestamp = models.DateTimeField()
+
+    gear = models.ForeignKey(Gear, on_delete=models.PROTECT, related_name="archived_transactions")
+
+    authorizer = models.ForeignKey(Member, on_delete=models.PROTECT, related_name="archived_authorized")
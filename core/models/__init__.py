@@ -1,5 +1,11 @@
 # Allows django to import the User (Member) classes from the models module
 from .MemberModels import MemberManager, Member, Staffer
 from .GearModels import Gear
-from .TransactionModels import Transaction
+from .TransactionModels import Transaction, ArchivedTransaction
 from .DepartmentModels import Department
+from .CacheModels import CacheVersion
+from .RfidModels import RfidRegistry
+from .SnapshotModels import GearSnapshot
+from .EmailModels import OutboundEmail
+from .TaskModels import TaskRun, TaskWatermark
+from .ListservModels import ListservSubscriber
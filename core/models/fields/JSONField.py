@@ -0,0 +1,135 @@
+import json
+
+from django.db import models
+from django.db.models import Lookup, Transform
+
+
+class JSONField(models.Field):
+    """
+    Model field that stores a JSON object, and gives it back as a python dict
+
+    On Postgres the data is stored in a native jsonb column (which can be indexed with a GIN index), everywhere else it
+    is stored as text. Either way, the stored values can be queried directly in the database:
+
+        Gear.objects.filter(gear_data__contains={"size": "M"})   # Uses the GIN index on Postgres
+        Gear.objects.filter(gear_data__length__gte=170)          # Compares the value stored under "length"
+    """
+
+    description = "A JSON object"
+    empty_strings_allowed = False
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("default", dict)
+        super().__init__(*args, **kwargs)
+
+    def db_type(self, connection):
+        if connection.vendor == "postgresql":
+            return "jsonb"
+        return "text"
+
+    def from_db_value(self, value, expression, connection):
+        # psycopg2 already decodes jsonb columns, but text columns must be decoded here
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return json.dumps(value)
+
+    def value_to_string(self, obj):
+        return json.dumps(self.value_from_object(obj))
+
+    def get_transform(self, name):
+        """Any unknown lookup name refers to a key in the JSON object"""
+        transform = super().get_transform(name)
+        if transform:
+            return transform
+        return KeyTransformFactory(name)
+
+
+@JSONField.register_lookup
+class JSONContains(Lookup):
+    """Match rows where the stored object contains all the given key/value pairs"""
+
+    lookup_name = "contains"
+    prepare_rhs = False
+
+    def as_postgresql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        return f"{lhs} @> %s::jsonb", lhs_params + [json.dumps(self.rhs)]
+
+    def as_sql(self, compiler, connection):
+        """Databases without jsonb compare each key individually"""
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        conditions = []
+        params = []
+        for key, value in self.rhs.items():
+            conditions.append(f"JSON_EXTRACT({lhs}, %s) = %s")
+            params.extend(lhs_params + [f"$.{key}", value])
+        return " AND ".join(conditions) or "1=1", params
+
+
+class KeyTransform(Transform):
+    """
+    Get the value stored under a key of the JSON object
+
+    Numbers are compared as numbers when the compared value is a number, and as text otherwise, so that both
+    gear_data__length__gte=170 and gear_data__size="M" behave as expected.
+    """
+
+    def __init__(self, key_name, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.key_name = key_name
+
+    def as_postgresql(self, compiler, connection):
+        lhs, params = compiler.compile(self.lhs)
+        return f"({lhs} ->> %s)", params + [self.key_name]
+
+    def as_sql(self, compiler, connection):
+        lhs, params = compiler.compile(self.lhs)
+        return f"JSON_EXTRACT({lhs}, %s)", params + [f"$.{self.key_name}"]
+
+    def get_lookup(self, lookup_name):
+        return key_lookups.get(lookup_name)
+
+
+class KeyTransformFactory:
+    def __init__(self, key_name):
+        self.key_name = key_name
+
+    def __call__(self, *args, **kwargs):
+        return KeyTransform(self.key_name, *args, **kwargs)
+
+
+class KeyValueLookup(Lookup):
+    """Compare the value stored under a key, casting it to a number on Postgres if compared against a number"""
+
+    prepare_rhs = False
+    operator = None
+
+    def get_db_prep_lookup(self, value, connection):
+        return "%s", [value]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = compiler.compile(self.lhs)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        if connection.vendor == "postgresql":
+            if isinstance(self.rhs, bool):
+                lhs = f"({lhs})::boolean"
+            elif isinstance(self.rhs, (int, float)):
+                lhs = f"({lhs})::numeric"
+        return f"{lhs} {self.operator} {rhs}", lhs_params + rhs_params
+
+
+#: The comparisons that can be made on the value stored under a key, i.e. gear_data__length__gte
+key_lookups = {
+    lookup_name: type(f"Key{lookup_name.title()}", (KeyValueLookup,), {"lookup_name": lookup_name, "operator": operator})
+    for lookup_name, operator in (("exact", "="), ("gt", ">"), ("gte", ">="), ("lt", "<"), ("lte", "<="))
+}
@@ -19,6 +19,19 @@ def make_id():
     return new_id
 
 
+def make_ids(count):
+    """
+    Construct count distinct IDs at once, for objects that are created together (i.e. with bulk_create)
+
+    IDs made within the same millisecond only differ in their random bits, so with enough of them a repeat becomes
+    likely. Drawing until there are enough distinct ones rules that out.
+    """
+    ids = set()
+    while len(ids) < count:
+        ids.add(make_id())
+    return list(ids)
+
+
 def reverse_id(big_id):
     """Get the creation time from the id"""
     t = big_id >> 23
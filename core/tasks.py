@@ -1,77 +1,173 @@
 from helper_scripts import setup_django
 
+from itertools import groupby
+from operator import attrgetter
 from sys import argv
 
-from django.utils.timezone import datetime, timedelta
-from datetime import date
+from django.utils.timezone import datetime, localdate, make_aware, now, timedelta
 
-from excsystem.settings import GEAR_EXPIRE_TIME
+from uwccsystem.settings import GEAR_EXPIRE_TIME
+from core.models.EmailModels import OutboundEmail
 from core.models.MemberModels import Member
-from core.models.GearModels import Gear
+from core.models.RfidModels import RfidRegistry
+from core.models.SnapshotModels import GearSnapshot
+from core.models.TaskModels import TaskWatermark, record_progress, tracked_task
+from core.models.GearModels import Gear, GearAttribute
 from core.models.TransactionModels import Transaction
 
+#: When expire_gear has not run for this long, it looks through all gear instead of only what changed since
+EXPIRE_GEAR_CATCH_UP_AFTER = timedelta(days=7)
+
 
 def test_task():
     print("Tested a task")
 
 
-def update_listserv():
+@tracked_task
+def update_listserv(full=False):
+    """Add the newly active members to the listserv and remove the ones that are no longer active"""
     from helper_scripts import listserv_interface
 
-    listserv_interface.run_update()
+    messages = listserv_interface.run_update(full=full)
+    print("\n".join(messages) or "The listserv was already up to date")
+
+
+def replace_listserv():
+    """Replace everyone on the listserv with the active members, in case it got out of step with what was pushed"""
+    update_listserv(full=True)
 
 
+@tracked_task
 def expire_members():
+    """Expire all members whose membership ran out, and warn those whose membership will expire in a week"""
+    expired = Member.objects.expire_all()
+    warned = Member.objects.warn_expiring()
+    record_progress(examined=len(expired) + len(warned), changed=len(expired), emails_queued=len(expired) + len(warned))
+    print(f"Expired {len(expired)} members and warned {len(warned)} members, their emails are queued")
 
-    now = datetime.date(datetime.now())
-    expires_in_week = now + timedelta(days=7)
 
-    for member in Member.objects.all():
+@tracked_task
+def send_queued_emails():
+    """Send all the emails waiting in the queue that are due"""
+    sent = OutboundEmail.objects.drain()
+    record_progress(changed=sent)
+    print(f"Sent {sent} emails")
 
-        # Only check if the member is expired if the are active.
-        if member.group == 'Member' or member.group == 'Just Joined':
 
-            # Expire members
-            if member.date_expires < now:
-                member.expire()
-                member.send_expired_email()
+def email_worker():
+    """Keep sending the queued emails as they come in. This runs forever, as its own process"""
+    OutboundEmail.objects.run_worker()
 
-            # If members will expire soon, send them an email
-            elif member.date_expires == expires_in_week:
-                member.send_expires_soon_email()
 
+@tracked_task
+def expire_gear(catch_up=False):
+    """
+    Set all overdue gear missing, and all gear that has been missing for too long dormant
 
-def expire_gear():
-    """"""
-    checked_out = Gear.objects.filter(status__in=[1, 3])
+    Only the gear that could have become overdue since the last run is looked at, unless catching up. The task catches
+    up by itself when it never ran before or has not run for EXPIRE_GEAR_CATCH_UP_AFTER.
+    """
     sys_rfid = Member.objects.get(email='system@excursionclubucsb.org').rfid
-    today = date.today()
-    for gear in checked_out:
-        if gear.status == 1 and today > gear.due_date:
-            Transaction.objects.missing_gear(sys_rfid, gear.rfid)
-        elif gear.status == 3 and today > gear.due_date + GEAR_EXPIRE_TIME:
-            Transaction.objects.expire_gear(sys_rfid, gear.rfid)
+    started_at = now()
+    today = localdate(started_at)
+    expire_cutoff = today - GEAR_EXPIRE_TIME
+
+    since = TaskWatermark.objects.get_value("expire_gear")
+    if since is None or started_at - since > EXPIRE_GEAR_CATCH_UP_AFTER:
+        catch_up = True
+
+    # Expire first, so that gear that only now went missing is not expired on the same night. Only missing gear expires
+    # here, broken gear is left to be retired by hand
+    if catch_up:
+        lost = Gear.objects.filter(status=3, due_date__lt=expire_cutoff)
+    else:
+        days_since = today - localdate(since)
+        lost = Transaction.objects.newly_due(
+            "Dormant", expire_cutoff, expire_cutoff - days_since, since, from_statuses=(3,)
+        )
+    expired = Transaction.objects.transition_many(sys_rfid, "Dormant", lost)
+
+    if catch_up:
+        overdue = Gear.objects.filter(status=1, due_date__lt=today)
+    else:
+        overdue = Transaction.objects.newly_due("Missing", today, today - days_since, since)
+    missing = Transaction.objects.transition_many(sys_rfid, "Missing", overdue)
 
+    # The next run picks up from when this one started, so it sees the gear this run set missing
+    TaskWatermark.objects.advance("expire_gear", started_at)
+    record_progress(changed=len(missing) + len(expired))
+    print(f"Set {len(missing)} pieces of gear missing and {len(expired)} dormant" + (", caught up" if catch_up else ""))
+
+
+def catch_up_expired_gear():
+    """Look through all gear for gear to set missing or dormant, in case any was missed. Run this once a week"""
+    expire_gear(catch_up=True)
+
+
+@tracked_task
+def update_gear_names():
+    """Recompute the stored names of all gear. Run this after changing the schema of a gear type outside the admin"""
+    changed = Gear.objects.update_display_names()
+    record_progress(changed=changed)
+    print(f"Updated the names of {changed} pieces of gear")
 
-def email_overdue_gear():
-    """Send an email to all members with overdue gear listing all overdue gear"""
-    missing = Gear.objects.filter(status=3).order_by('checked_out_to__pk')
 
-    try:
-        current_member = missing[0].checked_out_to
-    except IndexError:
-        return
-    members_gear = []
+@tracked_task
+def rebuild_gear_attributes():
+    """Rebuild the typed index of the gear data of all gear, in case it got out of step with the gear data itself"""
+    indexed = GearAttribute.objects.rebuild()
+    record_progress(changed=indexed)
+    print(f"Indexed {indexed} gear attributes")
 
-    for gear in missing:
-        if gear.checked_out_to.pk != current_member.pk:
-            current_member.send_missing_gear_email(members_gear)
-            current_member = gear.checked_out_to
-            members_gear = [gear]
-        else:
-            members_gear.append(gear)
 
-    current_member.send_missing_gear_email(members_gear)
+@tracked_task
+def rebuild_rfid_registry():
+    """Rebuild the registry of all rfids in use from the rfids of all members and gear"""
+    registered = RfidRegistry.objects.rebuild()
+    record_progress(changed=registered)
+    print(f"Registered {registered} rfids")
+
+
+@tracked_task
+def take_gear_snapshot():
+    """Record the state of all gear, so that replaying the transactions can start from here. Run this nightly"""
+    snapshot = GearSnapshot.objects.take()
+    record_progress(examined=len(snapshot.state))
+    print(f"Took a snapshot of {len(snapshot.state)} pieces of gear at {snapshot.taken_at}")
+
+
+@tracked_task
+def check_gear_state():
+    """Report all gear whose state differs from the state replayed from its transactions"""
+    drift = GearSnapshot.objects.find_drift()
+    for gear_pk, replayed, actual in drift:
+        print(f"Gear {gear_pk} is {actual}, but its transactions say it should be {replayed}")
+    print(f"Found {len(drift)} pieces of gear that do not match their transactions")
+    return drift
+
+
+@tracked_task
+def archive_transactions():
+    """Move the transactions of all past years to the archive. Run this once at the start of every year"""
+    start_of_year = make_aware(datetime(now().year, 1, 1))
+
+    # Replaying the gear state from this snapshot on will not need the archive at all
+    GearSnapshot.objects.take(start_of_year)
+    archived = Transaction.objects.archive(start_of_year)
+    record_progress(changed=archived)
+    print(f"Archived {archived} transactions made before {start_of_year}")
+
+
+@tracked_task
+def email_overdue_gear():
+    """Queue an email to all members with overdue gear listing all their overdue gear"""
+    missing = Gear.objects.filter(status=3).select_related('checked_out_to').order_by('checked_out_to__pk')
+    members_gear = [
+        (member, list(all_gear)) for member, all_gear in groupby(missing, key=attrgetter('checked_out_to'))
+    ]
+    OutboundEmail.objects.bulk_create(Member.build_missing_gear_emails(members_gear))
+    record_progress(examined=sum(len(all_gear) for _, all_gear in members_gear), emails_queued=len(members_gear))
+    print(f"Queued overdue gear emails to {len(members_gear)} members")
 
 
 if __name__ == "__main__":
@@ -80,11 +176,31 @@ if __name__ == "__main__":
         test_task()
     elif task_name == "update_listserv":
         update_listserv()
+    elif task_name == "replace_listserv":
+        replace_listserv()
     elif task_name == "expire_members":
         expire_members()
+    elif task_name == "send_queued_emails":
+        send_queued_emails()
+    elif task_name == "email_worker":
+        email_worker()
     elif task_name == "expire_gear":
         expire_gear()
+    elif task_name == "catch_up_expired_gear":
+        catch_up_expired_gear()
     elif task_name == "email_overdue_gear":
         email_overdue_gear()
+    elif task_name == "update_gear_names":
+        update_gear_names()
+    elif task_name == "rebuild_gear_attributes":
+        rebuild_gear_attributes()
+    elif task_name == "rebuild_rfid_registry":
+        rebuild_rfid_registry()
+    elif task_name == "take_gear_snapshot":
+        take_gear_snapshot()
+    elif task_name == "check_gear_state":
+        check_gear_state()
+    elif task_name == "archive_transactions":
+        archive_transactions()
     else:
         print(f"Invalid task name: '{task_name}'!")
@@ -0,0 +1,14 @@
+from django import template
+
+register = template.Library()
+
+
+@register.filter
+def strftime(value, date_format):
+    """
+    Format a date with python's strftime
+
+    Unlike Django's date filter this skips the translation machinery, which makes up most of the time it takes to
+    render an email full of dates.
+    """
+    return value.strftime(date_format)
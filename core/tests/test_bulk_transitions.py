@@ -0,0 +1,143 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.DepartmentModels import Department
+from core.models.EmailModels import OutboundEmail
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import Gear, GearType
+from core.models.MemberModels import Member
+from core.models.SnapshotModels import GearSnapshot
+from core.models.TaskModels import TaskRun, TaskWatermark
+from core.models.TransactionModels import Transaction
+from core.tasks import EXPIRE_GEAR_CATCH_UP_AFTER, catch_up_expired_gear, email_overdue_gear, expire_gear
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from uwccsystem.settings import GEAR_EXPIRE_TIME
+from django.utils.timezone import localdate, now, timedelta
+
+ADMIN_RFID = "0000000000"
+MEMBER_RFID = "1111111111"
+
+
+class TransitionManyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.admin = Member.objects.create_superuser("system@excursionclubucsb.org", ADMIN_RFID, "pass")
+        self.member = Member.objects.create_member("jane@bro.com", MEMBER_RFID, timedelta(days=365))
+        self.member.promote_to_active()
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        geartype = GearType.objects.create(name="Skis", department=department)
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        self.rfids = [f"01234567{i:02}" for i in range(30)]
+        for rfid in self.rfids:
+            Transaction.objects.add_gear(ADMIN_RFID, rfid, geartype, img)
+
+        # Ten pieces of gear are overdue, ten are due in a week and ten are in stock
+        for rfid in self.rfids[:10]:
+            Transaction.objects.make_checkout(ADMIN_RFID, rfid, MEMBER_RFID, localdate() - timedelta(days=3))
+        for rfid in self.rfids[10:20]:
+            Transaction.objects.make_checkout(ADMIN_RFID, rfid, MEMBER_RFID, localdate() + timedelta(days=7))
+
+    def test_missing(self):
+        version = Gear.objects.get(rfid=self.rfids[0]).version
+        overdue = Gear.objects.filter(due_date__lt=localdate())
+        transactions = Transaction.objects.transition_many(ADMIN_RFID, "Missing", overdue)
+
+        self.assertEqual(len(transactions), 10)
+        self.assertEqual(set(Gear.objects.filter(status=3).values_list("rfid", flat=True)), set(self.rfids[:10]))
+        self.assertEqual(Gear.objects.filter(status=1).count(), 10)
+
+        transaction = Transaction.objects.get(type="Missing", gear__rfid=self.rfids[0])
+        self.assertEqual(transaction.member, self.member)
+        self.assertEqual(transaction.comments, "Gear has been checked out for 3 days")
+        self.assertEqual(Gear.objects.get(rfid=self.rfids[0]).version, version + 1)
+        self.assertEqual(GearSnapshot.objects.find_drift(), [])
+
+    def test_query_count(self):
+        # The authorizer, the gear, the transactions and the update, along with the savepoint around them
+        with self.assertNumQueries(6):
+            transactions = Transaction.objects.transition_many(ADMIN_RFID, "Missing", Gear.objects.all())
+        self.assertEqual(len(transactions), 20)
+
+    def test_only_allowed_statuses_change(self):
+        # Gear that is in stock can never go missing, and checked out gear can not become dormant directly
+        transactions = Transaction.objects.transition_many(ADMIN_RFID, "Dormant", Gear.objects.all())
+        self.assertEqual(transactions, [])
+        self.assertEqual(Gear.objects.filter(status=4).count(), 0)
+
+    def test_unauthorized(self):
+        with self.assertRaises(ValidationError):
+            Transaction.objects.transition_many(MEMBER_RFID, "Missing", Gear.objects.all())
+        self.assertEqual(Gear.objects.filter(status=3).count(), 0)
+
+    def test_expire_gear_task(self):
+        # Gear that has been missing for long enough is expired, but only the day after it was set missing
+        long_overdue = Gear.objects.filter(rfid__in=self.rfids[:5])
+        long_overdue.update(due_date=localdate() - timedelta(days=365))
+        expire_gear()
+        self.assertEqual(Gear.objects.filter(status=3).count(), 10)
+
+        expire_gear()
+        self.assertEqual(set(Gear.objects.filter(status=4).values_list("rfid", flat=True)), set(self.rfids[:5]))
+        self.assertEqual(Gear.objects.filter(status=3).count(), 5)
+        self.assertEqual(Transaction.objects.filter(type="Dormant").count(), 5)
+
+    def test_expire_gear_incrementally(self):
+        # As if the task last ran yesterday, before any of the gear was checked out
+        yesterday = now() - timedelta(days=1)
+        TaskWatermark.objects.advance("expire_gear", yesterday)
+        Transaction.objects.update(timestamp=yesterday - timedelta(hours=1))
+
+        # Gear that was already overdue at the last run was set missing then, so it is not looked at again
+        expire_gear()
+        self.assertEqual(Gear.objects.filter(status=3).count(), 0)
+        self.assertGreaterEqual(TaskWatermark.objects.get_value("expire_gear"), yesterday + timedelta(days=1))
+
+        # The gear that only became overdue since, and the gear that was checked out since, are caught
+        TaskWatermark.objects.advance("expire_gear", yesterday)
+        Gear.objects.filter(rfid=self.rfids[10]).update(due_date=localdate() - timedelta(days=1))
+        Transaction.objects.check_in_gear(ADMIN_RFID, self.rfids[0])
+        Transaction.objects.make_checkout(ADMIN_RFID, self.rfids[0], MEMBER_RFID, localdate() - timedelta(days=9))
+        expire_gear()
+        missing = set(Gear.objects.filter(status=3).values_list("rfid", flat=True))
+        self.assertEqual(missing, {self.rfids[0], self.rfids[10]})
+
+        # Catching up still finds everything that was missed
+        catch_up_expired_gear()
+        self.assertEqual(Gear.objects.filter(status=3).count(), 11)
+        self.assertEqual(TaskRun.objects.filter(name="expire_gear", status=TaskRun.SUCCEEDED).count(), 3)
+
+    def test_expire_gear_leaves_broken_gear(self):
+        yesterday = now() - timedelta(days=1)
+        TaskWatermark.objects.advance("expire_gear", yesterday)
+        Transaction.objects.update(timestamp=yesterday - timedelta(hours=1))
+
+        # Both went missing long ago, and one of them was found broken since
+        long_overdue = Gear.objects.filter(rfid__in=self.rfids[:2])
+        long_overdue.update(due_date=localdate() - GEAR_EXPIRE_TIME - timedelta(days=1))
+        for rfid in self.rfids[:2]:
+            Transaction.objects.missing_gear(ADMIN_RFID, rfid)
+        Transaction.objects.break_gear(ADMIN_RFID, self.rfids[0], "Snapped in half")
+
+        expire_gear()
+        self.assertEqual(Gear.objects.get(rfid=self.rfids[0]).status, 2)
+        self.assertEqual(Gear.objects.get(rfid=self.rfids[1]).status, 4)
+
+    def test_expire_gear_catches_up_after_a_break(self):
+        TaskWatermark.objects.advance("expire_gear", now() - EXPIRE_GEAR_CATCH_UP_AFTER - timedelta(days=1))
+        Transaction.objects.update(timestamp=now() - EXPIRE_GEAR_CATCH_UP_AFTER - timedelta(days=2))
+        expire_gear()
+        self.assertEqual(Gear.objects.filter(status=3).count(), 10)
+
+    def test_email_overdue_gear_task(self):
+        Transaction.objects.transition_many(ADMIN_RFID, "Missing", Gear.objects.filter(due_date__lt=localdate()))
+        email_overdue_gear()
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.to_email, email.subject), ("jane@bro.com", "Gear Overdue"))
+        self.assertEqual(email.body.count("<tr><td>"), 10)
+
+        run = TaskRun.objects.get(name="email_overdue_gear")
+        self.assertEqual((run.status, run.rows_examined, run.emails_queued), (TaskRun.SUCCEEDED, 10, 1))
@@ -0,0 +1,74 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.CertificationModels import Certification, cert_ids_in, cert_mask
+from core.models.DepartmentModels import Department
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import Gear, GearType
+from core.models.MemberModels import Member
+from core.models.TransactionModels import Transaction, validate_required_certs
+from django.core.exceptions import ValidationError
+from django.test import TestCase
+from django.utils.timezone import timedelta
+
+ADMIN_RFID = "0000000000"
+MEMBER_RFID = "1111111111"
+
+
+class CertMaskTest(TestCase):
+    def test_round_trip(self):
+        self.assertEqual(cert_mask([1, 3, 70]), (1 << 1) | (1 << 3) | (1 << 70))
+        self.assertEqual(cert_ids_in(cert_mask([1, 3, 70])), [1, 3, 70])
+        self.assertEqual(cert_ids_in(0), [])
+
+
+class EligibilityTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+        self.member = Member.objects.create_member("jane@bro.com", MEMBER_RFID, timedelta(days=365))
+        self.member.promote_to_active()
+
+        self.climbing = Certification.objects.create(title="Climbing", requirements="Climb")
+        self.kayaking = Certification.objects.create(title="Kayaking", requirements="Paddle")
+
+        department = Department.objects.create(name="Climbing", description="Rocks")
+        pad = GearType.objects.create(name="Crash Pad", department=department)
+        self.rope = GearType.objects.create(name="Rope", department=department)
+        self.rope.min_required_certs.add(self.climbing)
+
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        self.pads = [Transaction.objects.add_gear(ADMIN_RFID, f"01000000{i:02}", pad, img)[1] for i in range(20)]
+        self.ropes = [Transaction.objects.add_gear(ADMIN_RFID, f"02000000{i:02}", self.rope, img)[1] for i in range(20)]
+
+    def test_split_by_eligibility(self):
+        gear = Gear.objects.filter(pk__in=[g.pk for g in self.pads + self.ropes])
+        eligible, ineligible = Gear.objects.split_by_eligibility(self.member, gear)
+        self.assertEqual({g.pk for g in eligible}, {g.pk for g in self.pads})
+        self.assertEqual({g.pk for g in ineligible}, {g.pk for g in self.ropes})
+
+        self.member.certifications.add(self.climbing)
+        eligible, ineligible = Gear.objects.split_by_eligibility(self.member, gear)
+        self.assertEqual((len(eligible), len(ineligible)), (40, 0))
+
+    def test_bulk_check_takes_no_queries(self):
+        gear = self.pads + self.ropes
+        Gear.objects.split_by_eligibility(self.member, gear[:2] + gear[-2:])
+        with self.assertNumQueries(0):
+            Gear.objects.split_by_eligibility(self.member, gear)
+
+    def test_requirements_change(self):
+        self.member.certifications.add(self.climbing)
+        self.assertFalse(self.ropes[0].get_missing_cert_mask(self.member))
+
+        self.rope.min_required_certs.add(self.kayaking)
+        self.assertEqual(self.ropes[0].get_missing_cert_mask(self.member), cert_mask([self.kayaking.pk]))
+
+        self.kayaking.delete()
+        self.assertFalse(self.ropes[0].get_missing_cert_mask(self.member))
+
+    def test_validate_required_certs(self):
+        with self.assertRaisesMessage(ValidationError, "Climbing"):
+            validate_required_certs(self.member, self.ropes[0])
+        validate_required_certs(self.member, self.pads[0])
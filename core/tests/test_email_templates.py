@@ -0,0 +1,49 @@
+from collections import namedtuple
+from datetime import date
+
+from core import email_templates
+from core.models.MemberModels import Member
+from django.test import SimpleTestCase
+
+FakeGear = namedtuple("FakeGear", ["name", "due_date"])
+
+
+class EmailTemplateTest(SimpleTestCase):
+    def test_compiled_once(self):
+        email_templates.get_template.cache_clear()
+        for _ in range(3):
+            email_templates.render("intro_email", finish_signup_url="http://localhost/finish")
+        info = email_templates.get_template.cache_info()
+        self.assertEqual((info.misses, info.hits), (1, 2))
+
+    def test_plain_text_is_not_escaped(self):
+        body = email_templates.render("intro_email", finish_signup_url="http://localhost/finish?a=1&b=2")
+        self.assertIn("\nhttp://localhost/finish?a=1&b=2\n", body)
+
+    def test_dates(self):
+        body = email_templates.render("expired_email", member_name="Jane Doe", today=date(2026, 10, 18))
+        self.assertTrue(body.startswith("Hi Jane Doe,"))
+        self.assertIn("As of today, 2026-10-18 your", body)
+
+    def test_missing_gear(self):
+        gear = [FakeGear("Skis <160cm>", date(2026, 10, 5)), FakeGear("Poles", date(2026, 10, 6))]
+        body = email_templates.render("missing_gear", first_name="Jane", all_gear=gear)
+        self.assertIn("<tr><td>Skis &lt;160cm&gt;</td><td>Mon, Oct 05, 2026</td></tr>", body)
+        self.assertIn("<tr><td>Poles</td><td>Tue, Oct 06, 2026</td></tr>", body)
+
+    def test_render_many(self):
+        contexts = [{"member_name": f"Member {i}", "today": date(2026, 10, i + 1)} for i in range(3)]
+        bodies = email_templates.render_many("expired_email", contexts)
+        self.assertEqual(bodies, [email_templates.render("expired_email", **context) for context in contexts])
+
+    def test_build_missing_gear_emails(self):
+        members_gear = [
+            (Member(email=f"member{i}@bro.com", first_name=f"Member{i}", last_name="Doe"),
+             [FakeGear(f"Rope {i}", date(2026, 10, 5))])
+            for i in range(3)
+        ]
+        emails = Member.build_missing_gear_emails(members_gear)
+        self.assertEqual([email.to_email for email in emails], [f"member{i}@bro.com" for i in range(3)])
+        self.assertIn("Hi Member2,", emails[2].body)
+        self.assertIn("<td>Rope 2</td>", emails[2].body)
+        self.assertNotIn("Rope 1", emails[2].body)
@@ -0,0 +1,112 @@
+import socket
+
+from aiosmtpd.controller import Controller
+from core import emailing
+from core.emailing import EmailTransport
+from django.test import SimpleTestCase, override_settings
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        return sock.getsockname()[1]
+
+
+class RecordingHandler:
+    """Stands in for the mail server, remembering every email along with the connection it arrived over"""
+
+    def __init__(self):
+        self.received = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received.append((session, envelope.mail_from, envelope.rcpt_tos, envelope.content.decode()))
+        return "250 OK"
+
+    @property
+    def connections(self):
+        sessions = []
+        for session, *_ in self.received:
+            if not any(session is seen for seen in sessions):
+                sessions.append(session)
+        return len(sessions)
+
+
+class EmailTransportTest(SimpleTestCase):
+    def setUp(self):
+        self.port = free_port()
+        self.handler = RecordingHandler()
+        self.server = None
+        self.start_server()
+        self.addCleanup(self.stop_server)
+
+        settings = override_settings(
+            EMAIL_HOST="localhost", EMAIL_PORT=self.port, EMAIL_USE_TLS=False, EMAIL_HOST_USER="gear@bro.com"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def start_server(self):
+        self.server = Controller(self.handler, hostname="localhost", port=self.port)
+        self.server.start()
+
+    def stop_server(self):
+        if self.server is not None:
+            self.server.stop()
+            self.server = None
+
+    def test_one_connection_for_many_emails(self):
+        with EmailTransport():
+            for i in range(5):
+                emailing.send_email([f"member{i}@bro.com"], "Overdue gear", "Please return it")
+
+        self.assertEqual(len(self.handler.received), 5)
+        self.assertEqual(self.handler.connections, 1)
+        self.assertEqual(self.handler.received[0][1:3], ("gear@bro.com", ["member0@bro.com"]))
+        self.assertIn("Subject: Overdue gear", self.handler.received[0][3])
+
+    def test_connection_per_sender(self):
+        with EmailTransport() as transport:
+            failures = transport.send_many([
+                {"to_emails": ["a@bro.com"], "title": "Hi", "body": "Gear"},
+                {"to_emails": ["b@bro.com"], "title": "Hi", "body": "Membership", "from_email": "membership@bro.com"},
+                {"to_emails": ["c@bro.com"], "title": "Hi", "body": "Gear"},
+            ])
+            self.assertEqual(set(transport.connections), {"gear@bro.com", "membership@bro.com"})
+
+        self.assertEqual(failures, [])
+        self.assertEqual([mail_from for _, mail_from, *_ in self.handler.received],
+                         ["gear@bro.com", "membership@bro.com", "gear@bro.com"])
+        self.assertEqual(self.handler.connections, 2)
+
+    def test_reconnect(self):
+        with EmailTransport() as transport:
+            transport.send(["a@bro.com"], "Hi", "Before")
+
+            # The mail server hangs up (i.e. after an idle timeout) and comes back
+            self.stop_server()
+            self.start_server()
+
+            transport.send(["b@bro.com"], "Hi", "After")
+
+        self.assertEqual([rcpt_tos for _, _, rcpt_tos, _ in self.handler.received], [["a@bro.com"], ["b@bro.com"]])
+        self.assertEqual(self.handler.connections, 2)
+
+    def test_send_many_reports_failures(self):
+        self.stop_server()
+        with EmailTransport() as transport:
+            failures = transport.send_many([{"to_emails": ["a@bro.com"], "title": "Hi", "body": "Gear"}])
+
+        self.assertEqual(len(failures), 1)
+        self.assertEqual(failures[0][0]["to_emails"], ["a@bro.com"])
+
+    def test_closed_on_exit(self):
+        with EmailTransport() as transport:
+            transport.send(["a@bro.com"], "Hi", "Gear")
+            smtp = transport.connections["gear@bro.com"].smtp
+        self.assertEqual(transport.connections, {})
+        self.assertIsNone(smtp.sock)
+
+    def test_send_without_transport(self):
+        emailing.send_email(["a@bro.com"], "Hi", "Gear")
+        emailing.send_email(["b@bro.com"], "Hi", "Gear")
+        self.assertEqual(self.handler.connections, 2)
@@ -0,0 +1,178 @@
+import threading
+
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.DepartmentModels import Department
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import Gear, GearConflict, GearType
+from core.models.MemberModels import Member
+from core.models.TransactionModels import Transaction
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, transaction as db_transaction
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils.timezone import localdate, timedelta
+from kiosk.CheckoutLogic import do_checkout
+
+ADMIN_RFID = "0000000000"
+GEAR_RFID = "0123456789"
+MEMBER_RFID = "1111111111"
+
+
+def build_gear():
+    department = Department.objects.create(name="Skiing", description="Snow")
+    geartype = GearType.objects.create(name="Skis", department=department)
+    img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+    _, gear = Transaction.objects.add_gear(ADMIN_RFID, GEAR_RFID, geartype, img)
+    return gear
+
+
+class GearVersionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+        self.member = Member.objects.create_member("jane@bro.com", MEMBER_RFID, timedelta(days=365))
+        self.member.promote_to_active()
+        self.gear = build_gear()
+
+    def test_version_increases_with_each_transaction(self):
+        version = Gear.objects.get(rfid=GEAR_RFID).version
+        do_checkout(ADMIN_RFID, MEMBER_RFID, GEAR_RFID)
+        Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID)
+        Transaction.objects.break_gear(ADMIN_RFID, GEAR_RFID, "Delaminated")
+        Transaction.objects.fix_gear(ADMIN_RFID, GEAR_RFID, "Glued", "Joe")
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID).version, version + 4)
+
+    def test_stale_save_rejected(self):
+        stale = Gear.objects.get(rfid=GEAR_RFID)
+        do_checkout(ADMIN_RFID, MEMBER_RFID, GEAR_RFID)
+
+        stale.status = 2
+        with self.assertRaises(GearConflict), db_transaction.atomic():
+            stale.save()
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual((gear.status, gear.checked_out_to), (1, self.member))
+
+    def test_expected_version(self):
+        version = Gear.objects.get(rfid=GEAR_RFID).version
+        Transaction.objects.break_gear(ADMIN_RFID, GEAR_RFID, "Delaminated")
+        with self.assertRaises(GearConflict):
+            Transaction.objects.fix_gear(ADMIN_RFID, GEAR_RFID, "Glued", "Joe", version=version)
+        self.assertEqual(Transaction.objects.filter(type="Fix").count(), 0)
+
+    def test_invalid_transitions_rejected(self):
+        with self.assertRaises(ValidationError):
+            Transaction.objects.fix_gear(ADMIN_RFID, GEAR_RFID, "Glued", "Joe")
+        with self.assertRaises(ValidationError):
+            Transaction.objects.missing_gear(ADMIN_RFID, GEAR_RFID)
+        with self.assertRaises(ValidationError):
+            Transaction.objects.expire_gear(ADMIN_RFID, GEAR_RFID)
+        self.assertTrue(Gear.objects.get(rfid=GEAR_RFID).is_available())
+
+    def test_check_in_rejected_unless_out(self):
+        do_checkout(ADMIN_RFID, MEMBER_RFID, GEAR_RFID)
+        Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID)
+        with self.assertRaises(ValidationError):
+            Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID)
+
+        Transaction.objects.delete_gear(ADMIN_RFID, GEAR_RFID, "Lost at sea")
+        with self.assertRaises(ValidationError):
+            Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID)
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID).status, 5)
+        self.assertEqual(Transaction.objects.filter(type="CheckIn").count(), 1)
+
+    def admin_change_data(self):
+        """Open the admin change page of the gear, returning its url and the data its form would post"""
+        self.client.force_login(Member.objects.get(rfid=ADMIN_RFID))
+        url = reverse("admin:core_gear_change", args=[self.gear.pk])
+        form = self.client.get(url).context["adminform"].form
+        data = {name: form[name].value() for name, field in form.fields.items() if not field.disabled}
+        return url, {name: "" if value is None else value for name, value in data.items()}
+
+    def test_admin_change(self):
+        url, data = self.admin_change_data()
+        data["status"] = 2
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID).status, 2)
+        self.assertEqual(Transaction.objects.filter(type="Override").count(), 1)
+
+    def test_admin_change_of_stale_gear_rejected(self):
+        """Gear checked out at a kiosk while its admin page was open must not be reverted by saving the page"""
+        url, data = self.admin_change_data()
+        do_checkout(ADMIN_RFID, MEMBER_RFID, GEAR_RFID)
+
+        response = self.client.post(url, data)
+        self.assertContains(response, "was changed by someone else")
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual((gear.status, gear.checked_out_to), (1, self.member))
+        self.assertEqual(Transaction.objects.filter(type="Override").count(), 0)
+
+    def test_override_of_stale_version_rejected(self):
+        version = Gear.objects.get(rfid=GEAR_RFID).version
+        do_checkout(ADMIN_RFID, MEMBER_RFID, GEAR_RFID)
+        with self.assertRaises(GearConflict):
+            Transaction.objects.override(ADMIN_RFID, GEAR_RFID, version=version, status=0, checked_out_to=None)
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID).status, 1)
+
+    def test_missing_after_check_in_rejected(self):
+        """Gear that is checked in between being found overdue and being set missing must stay in stock"""
+        Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, localdate() - timedelta(days=1))
+        overdue = Gear.objects.get(rfid=GEAR_RFID)
+        Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID)
+
+        with self.assertRaises(GearConflict):
+            Transaction.objects.missing_gear(ADMIN_RFID, GEAR_RFID, version=overdue.version)
+        self.assertTrue(Gear.objects.get(rfid=GEAR_RFID).is_available())
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    """Scans made at the same time from many kiosks, each of which runs in its own thread and database connection"""
+
+    num_scans = 50
+
+    def setUp(self):
+        build_permissions()
+        Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+        self.members = []
+        for i in range(self.num_scans):
+            member = Member.objects.create_member(f"member{i}@bro.com", f"{i + 1:010d}", timedelta(days=365))
+            member.promote_to_active()
+            self.members.append(member)
+        build_gear()
+
+    def test_no_double_checkout(self):
+        barrier = threading.Barrier(self.num_scans)
+        lock = threading.Lock()
+        succeeded = []
+        rejected = []
+
+        def scan(member):
+            try:
+                barrier.wait()
+                do_checkout(ADMIN_RFID, member.rfid, GEAR_RFID)
+            except ValidationError:
+                with lock:
+                    rejected.append(member)
+            except DatabaseError:
+                # SQLite has no row locks, and refuses concurrent writers outright instead of making them wait
+                with lock:
+                    rejected.append(member)
+            else:
+                with lock:
+                    succeeded.append(member)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=scan, args=(member,)) for member in self.members]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(succeeded), 1)
+        self.assertEqual(len(rejected), self.num_scans - 1)
+        self.assertEqual(Transaction.objects.filter(type="CheckOut").count(), 1)
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual((gear.status, gear.checked_out_to), (1, succeeded[0]))
@@ -0,0 +1,258 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.CacheModels import CacheVersion
+from core.models.DepartmentModels import Department
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import CustomDataField, Gear, GearAttribute, GearType, gear_schema_cache
+from core.models.MemberModels import Member
+from core.models.TransactionModels import Transaction
+from django.core.exceptions import FieldError
+from django.test import TestCase
+from django.urls import reverse
+
+ADMIN_RFID = "0000000000"
+GEAR_RFID = "0123456789"
+
+
+class GearDataTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        self.geartype = GearType.objects.create(name="Skis", department=department)
+        length = CustomDataField.objects.create(
+            name="length", label="Length", data_type="int", suffix="cm"
+        )
+        brand = CustomDataField.objects.create(
+            name="brand", label="Brand", data_type="string"
+        )
+        self.geartype.data_fields.add(length, brand)
+
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+
+        Transaction.objects.add_gear(
+            ADMIN_RFID,
+            GEAR_RFID,
+            self.geartype,
+            img,
+            length=170,
+            brand="Rossignol",
+        )
+
+    def test_custom_attributes(self):
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual(gear.length, 170)
+        self.assertEqual(gear.brand, "Rossignol")
+        with self.assertRaises(AttributeError):
+            gear.not_a_field
+
+    def test_name(self):
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual(gear.name, "Skis - 170 cm, Rossignol")
+
+    def test_repeated_access_does_not_query(self):
+        """Once the schema of the geartype is loaded, reading custom attributes should not touch the database"""
+        gear = Gear.objects.select_related("geartype").get(rfid=GEAR_RFID)
+        gear.name
+        with self.assertNumQueries(0):
+            gear.name
+            gear.length
+            gear.brand
+            gear.get_display_gear_data()
+
+    def test_only_values_stored(self):
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual(gear.gear_data, {"length": 170, "brand": "Rossignol"})
+
+    def test_assigning_gear_data(self):
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual(gear.length, 170)
+
+        gear.gear_data = dict(gear.get_gear_data(), length=180)
+
+        self.assertEqual(gear.length, 180)
+        self.assertEqual(gear.build_name(), "Skis - 180 cm, Rossignol")
+
+    def test_display_name_stored_on_save(self):
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual(gear.display_name, "Skis - 170 cm, Rossignol")
+
+        gear.gear_data = dict(gear.get_gear_data(), length=180)
+        gear.save()
+
+        self.assertTrue(Gear.objects.filter(display_name="Skis - 180 cm, Rossignol").exists())
+
+    def test_display_name_follows_schema(self):
+        """Renaming the gear type or changing its fields should update the stored names"""
+        self.geartype.name = "Alpine Skis"
+        self.geartype.save()
+        self.assertEqual(
+            Gear.objects.get(rfid=GEAR_RFID).display_name, "Alpine Skis - 170 cm, Rossignol"
+        )
+
+        self.geartype.data_fields.remove(CustomDataField.objects.get(name="brand"))
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID).display_name, "Alpine Skis - 170 cm")
+
+
+class GearSchemaCacheTest(TestCase):
+    def setUp(self):
+        department = Department.objects.create(name="Climbing", description="Rocks")
+        self.geartype = GearType.objects.create(name="Shoes", department=department)
+        self.size = CustomDataField.objects.create(
+            name="size",
+            label="Size",
+            data_type="choice",
+            choices="S; Small\nM; Medium\nL; Large",
+        )
+        self.geartype.data_fields.add(self.size)
+
+    def test_schema_shared_between_instances(self):
+        """Loading the schema through one instance should make it available to all others without queries"""
+        self.geartype.get_schema()
+        other_instance = GearType.objects.get(pk=self.geartype.pk)
+        with self.assertNumQueries(0):
+            schema = other_instance.get_schema()
+        self.assertEqual(list(schema.fields.keys()), ["size"])
+        self.assertEqual(schema.choices["size"]["M"], "Medium")
+
+    def test_adding_field_invalidates_schema(self):
+        self.assertEqual(self.geartype.get_field_names(), ["size"])
+        color = CustomDataField.objects.create(name="color", label="Color", data_type="string")
+        self.geartype.data_fields.add(color)
+        self.assertEqual(self.geartype.get_field_names(), ["size", "color"])
+
+    def test_removing_field_invalidates_schema(self):
+        self.assertEqual(self.geartype.get_field_names(), ["size"])
+        self.geartype.data_fields.remove(self.size)
+        self.assertEqual(self.geartype.get_field_names(), [])
+
+    def test_other_process_invalidation(self):
+        """A version bump made by another process should be noticed on the next check"""
+        self.geartype.get_schema()
+        CacheVersion.objects.bump("gear_schema")
+        gear_schema_cache.sync(force=True)
+        with self.assertNumQueries(1):
+            self.geartype.get_schema()
+
+
+class GearDataQueryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.admin = Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        self.geartype = GearType.objects.create(name="Skis", department=department)
+        length = CustomDataField.objects.create(name="length", label="Length", data_type="int")
+        size = CustomDataField.objects.create(
+            name="size", label="Size", data_type="choice", choices="S; Small\nM; Medium\nL; Large"
+        )
+        self.geartype.data_fields.add(length, size)
+
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        for i, (length, size) in enumerate([(150, "S"), (165, "M"), (170, "M"), (185, "L")]):
+            Transaction.objects.add_gear(
+                ADMIN_RFID, f"{1000000000 + i}", self.geartype, img, length=length, size=size
+            )
+
+    def lengths(self, queryset):
+        return sorted(gear.length for gear in queryset)
+
+    def test_contains(self):
+        self.assertEqual(self.lengths(Gear.objects.filter(gear_data__contains={"size": "M"})), [165, 170])
+        self.assertEqual(
+            self.lengths(Gear.objects.filter(gear_data__contains={"size": "M", "length": 170})), [170]
+        )
+
+    def test_key_comparisons(self):
+        self.assertEqual(self.lengths(Gear.objects.filter(gear_data__length__gte=170)), [170, 185])
+        self.assertEqual(self.lengths(Gear.objects.filter(gear_data__length__lt=165)), [150])
+        self.assertEqual(self.lengths(Gear.objects.filter(gear_data__size="L")), [185])
+
+    def test_admin_search_expressions(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:core_gear_changelist")
+
+        response = self.client.get(url, {"q": "length >= 170", "all": ""})
+        self.assertEqual(self.lengths(response.context["cl"].result_list), [170, 185])
+
+        response = self.client.get(url, {"q": "size = M", "all": ""})
+        self.assertEqual(self.lengths(response.context["cl"].result_list), [165, 170])
+
+    def test_admin_choice_filter(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:core_gear_changelist")
+
+        response = self.client.get(url, {"geartype__id__exact": self.geartype.pk, "data_size": "S", "all": ""})
+        self.assertEqual(self.lengths(response.context["cl"].result_list), [150])
+
+
+class GearAttributeTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.admin = Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        self.geartype = GearType.objects.create(name="Skis", department=department)
+        self.length = CustomDataField.objects.create(name="length", label="Length", data_type="int")
+        self.brand = CustomDataField.objects.create(name="brand", label="Brand", data_type="string")
+        self.geartype.data_fields.add(self.length, self.brand)
+
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        for i, (length, brand) in enumerate([(150, "K2"), (160, "Atomic"), (170, "K2"), (185, None)]):
+            Transaction.objects.add_gear(
+                ADMIN_RFID, f"{1000000000 + i}", self.geartype, img, length=length, brand=brand
+            )
+
+    def lengths(self, queryset):
+        return sorted(gear.length for gear in queryset)
+
+    def test_attributes_indexed_on_create(self):
+        self.assertEqual(GearAttribute.objects.filter(field=self.length).count(), 4)
+        # Empty values are not indexed
+        self.assertEqual(GearAttribute.objects.filter(field=self.brand).count(), 3)
+        attribute = GearAttribute.objects.get(gear__rfid="1000000002", field=self.length)
+        self.assertEqual(attribute.int_value, 170)
+        self.assertIsNone(attribute.str_value)
+
+    def test_with_attr(self):
+        self.assertEqual(self.lengths(Gear.objects.with_attr(length__range=(160, 170))), [160, 170])
+        self.assertEqual(self.lengths(Gear.objects.with_attr(brand="K2")), [150, 170])
+        self.assertEqual(self.lengths(Gear.objects.with_attr(brand="K2", length__gt=160)), [170])
+        self.assertEqual(self.lengths(Gear.objects.filter(status=0).with_attr(length__lt="160")), [150])
+
+    def test_unknown_field(self):
+        with self.assertRaises(FieldError):
+            Gear.objects.with_attr(width=5)
+
+    def test_override_reindexes(self):
+        gear = Gear.objects.get(rfid="1000000000")
+        Transaction.objects.override(
+            ADMIN_RFID, gear.rfid, gear_data=dict(gear.gear_data, length=165), length=165, brand="K2"
+        )
+        self.assertEqual(self.lengths(Gear.objects.with_attr(length=165)), [165])
+
+    def test_removed_field_unindexed(self):
+        self.geartype.data_fields.remove(self.brand)
+        self.assertFalse(GearAttribute.objects.filter(field=self.brand).exists())
+        self.assertEqual(GearAttribute.objects.filter(field=self.length).count(), 4)
+
+    def test_rebuild(self):
+        GearAttribute.objects.all().delete()
+        self.assertEqual(GearAttribute.objects.rebuild(), 7)
+        self.assertEqual(self.lengths(Gear.objects.with_attr(length__gte=170)), [170, 185])
+
+    def test_admin_attribute_filter(self):
+        self.client.force_login(self.admin)
+        url = reverse("admin:core_gear_changelist")
+
+        response = self.client.get(url, {"geartype__id__exact": self.geartype.pk, "attr_length": "160", "all": ""})
+        self.assertEqual(self.lengths(response.context["cl"].result_list), [160])
@@ -0,0 +1,124 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.DepartmentModels import Department
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import Gear, GearType
+from core.models.MemberModels import Member
+from core.models.SnapshotModels import GearSnapshot, GearState
+from core.models.TransactionModels import Transaction
+from django.utils.timezone import localdate, now, timedelta
+from django.test import TestCase
+
+ADMIN_RFID = "0000000000"
+MEMBER_RFID = "1111111111"
+GEAR_RFID = "0123456789"
+OTHER_RFID = "0123456780"
+
+
+class GearReplayTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.admin = Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+        self.member = Member.objects.create_member("jane@bro.com", MEMBER_RFID, timedelta(days=365))
+        self.member.promote_to_active()
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        geartype = GearType.objects.create(name="Skis", department=department)
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        _, self.gear = Transaction.objects.add_gear(ADMIN_RFID, GEAR_RFID, geartype, img)
+        _, self.other_gear = Transaction.objects.add_gear(ADMIN_RFID, OTHER_RFID, geartype, img)
+        self.due = localdate() + timedelta(days=7)
+
+    def actual_state(self, gear):
+        gear = Gear.objects.get(pk=gear.pk)
+        return GearState(gear.status, gear.checked_out_to_id, gear.due_date.isoformat() if gear.due_date else None)
+
+    def test_state_at_any_time(self):
+        history = []
+        steps = [
+            lambda: Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, self.due),
+            lambda: Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID),
+            lambda: Transaction.objects.break_gear(ADMIN_RFID, GEAR_RFID, "Delaminated"),
+            lambda: Transaction.objects.fix_gear(ADMIN_RFID, GEAR_RFID, "Glued", "Joe"),
+            lambda: Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, self.due),
+        ]
+        for step in steps:
+            transaction, _ = step()
+            history.append((transaction.timestamp, self.actual_state(self.gear)))
+
+        for timestamp, state in history:
+            self.assertEqual(GearSnapshot.objects.state_at(timestamp)[self.gear.pk], state)
+        self.assertEqual(GearSnapshot.objects.state_at(history[0][0])[self.other_gear.pk], GearState(0, None, None))
+
+        before_any = Transaction.objects.order_by("timestamp").first().timestamp - timedelta(seconds=1)
+        self.assertEqual(GearSnapshot.objects.state_at(before_any), {})
+
+    def test_replay_starts_at_snapshot(self):
+        Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, self.due)
+        snapshot = GearSnapshot.objects.take(now())
+        self.assertEqual(snapshot.get_state()[self.gear.pk], GearState(1, self.member.pk, self.due.isoformat()))
+
+        # Anything recorded in the snapshot is taken as is, only the later transactions are replayed on top of it
+        snapshot.state[str(self.other_gear.pk)] = [2, None, None]
+        snapshot.save()
+        transaction, _ = Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID)
+
+        state = GearSnapshot.objects.state_at(transaction.timestamp)
+        self.assertEqual(state[self.other_gear.pk], GearState(2, None, None))
+        self.assertEqual(state[self.gear.pk], GearState(0, None, None))
+        self.assertEqual(GearSnapshot.objects.nearest(transaction.timestamp), snapshot)
+
+    def test_no_drift_after_transactions(self):
+        Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, self.due)
+        Transaction.objects.make_checkout_many(ADMIN_RFID, MEMBER_RFID, [OTHER_RFID], self.due)
+        GearSnapshot.objects.take(now())
+        Transaction.objects.break_gear(ADMIN_RFID, OTHER_RFID, "Snapped")
+        Transaction.objects.delete_gear(ADMIN_RFID, OTHER_RFID, "Beyond repair")
+        self.assertEqual(GearSnapshot.objects.find_drift(), [])
+
+    def test_override_is_replayed(self):
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        Transaction.objects.override(
+            ADMIN_RFID, GEAR_RFID, status=1, checked_out_to=self.member, due_date=self.due, gear_data=gear.gear_data
+        )
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+
+        self.assertEqual(GearSnapshot.objects.find_drift(), [])
+        self.assertEqual(GearSnapshot.objects.state_at()[gear.pk], GearState(1, self.member.pk, self.due.isoformat()))
+
+    def test_override_of_gear_data_is_not_replayed(self):
+        # Gear data is free text, which must not be taken for a change of the state of the gear
+        Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, self.due)
+        gear_data = dict(self.gear.gear_data, notes="Changed checked_out_to from me")
+        transaction, _ = Transaction.objects.override(ADMIN_RFID, GEAR_RFID, status=3, gear_data=gear_data)
+
+        self.assertIsNone(transaction.member)
+        self.assertTrue(transaction.comments.endswith(f"Changed data notes from None to {gear_data['notes']};"))
+        self.assertEqual(GearSnapshot.objects.find_drift(), [])
+        state = GearState(3, self.member.pk, self.due.isoformat())
+        self.assertEqual(GearSnapshot.objects.state_at()[self.gear.pk], state)
+
+    def test_override_of_gear_data_named_like_the_gear_is_not_replayed(self):
+        Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, self.due)
+        gear_data = dict(
+            self.gear.gear_data,
+            status=5,
+            due_date=(self.due + timedelta(days=30)).isoformat(),
+            notes="Fine; Changed status from 1 to 5;\nChanged checked_out_to from me to you;",
+        )
+        transaction, _ = Transaction.objects.override(ADMIN_RFID, GEAR_RFID, gear_data=gear_data)
+
+        self.assertIn("Changed data status from None to 5;", transaction.comments)
+        self.assertEqual(GearSnapshot.objects.find_drift(), [])
+        state = GearState(1, self.member.pk, self.due.isoformat())
+        self.assertEqual(GearSnapshot.objects.state_at()[self.gear.pk], state)
+
+    def test_drift_reported(self):
+        Gear.objects.filter(pk=self.gear.pk).update(status=3)
+        drift = GearSnapshot.objects.find_drift()
+        self.assertEqual(len(drift), 1)
+        self.assertEqual(drift[0].gear_pk, self.gear.pk)
+        self.assertEqual(drift[0].replayed, GearState(0, None, None))
+        self.assertEqual(drift[0].actual, GearState(3, None, None))
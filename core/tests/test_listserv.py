@@ -0,0 +1,232 @@
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+from helper_scripts.build_permissions import build_all as build_permissions
+from helper_scripts.listserv_interface import (
+    HttpListservTransport,
+    ListservError,
+    ListservTransport,
+    SeleniumListservTransport,
+    get_active_emails,
+    run_update,
+    sync,
+)
+from core.models.ListservModels import ListservSubscriber
+from core.models.MemberModels import Member
+from django.core import mail
+from django.test import TestCase
+from django.utils.timezone import timedelta
+
+LOGIN_PAGE = """<html><body>
+<form action="/wa" method="post">
+  <input type="hidden" name="LOGIN1" value="">
+  <p><input type="text" name="Y" id="Email Address"> <input type="password" name="p" id="Password"></p>
+  <input type="submit" name="e" value="Log In">
+</form>
+</body></html>"""
+
+UPLOAD_PAGE = """<html><body>
+<p class="message">{message}</p>
+<form action="/wa?BULKOP" method="post" enctype="multipart/form-data">
+  <input type="hidden" name="L" value="CLIMBING-CLUB">
+  {options}
+  <input type="file" name="FILE" id="Input File">
+  <input type="submit" name="a" value="Import">
+</form>
+</body></html>"""
+
+ALL_OPTIONS = """
+  <input type="radio" name="OP" id="radioa" value="ADD">
+  <input type="radio" name="OP" id="radiob" value="REPLACE" checked>
+  <input type="radio" name="OP" id="radioc" value="DELETE">
+"""
+
+REPLACE_ONLY = """<input type="radio" name="OP" id="radiob" value="REPLACE" checked>"""
+
+RESULTS = {"ADD": "added", "DELETE": "deleted", "REPLACE": "replaced"}
+
+
+class FakeListserv(BaseHTTPRequestHandler):
+    """The login and bulk upload pages of the listserv, applying the uploads to the server's subscribers"""
+
+    def log_message(self, *args):
+        pass
+
+    def upload_page(self, message):
+        return UPLOAD_PAGE.format(message=message, options=self.server.options)
+
+    def respond(self, page, cookie=None):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        if cookie:
+            self.send_header("Set-Cookie", cookie)
+        self.end_headers()
+        self.wfile.write(page.encode())
+
+    def do_GET(self):
+        self.respond(LOGIN_PAGE)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        if self.path == "/wa":
+            form = parse_qs(body.decode(), keep_blank_values=True)
+            if form["Y"] == [self.server.username] and form["p"] == [self.server.password] and "LOGIN1" in form:
+                self.respond(self.upload_page("Logged in"), cookie="session=secret")
+            else:
+                self.respond(LOGIN_PAGE.replace("<form", '<p class="message">Wrong password</p><form'))
+            return
+
+        if "session=secret" not in self.headers.get("Cookie", ""):
+            self.respond(LOGIN_PAGE)
+            return
+        headers = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        form = {
+            part.get_param("name", header="content-disposition"): part.get_content()
+            for part in BytesParser(policy=HTTP).parsebytes(headers + body).iter_parts()
+        }
+        operation, emails = form["OP"], set(form["FILE"].split())
+        if self.server.broken:
+            self.respond(self.upload_page("Error: the uploaded file could not be read"))
+            return
+        if self.server.answer:
+            self.respond(self.upload_page(self.server.answer))
+            return
+
+        self.server.uploads.append((operation, emails))
+        if operation == "ADD":
+            self.server.subscribers |= emails
+        elif operation == "DELETE":
+            self.server.subscribers -= emails
+        else:
+            self.server.subscribers = emails
+        self.respond(self.upload_page(f"{len(emails)} addresses {RESULTS[operation]}"))
+
+
+class FailingTransport(ListservTransport):
+    def push(self, operation, emails):
+        raise ListservError("The listserv is down")
+
+
+class ListservSyncTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("localhost", 0), FakeListserv)
+        cls.server.username, cls.server.password = "board@bro.com", "hunter2"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        self.server.uploads = []
+        self.server.subscribers = {"old@bro.com"}
+        self.server.options, self.server.broken, self.server.answer = ALL_OPTIONS, False, None
+        self.members = [
+            Member.objects.create_member(f"member{i}@bro.com", f"{i + 1:010d}", timedelta(days=365)) for i in range(5)
+        ]
+        for member in self.members:
+            member.move_to_group("Member")
+
+    def transport(self, password="hunter2"):
+        return HttpListservTransport(f"http://localhost:{self.server.server_port}/login", "board@bro.com", password)
+
+    def test_first_sync_replaces_everyone(self):
+        with self.transport() as transport:
+            self.assertEqual(sync(transport), ["5 addresses replaced"])
+        self.assertEqual(self.server.subscribers, set(get_active_emails()))
+        self.assertEqual(set(ListservSubscriber.objects.values_list("email", flat=True)), self.server.subscribers)
+
+    def test_only_changes_are_pushed(self):
+        with self.transport() as transport:
+            sync(transport)
+        self.server.uploads = []
+
+        self.members[0].expire()
+        Member.objects.create_member("new@bro.com", "0000000099", timedelta(days=365)).move_to_group("Member")
+        with self.transport() as transport:
+            self.assertEqual(sync(transport), ["1 addresses deleted", "1 addresses added"])
+        self.assertEqual(self.server.uploads, [("DELETE", {"member0@bro.com"}), ("ADD", {"new@bro.com"})])
+        self.assertEqual(self.server.subscribers, set(get_active_emails()))
+
+        # Nothing changed since, so the listserv is not even logged in to
+        self.server.uploads = []
+        with self.transport() as transport:
+            self.assertEqual(sync(transport), [])
+        self.assertEqual(self.server.uploads, [])
+
+    def test_failed_upload_not_recorded(self):
+        ListservSubscriber.objects.record_added(["member0@bro.com", "gone@bro.com"])
+        self.server.broken = True
+        with self.assertRaisesMessage(ListservError, "could not be read"):
+            with self.transport() as transport:
+                sync(transport)
+        pushed = set(ListservSubscriber.objects.values_list("email", flat=True))
+        self.assertEqual(pushed, {"member0@bro.com", "gone@bro.com"})
+
+    def test_unconfirmed_upload_not_recorded(self):
+        answers = ["0 addresses added", "0 addresses replaced", "Error: 3 addresses could not be removed"]
+        for answer in answers:
+            with self.subTest(answer=answer):
+                self.server.answer = answer
+                with self.assertRaises(ListservError):
+                    with self.transport() as transport:
+                        sync(transport)
+                self.assertFalse(ListservSubscriber.objects.exists())
+
+        # Nor is an add that the listserv did not make, when only the changes are pushed
+        ListservSubscriber.objects.record_added(["member0@bro.com", "member1@bro.com"])
+        self.server.answer = "0 addresses added"
+        with self.assertRaises(ListservError):
+            with self.transport() as transport:
+                sync(transport)
+        pushed = set(ListservSubscriber.objects.values_list("email", flat=True))
+        self.assertEqual(pushed, {"member0@bro.com", "member1@bro.com"})
+
+    def test_replaces_everyone_without_add_and_remove(self):
+        ListservSubscriber.objects.record_added(["member0@bro.com", "gone@bro.com"])
+        self.server.options = REPLACE_ONLY
+        with self.assertLogs("helper_scripts.listserv_interface", "WARNING"):
+            with self.transport() as transport:
+                self.assertEqual(sync(transport), ["5 addresses replaced"])
+        self.assertEqual(self.server.subscribers, set(get_active_emails()))
+        self.assertEqual(set(ListservSubscriber.objects.values_list("email", flat=True)), self.server.subscribers)
+
+    def test_full_sync(self):
+        ListservSubscriber.objects.record_added(["member0@bro.com", "gone@bro.com"])
+        with self.transport() as transport:
+            sync(transport, full=True)
+        self.assertEqual([operation for operation, _ in self.server.uploads], ["REPLACE"])
+        self.assertFalse(ListservSubscriber.objects.filter(email="gone@bro.com").exists())
+
+    def test_wrong_password(self):
+        with self.assertRaisesMessage(ListservError, "Wrong password"):
+            with self.transport(password="hunter3") as transport:
+                sync(transport)
+        self.assertFalse(ListservSubscriber.objects.exists())
+        self.assertEqual(self.server.subscribers, {"old@bro.com"})
+
+    def test_falls_back_to_next_transport(self):
+        with self.assertLogs("helper_scripts.listserv_interface", "WARNING"):
+            messages = run_update(transports=[FailingTransport(), self.transport()])
+        self.assertEqual(messages, ["5 addresses replaced"])
+        self.assertEqual(mail.outbox[-1].subject, "Listserv Updated")
+
+        with self.assertRaises(ListservError):
+            run_update(full=True, transports=[FailingTransport()])
+
+    def test_selenium_errors_are_listserv_errors(self):
+        # Whether Selenium is missing or Firefox can not get through, the error is a ListservError
+        transport = SeleniumListservTransport("http://localhost:1/login", "board@bro.com", "hunter2", timeout=1)
+        with self.assertRaises(ListservError), transport:
+            transport.replace(["member0@bro.com"])
@@ -0,0 +1,89 @@
+from unittest import mock
+
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.EmailModels import OutboundEmail
+from core.models.MemberModels import Member
+from django.test import TestCase
+from django.utils.timezone import localdate, timedelta
+
+
+class MemberExpiryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.today = localdate()
+        self.members = {}
+        expiry_dates = {
+            "expired": self.today - timedelta(days=1),
+            "expiring": self.today + timedelta(days=7),
+            "current": self.today + timedelta(days=30),
+        }
+        for i, (name, date_expires) in enumerate(expiry_dates.items()):
+            member = Member.objects.create_member(f"{name}@bro.com", f"{i + 1:010d}", timedelta(days=365))
+            member.promote_to_active()
+            Member.objects.filter(pk=member.pk).update(date_expires=date_expires)
+            self.members[name] = member
+
+        staffer = Member.objects.create_member("staffer@bro.com", "0000000009", timedelta(days=365))
+        staffer.move_to_group("Staff")
+        Member.objects.filter(pk=staffer.pk).update(date_expires=self.today - timedelta(days=1))
+        self.members["staffer"] = staffer
+
+    def reload(self, name):
+        return Member.objects.get(pk=self.members[name].pk)
+
+    def test_expire_all(self):
+        expired = Member.objects.expire_all()
+        self.assertEqual(expired, [self.members["expired"]])
+
+        member = self.reload("expired")
+        self.assertEqual(member.group, "Expired")
+        self.assertEqual(list(member.groups.values_list("name", flat=True)), ["Expired"])
+        self.assertFalse(member.is_active_member)
+        for name in ("expiring", "current", "staffer"):
+            self.assertNotEqual(self.reload(name).group, "Expired")
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.to_email, email.subject), ("expired@bro.com", "Climbing Club Membership Expired!"))
+        self.assertIsNone(email.sent_at)
+
+    def test_expire_all_query_count(self):
+        for i in range(20):
+            member = Member.objects.create_member(f"late{i}@bro.com", f"{i + 100:010d}", timedelta(days=365))
+            Member.objects.filter(pk=member.pk).update(date_expires=self.today - timedelta(days=1))
+
+        # The members, the group, their pks, the group links, the group shortcut and the emails, plus the savepoints
+        with self.assertNumQueries(11):
+            self.assertEqual(len(Member.objects.expire_all()), 21)
+        self.assertEqual(OutboundEmail.objects.count(), 21)
+
+    def test_warn_expiring(self):
+        self.assertEqual(Member.objects.warn_expiring(), [self.members["expiring"]])
+        self.assertEqual(OutboundEmail.objects.get().subject, "Climbing Club Membership Expiring Soon!")
+
+    def test_renew(self):
+        quarter = timedelta(days=90)
+        renewed = Member.objects.filter(email__in=["expired@bro.com", "current@bro.com"]).renew(quarter)
+        self.assertEqual(renewed, 2)
+
+        self.assertEqual(self.reload("expired").date_expires, self.today + quarter)
+        self.assertEqual(self.reload("current").date_expires, self.today + timedelta(days=30) + quarter)
+        self.assertEqual(self.reload("expiring").date_expires, self.today + timedelta(days=7))
+        self.assertEqual(list(self.reload("expired").groups.values_list("name", flat=True)), ["Just Joined"])
+
+    def test_send_queued(self):
+        Member.objects.expire_all()
+        Member.objects.warn_expiring()
+
+        def send_email(to_emails, *args, **kwargs):
+            if to_emails == ["expiring@bro.com"]:
+                raise ConnectionError
+
+        with mock.patch("core.emailing.send_email", side_effect=send_email):
+            self.assertEqual(OutboundEmail.objects.send_queued(), 1)
+        self.assertEqual(OutboundEmail.objects.get(sent_at__isnull=False).to_email, "expired@bro.com")
+
+        # The email that failed to send stays in the queue
+        self.assertEqual(OutboundEmail.objects.filter(sent_at=None).get().to_email, "expiring@bro.com")
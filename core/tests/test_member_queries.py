@@ -0,0 +1,56 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.MemberModels import Member
+from django.contrib.auth.models import Group, Permission
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.timezone import timedelta
+
+
+class MemberQuerySetTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.admin = Member.objects.create_superuser("john@bro.com", "0000000000", "pass")
+        renters = Group.objects.create(name="Renters")
+        renters.permissions.add(Permission.objects.get(codename="rent_gear"))
+        Group.objects.create(name="Nobodies")
+
+        self.members = {}
+        for i, group in enumerate(["Member", "Staff", "Renters", "Nobodies"]):
+            member = Member.objects.create_member(f"{group}@bro.com", f"{i + 1:010d}", timedelta(days=365))
+            member.move_to_group(group)
+            self.members[group] = member
+
+        self.banished = Member.objects.create_member("banished@bro.com", "0000000009", timedelta(days=365))
+        self.banished.move_to_group("Member")
+        self.banished.is_active = False
+        self.banished.save()
+
+    def assertMatchesPython(self, queryset, permission_name):
+        expected = {member for member in Member.objects.all() if member.has_permission(permission_name)}
+        self.assertEqual(set(queryset), expected)
+
+    def test_active(self):
+        self.assertMatchesPython(Member.objects.active(), "core.is_active_member")
+        self.assertNotIn(self.members["Nobodies"], Member.objects.active())
+        self.assertNotIn(self.banished, Member.objects.active())
+
+    def test_can_rent(self):
+        self.assertMatchesPython(Member.objects.can_rent(), "core.rent_gear")
+        self.assertIn(self.members["Renters"], Member.objects.can_rent())
+        self.assertNotIn(self.members["Nobodies"], Member.objects.can_rent())
+
+    def test_staffers(self):
+        self.assertEqual(set(Member.objects.staffers()), {self.admin, self.members["Staff"]})
+
+    def test_single_query(self):
+        with self.assertNumQueries(1):
+            list(Member.objects.active().values_list("email", flat=True))
+
+    def test_active_member_view(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("api:all_active_members"))
+        self.assertNotIn("Nobodies@bro.com\n", response.context["emails"])
+        self.assertIn("Member@bro.com\n", response.context["emails"])
@@ -0,0 +1,103 @@
+import threading
+import time
+from unittest import mock
+
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.EmailModels import MAX_ATTEMPTS, OutboundEmail, retry_delay
+from core.models.MemberModels import Member, Staffer
+from django.test import TestCase
+from django.utils.timezone import now, timedelta
+
+
+class OutboxTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def queue(self, count):
+        return [
+            OutboundEmail.objects.queue(f"member{i}@bro.com", "Hi", "Gear", "gear@bro.com") for i in range(count)
+        ]
+
+    def test_request_paths_only_queue(self):
+        member = Member.objects.create_member("jane@bro.com", "0000000001", timedelta(days=365))
+        with mock.patch("core.emailing.send_email") as send_email:
+            member.queue_intro_email("http://localhost/finish")
+            Staffer.objects.upgrade_to_staffer(member, "jane")
+        send_email.assert_not_called()
+
+        subjects = OutboundEmail.objects.filter(to_email="jane@bro.com").values_list("subject", flat=True)
+        self.assertEqual(set(subjects), {"Finish Signing Up", "Welcome to staff!"})
+
+    def test_send(self):
+        self.queue(10)
+        with mock.patch("core.emailing.send_email") as send_email:
+            self.assertEqual(OutboundEmail.objects.send_queued(), 10)
+        self.assertEqual(send_email.call_count, 10)
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.SENT, sent_at__isnull=False).count(), 10)
+
+        # Nothing is sent twice
+        with mock.patch("core.emailing.send_email") as send_email:
+            self.assertEqual(OutboundEmail.objects.send_queued(), 0)
+        send_email.assert_not_called()
+
+    def test_bounded_concurrency(self):
+        self.queue(12)
+        lock = threading.Lock()
+        sending = []
+        most_at_once = []
+
+        def send_email(*args, **kwargs):
+            with lock:
+                sending.append(1)
+                most_at_once.append(len(sending))
+            time.sleep(0.01)
+            with lock:
+                sending.pop()
+
+        with mock.patch("core.emailing.send_email", side_effect=send_email):
+            self.assertEqual(OutboundEmail.objects.send_queued(workers=3), 12)
+        self.assertLessEqual(max(most_at_once), 3)
+
+    def test_backoff(self):
+        email = self.queue(1)[0]
+        with mock.patch("core.emailing.send_email", side_effect=ConnectionError("Connection refused")):
+            self.assertEqual(OutboundEmail.objects.send_queued(), 0)
+
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.QUEUED, 1))
+        self.assertEqual(email.last_error, "ConnectionError: Connection refused")
+        self.assertAlmostEqual(email.next_attempt_at, now() + retry_delay(1), delta=timedelta(seconds=5))
+        self.assertFalse(OutboundEmail.objects.due().exists())
+
+        # Every failure doubles the wait, up to a limit
+        self.assertEqual(retry_delay(3), 4 * retry_delay(1))
+        self.assertEqual(retry_delay(20), retry_delay(30))
+
+    def test_dead_letter_and_retry(self):
+        email = self.queue(1)[0]
+        OutboundEmail.objects.filter(pk=email.pk).update(attempts=MAX_ATTEMPTS - 1)
+        with mock.patch("core.emailing.send_email", side_effect=ConnectionError):
+            OutboundEmail.objects.send_queued()
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (OutboundEmail.DEAD, MAX_ATTEMPTS))
+        self.assertFalse(OutboundEmail.objects.due().exists())
+
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.DEAD).retry(), 1)
+        with mock.patch("core.emailing.send_email"):
+            self.assertEqual(OutboundEmail.objects.send_queued(), 1)
+
+    def test_claim(self):
+        self.queue(5)
+        claimed = OutboundEmail.objects.claim(limit=3)
+        self.assertEqual(len(claimed), 3)
+
+        # Claimed emails are left alone by other workers
+        self.assertEqual(len(OutboundEmail.objects.claim()), 2)
+        self.assertEqual(OutboundEmail.objects.claim(), [])
+
+    def test_drain(self):
+        self.queue(5)
+        with mock.patch("core.emailing.send_email") as send_email:
+            self.assertEqual(OutboundEmail.objects.drain(limit=2), 5)
+        self.assertEqual(send_email.call_count, 5)
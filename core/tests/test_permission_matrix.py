@@ -0,0 +1,64 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.MemberModels import Member, build_permission_matrix, group_permissions_cache
+from django.contrib.auth.models import Group, Permission
+from django.test import TestCase
+from django.utils.timezone import timedelta
+
+MEMBER_RFID = "1111111111"
+
+
+class PermissionMatrixTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        Member.objects.create_member("jane@bro.com", MEMBER_RFID, timedelta(days=365))
+        self.group = Group.objects.create(name="Testers")
+        self.permission = Permission.objects.get(codename="rent_gear")
+
+    def fresh_member(self):
+        member = Member.objects.get(rfid=MEMBER_RFID)
+        member.move_to_group("Testers")
+        return Member.objects.get(rfid=MEMBER_RFID)
+
+    def test_has_permission_takes_no_queries(self):
+        self.group.permissions.add(self.permission)
+        build_permission_matrix()
+
+        member = self.fresh_member()
+        with self.assertNumQueries(0):
+            self.assertTrue(member.has_permission("core.rent_gear"))
+            self.assertFalse(member.has_permission("core.authorize_transactions"))
+
+        # Every other freshly loaded member of the group is just as cheap
+        member = self.fresh_member()
+        with self.assertNumQueries(0):
+            self.assertTrue(member.has_permission("core.rent_gear"))
+
+    def test_group_permission_changes(self):
+        member = self.fresh_member()
+        self.assertFalse(member.has_permission("core.rent_gear"))
+
+        self.group.permissions.add(self.permission)
+        self.assertTrue(member.has_permission("core.rent_gear"))
+
+        self.group.permissions.remove(self.permission)
+        self.assertFalse(member.has_permission("core.rent_gear"))
+
+        self.group.permissions.add(self.permission)
+        self.permission.delete()
+        self.assertFalse(member.has_permission("core.rent_gear"))
+
+    def test_inactive_member(self):
+        self.group.permissions.add(self.permission)
+        member = self.fresh_member()
+        member.is_active = False
+        self.assertFalse(member.has_permission("core.rent_gear"))
+
+    def test_build_matrix(self):
+        self.group.permissions.add(self.permission)
+        matrix = build_permission_matrix()
+        self.assertEqual(matrix["Testers"], frozenset({"core.rent_gear"}))
+        self.assertIn("core.authorize_transactions", matrix["Admin"])
+        self.assertEqual(group_permissions_cache.get("Testers"), matrix["Testers"])
@@ -0,0 +1,143 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.forms.MemberForms import MemberCreationForm
+from core.models.DepartmentModels import Department
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import Gear, GearType
+from core.models.MemberModels import Member
+from core.models.RfidModels import RfidCache, RfidRegistry, resolve_rfid, rfid_cache
+from core.models.TransactionModels import Transaction, validate_rfid
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError
+from django.test import TestCase
+from django.utils.timezone import timedelta
+
+ADMIN_RFID = "0000000000"
+GEAR_RFID = "0123456789"
+MEMBER_RFID = "1111111111"
+
+
+class RfidRegistryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.admin = Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+        self.member = Member.objects.create_member("jane@bro.com", MEMBER_RFID, timedelta(days=365))
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        self.geartype = GearType.objects.create(name="Skis", department=department)
+        self.img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        Transaction.objects.add_gear(ADMIN_RFID, GEAR_RFID, self.geartype, self.img)
+
+    def assertRegistered(self, rfid, kind, object_pk):
+        entry = RfidRegistry.objects.get(rfid=rfid)
+        self.assertEqual((entry.kind, entry.object_pk), (kind, object_pk))
+
+    def test_registered_on_create(self):
+        self.assertRegistered(ADMIN_RFID, RfidRegistry.MEMBER, self.admin.pk)
+        self.assertRegistered(MEMBER_RFID, RfidRegistry.MEMBER, self.member.pk)
+        self.assertRegistered(GEAR_RFID, RfidRegistry.GEAR, Gear.objects.get(rfid=GEAR_RFID).pk)
+
+    def test_retag_gear(self):
+        Transaction.objects.retag_gear(ADMIN_RFID, GEAR_RFID, "2222222222")
+        self.assertFalse(RfidRegistry.objects.is_in_use(GEAR_RFID))
+        self.assertRegistered("2222222222", RfidRegistry.GEAR, Gear.objects.get(rfid="2222222222").pk)
+
+    def test_member_rfid_change(self):
+        self.member.rfid = "3333333333"
+        self.member.save()
+        self.assertFalse(RfidRegistry.objects.is_in_use(MEMBER_RFID))
+        self.assertRegistered("3333333333", RfidRegistry.MEMBER, self.member.pk)
+
+    def test_rfid_unique_across_tables(self):
+        with self.assertRaises(ValidationError):
+            Transaction.objects.add_gear(ADMIN_RFID, MEMBER_RFID, self.geartype, self.img)
+
+        # Even if the validation is skipped, the registry refuses to hand out the rfid twice
+        self.member.rfid = GEAR_RFID
+        with self.assertRaises(IntegrityError):
+            self.member.save()
+
+    def test_validate_rfid_single_query(self):
+        with self.assertNumQueries(1):
+            with self.assertRaises(ValidationError):
+                validate_rfid(GEAR_RFID)
+        with self.assertNumQueries(1):
+            validate_rfid("4444444444")
+
+    def test_creation_form_rejects_used_rfid(self):
+        form = MemberCreationForm(
+            data={
+                "username": "new@bro.com",
+                "rfid": GEAR_RFID,
+                "password1": "pass",
+                "password2": "pass",
+                "membership": "year_new",
+                "form_filled": True,
+            }
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn("rfid", form.errors)
+
+    def test_unregistered_on_delete(self):
+        self.member.delete()
+        self.assertFalse(RfidRegistry.objects.is_in_use(MEMBER_RFID))
+
+    def test_rebuild(self):
+        RfidRegistry.objects.all().delete()
+        self.assertEqual(RfidRegistry.objects.rebuild(), 3)
+        self.assertRegistered(MEMBER_RFID, RfidRegistry.MEMBER, self.member.pk)
+
+
+class ResolveRfidTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        rfid_cache.clear()
+        self.admin = Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        geartype = GearType.objects.create(name="Skis", department=department)
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        _, self.gear = Transaction.objects.add_gear(ADMIN_RFID, GEAR_RFID, geartype, img)
+
+    def test_resolve(self):
+        self.assertEqual(resolve_rfid(ADMIN_RFID), (RfidRegistry.MEMBER, self.admin))
+        self.assertEqual(resolve_rfid(GEAR_RFID), (RfidRegistry.GEAR, self.gear))
+        self.assertEqual(resolve_rfid("9999999999"), (None, None))
+
+    def test_cached_resolve_single_query(self):
+        resolve_rfid(GEAR_RFID)
+        with self.assertNumQueries(1):
+            kind, gear = resolve_rfid(GEAR_RFID)
+            # The gear type is fetched along with the gear, so naming the gear is free
+            gear.geartype.name
+        self.assertEqual(gear, self.gear)
+
+    def test_retag_invalidates(self):
+        resolve_rfid(GEAR_RFID)
+        Transaction.objects.retag_gear(ADMIN_RFID, GEAR_RFID, "2222222222")
+        self.assertIsNone(rfid_cache.get(GEAR_RFID))
+        self.assertEqual(resolve_rfid(GEAR_RFID), (None, None))
+        self.assertEqual(resolve_rfid("2222222222"), (RfidRegistry.GEAR, self.gear))
+
+    def test_stale_entry_from_other_process(self):
+        """A change made by another process (so without touching this cache) must not resolve to the wrong object"""
+        resolve_rfid(ADMIN_RFID)
+        Member.objects.filter(pk=self.admin.pk).update(rfid="3333333333")
+        RfidRegistry.objects.register(RfidRegistry.MEMBER, self.admin.pk, "3333333333")
+
+        self.assertEqual(resolve_rfid(ADMIN_RFID), (None, None))
+        self.assertEqual(resolve_rfid("3333333333"), (RfidRegistry.MEMBER, self.admin))
+
+    def test_cache_bounded(self):
+        cache = RfidCache(max_size=2)
+        cache.set("1", ("gear", 1))
+        cache.set("2", ("gear", 2))
+        cache.get("1")
+        cache.set("3", ("gear", 3))
+        self.assertIsNone(cache.get("2"))
+        self.assertEqual(cache.get("1"), ("gear", 1))
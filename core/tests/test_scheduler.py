@@ -0,0 +1,105 @@
+import sys
+import threading
+from datetime import datetime
+
+from helper_scripts.scheduler import CronSchedule, TaskWorker
+from django.test import SimpleTestCase
+
+
+class CronScheduleTest(SimpleTestCase):
+    def test_daily(self):
+        cron = CronSchedule("30 1 * * *")
+        self.assertEqual(cron.next_after(datetime(2026, 10, 18, 1, 29, 59)), datetime(2026, 10, 18, 1, 30))
+        self.assertEqual(cron.next_after(datetime(2026, 10, 18, 1, 30)), datetime(2026, 10, 19, 1, 30))
+
+    def test_weekly(self):
+        # The 18th of October 2026 is a Sunday
+        cron = CronSchedule("0 4 * * 0")
+        self.assertEqual(cron.next_after(datetime(2026, 10, 18, 5)), datetime(2026, 10, 25, 4))
+
+    def test_yearly(self):
+        cron = CronSchedule("0 5 1 1 *")
+        self.assertEqual(cron.next_after(datetime(2026, 10, 18)), datetime(2027, 1, 1, 5))
+
+    def test_lists_ranges_and_steps(self):
+        cron = CronSchedule("*/15 9-17 * * 1-5")
+        self.assertEqual(cron.minutes, {0, 15, 30, 45})
+        self.assertEqual(cron.hours, set(range(9, 18)))
+        # Friday evening is followed by Monday morning
+        self.assertEqual(cron.next_after(datetime(2026, 10, 23, 17, 45)), datetime(2026, 10, 26, 9))
+        self.assertEqual(CronSchedule("0 0 1,15 * *").days, {1, 15})
+
+    def test_day_or_weekday(self):
+        # Like cron, the first of the month or any Monday
+        cron = CronSchedule("0 0 1 * 1")
+        self.assertEqual(cron.next_after(datetime(2026, 10, 18)), datetime(2026, 10, 19))
+        self.assertEqual(cron.next_after(datetime(2026, 10, 27)), datetime(2026, 11, 1))
+
+    def test_invalid(self):
+        for expression in ("* * * *", "60 * * * *", "0 0 0 * *", "5-1 * * * *", "0 0 31 2 *"):
+            with self.assertRaises(ValueError, msg=expression):
+                CronSchedule(expression).next_after(datetime(2026, 10, 18))
+
+
+class TaskWorkerTest(SimpleTestCase):
+    def setUp(self):
+        self.now = datetime(2026, 10, 18, 0, 59)
+        self.ran = []
+        self.task_functions = {"ok": lambda: self.ran.append("ok"), "fails": lambda: 1 / 0}
+        self.worker = TaskWorker(
+            {"ok": "0 1 * * *", "fails": "0 2 * * *"}, self.task_functions.__getitem__, clock=lambda: self.now
+        )
+
+    def test_records_runs(self):
+        run = self.worker.run_task("ok")
+        self.assertEqual((run.name, run.started_at, run.error), ("ok", self.now, None))
+        self.assertGreaterEqual(run.duration, 0)
+
+        failed = self.worker.run_task("fails")
+        self.assertIsInstance(failed.error, ZeroDivisionError)
+        self.assertEqual(list(self.worker.runs), [run, failed])
+
+    def test_no_overlap(self):
+        started = threading.Event()
+        finish = threading.Event()
+
+        def slow():
+            started.set()
+            finish.wait(5)
+
+        self.task_functions["ok"] = slow
+        thread = self.worker.start_task("ok")
+        started.wait(5)
+        self.assertIsNone(self.worker.run_task("ok"))
+        finish.set()
+        thread.join(5)
+        self.assertEqual(len(self.worker.runs), 1)
+
+    def test_run_pending(self):
+        self.assertEqual(self.worker.run_pending(), [])
+
+        self.now = datetime(2026, 10, 18, 1, 0, 30)
+        for thread in self.worker.run_pending():
+            thread.join(5)
+        self.assertEqual(self.ran, ["ok"])
+        self.assertEqual(self.worker.next_runs["ok"], datetime(2026, 10, 19, 1))
+
+        # A task only runs once per scheduled time
+        self.assertEqual(self.worker.run_pending(), [])
+
+
+class TaskRegistryTest(SimpleTestCase):
+    def test_tasks_are_imported_lazily(self):
+        import tasks
+
+        self.assertEqual(tasks.get_task("expire_gear").__name__, "expire_gear")
+        self.assertNotIn("selenium", sys.modules)
+        with self.assertRaises(KeyError):
+            tasks.get_task("not_a_task")
+
+    def test_schedule(self):
+        import tasks
+
+        for name, expression in tasks.schedule.items():
+            self.assertIn(name, tasks.tasks)
+            CronSchedule(expression)
@@ -0,0 +1,77 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.MemberModels import Member
+from core.models.TaskModels import STALE_RUN_TIME, TaskRun, record_progress, tracked_task
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.timezone import now, timedelta
+
+
+@tracked_task
+def nightly_task(fail=False):
+    record_progress(examined=10, changed=3)
+    record_progress(emails_queued=2)
+    if fail:
+        raise ValueError("Out of stoke")
+    return "done"
+
+
+class TaskRunTest(TestCase):
+    def test_records_run(self):
+        self.assertEqual(nightly_task(), "done")
+
+        run = TaskRun.objects.get()
+        self.assertEqual((run.name, run.status, run.error), ("nightly_task", TaskRun.SUCCEEDED, ""))
+        self.assertEqual((run.rows_examined, run.rows_changed, run.emails_queued), (10, 3, 2))
+        self.assertGreaterEqual(run.duration, timedelta(0))
+
+    def test_records_failure(self):
+        with self.assertRaises(ValueError):
+            nightly_task(fail=True)
+
+        run = TaskRun.objects.get()
+        self.assertEqual(run.status, TaskRun.FAILED)
+        self.assertIn("ValueError: Out of stoke", run.error)
+        self.assertIsNotNone(run.finished_at)
+
+    def test_skips_overlapping_run(self):
+        TaskRun.objects.create(name="nightly_task")
+        self.assertIsNone(nightly_task())
+
+        skipped = TaskRun.objects.get(status=TaskRun.SKIPPED)
+        self.assertEqual((skipped.rows_examined, skipped.name), (0, "nightly_task"))
+
+        # Other tasks are not held up
+        self.assertEqual(TaskRun.objects.run("other_task", lambda: "other"), "other")
+
+    def test_stale_run_does_not_block(self):
+        TaskRun.objects.create(name="nightly_task", started_at=now() - STALE_RUN_TIME - timedelta(minutes=1))
+        self.assertEqual(nightly_task(), "done")
+
+    def test_progress_outside_of_run_is_ignored(self):
+        record_progress(changed=5)
+        self.assertFalse(TaskRun.objects.exists())
+
+    def test_chart_data(self):
+        started_at = now() - timedelta(days=1)
+        TaskRun.objects.create(name="expire_gear", started_at=started_at, finished_at=started_at + timedelta(seconds=4))
+        TaskRun.objects.create(name="expire_gear", started_at=now() - timedelta(days=100), finished_at=now())
+        TaskRun.objects.create(name="expire_members")
+
+        self.assertEqual(TaskRun.objects.chart_data(), {"expire_gear": [[started_at.isoformat(), 4.0]]})
+
+
+class TaskRunAdminTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def test_chart(self):
+        admin = Member.objects.create_member("admin@bro.com", "0000000001", timedelta(days=365), "pass")
+        admin.move_to_group("Admin")
+        nightly_task()
+
+        self.client.force_login(admin)
+        response = self.client.get(reverse("admin:core_taskrun_changelist"))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'id="task-run-data"')
+        self.assertIn("nightly_task", response.context["chart_data"])
@@ -0,0 +1,102 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.DepartmentModels import Department
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import GearType
+from core.models.MemberModels import Member
+from core.models.SnapshotModels import GearSnapshot
+from core.models.TransactionModels import ArchivedTransaction, Transaction
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.timezone import datetime, localdate, make_aware, timedelta
+
+ADMIN_RFID = "0000000000"
+MEMBER_RFID = "1111111111"
+GEAR_RFID = "0123456789"
+
+
+class TransactionArchiveTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.admin = Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+        self.member = Member.objects.create_member("jane@bro.com", MEMBER_RFID, timedelta(days=365))
+        self.member.promote_to_active()
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        geartype = GearType.objects.create(name="Skis", department=department)
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        _, self.gear = Transaction.objects.add_gear(ADMIN_RFID, GEAR_RFID, geartype, img)
+
+        # The gear was added in 2019 and had ten transactions that year, followed by five this year
+        for _ in range(5):
+            Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, localdate() + timedelta(days=7))
+            Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID)
+        old_times = make_aware(datetime(2019, 6, 1))
+        for i, pk in enumerate(Transaction.objects.order_by("timestamp").values_list("pk", flat=True)):
+            Transaction.objects.filter(pk=pk).update(timestamp=old_times + timedelta(days=i))
+        for _ in range(2):
+            Transaction.objects.make_checkout(ADMIN_RFID, GEAR_RFID, MEMBER_RFID, localdate() + timedelta(days=7))
+            Transaction.objects.check_in_gear(ADMIN_RFID, GEAR_RFID)
+        Transaction.objects.break_gear(ADMIN_RFID, GEAR_RFID, "Delaminated")
+
+        self.cutoff = make_aware(datetime(2020, 1, 1))
+        self.all_transactions = list(Transaction.objects.order_by("-timestamp", "-primary_key"))
+
+    def read_all_pages(self, history, page_size):
+        transactions, cursor = history.history_page(page_size=page_size)
+        while cursor is not None:
+            page, cursor = history.history_page(after=cursor, page_size=page_size)
+            transactions += page
+        return transactions
+
+    def test_archive(self):
+        state = GearSnapshot.objects.state_at()
+        self.assertEqual(Transaction.objects.archive(self.cutoff, batch_size=3), 11)
+        self.assertEqual(Transaction.objects.count(), 5)
+        self.assertEqual(ArchivedTransaction.objects.count(), 11)
+        self.assertFalse(Transaction.objects.filter(timestamp__lt=self.cutoff).exists())
+
+        archived = ArchivedTransaction.objects.order_by("timestamp").first()
+        self.assertEqual((archived.type, archived.timestamp), ("Create", make_aware(datetime(2019, 6, 1))))
+
+        # Nothing is lost, archived transactions are still replayed
+        self.assertEqual(GearSnapshot.objects.state_at(), state)
+        self.assertEqual(Transaction.objects.archive(self.cutoff), 0)
+
+    def test_history_spans_archive(self):
+        Transaction.objects.archive(self.cutoff)
+        history = Transaction.objects.history().for_gear(self.gear)
+        self.assertEqual(history.count(), 16)
+        self.assertEqual([t.pk for t in history], [t.pk for t in self.all_transactions])
+
+        for page_size in (1, 4, 5, 6, 16, 20):
+            with self.subTest(page_size=page_size):
+                paged = self.read_all_pages(history, page_size)
+                self.assertEqual([t.pk for t in paged], [t.pk for t in self.all_transactions])
+
+    def test_recent_history_skips_archive(self):
+        Transaction.objects.archive(self.cutoff)
+        with self.assertNumQueries(1):
+            transactions, cursor = Transaction.objects.history().for_gear(self.gear).history_page(page_size=4)
+        self.assertEqual(len(transactions), 4)
+        self.assertIsInstance(transactions[-1], Transaction)
+
+        # Only the last page of the current transactions has to continue into the archive
+        transactions, cursor = Transaction.objects.history().for_gear(self.gear).history_page(cursor, page_size=4)
+        self.assertEqual([type(t) for t in transactions], [Transaction] + [ArchivedTransaction] * 3)
+
+    def test_views_show_archive(self):
+        Transaction.objects.archive(self.cutoff)
+        self.client.force_login(self.admin)
+
+        response = self.client.get(reverse("admin:core_member_detail", kwargs={"pk": self.member.pk}))
+        related = response.context["related_transactions"]
+        self.assertEqual([t.type for t in related], ["CheckOut"] * 7)
+        self.assertEqual(sum(isinstance(t, ArchivedTransaction) for t in related), 5)
+
+        archived = ArchivedTransaction.objects.first()
+        response = self.client.get(archived.detail_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, archived.comments)
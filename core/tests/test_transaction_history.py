@@ -0,0 +1,111 @@
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.DepartmentModels import Department
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import GearType
+from core.models.MemberModels import Member
+from core.models.TransactionModels import Transaction
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.timezone import now, timedelta
+
+ADMIN_RFID = "0000000000"
+MEMBER_RFID = "1111111111"
+
+
+class TransactionHistoryTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        self.admin = Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+        self.member = Member.objects.create_member("jane@bro.com", MEMBER_RFID, timedelta(days=365))
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        geartype = GearType.objects.create(name="Skis", department=department)
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        _, self.gear = Transaction.objects.add_gear(ADMIN_RFID, "0123456789", geartype, img)
+        _, self.other_gear = Transaction.objects.add_gear(ADMIN_RFID, "0123456780", geartype, img)
+
+        # Sixty transactions in groups of three made at the same instant, to check that ties are paged correctly
+        start = now() - timedelta(days=30)
+        Transaction.objects.bulk_create(
+            Transaction(type="CheckOut", gear=self.gear, member=self.member, authorizer=self.admin)
+            for _ in range(60)
+        )
+        for i, pk in enumerate(Transaction.objects.filter(type="CheckOut").values_list("pk", flat=True)):
+            Transaction.objects.filter(pk=pk).update(timestamp=start + timedelta(hours=i // 3))
+
+    def read_all_pages(self, queryset, page_size):
+        pages = []
+        transactions, cursor = queryset.history_page(page_size=page_size)
+        pages.append(transactions)
+        while cursor is not None:
+            transactions, cursor = queryset.history_page(after=cursor, page_size=page_size)
+            pages.append(transactions)
+        return pages
+
+    def test_pages_cover_history_in_order(self):
+        pages = self.read_all_pages(Transaction.objects.for_gear(self.gear), page_size=7)
+        paged = [transaction for page in pages for transaction in page]
+
+        expected = list(Transaction.objects.filter(gear=self.gear).order_by("-timestamp", "-primary_key"))
+        self.assertEqual(paged, expected)
+        self.assertEqual([len(page) for page in pages], [7] * 8 + [5])
+
+    def test_page_is_single_query(self):
+        _, cursor = Transaction.objects.for_gear(self.gear).history_page(page_size=10)
+        with self.assertNumQueries(1):
+            transactions, _ = Transaction.objects.for_gear(self.gear).history_page(after=cursor, page_size=10)
+            for transaction in transactions:
+                str(transaction), transaction.member.get_full_name(), transaction.authorizer.get_full_name()
+
+    def test_member_history(self):
+        self.assertEqual(len(self.read_all_pages(Transaction.objects.for_member(self.member), 100)[0]), 60)
+
+        # The admin authorized everything, including adding the gear
+        admin_history = self.read_all_pages(Transaction.objects.for_member(self.admin), 100)[0]
+        self.assertEqual(len(admin_history), 62)
+
+    def test_gear_detail_and_load_more(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("admin:core_gear_detail", kwargs={"pk": self.gear.pk}))
+        self.assertEqual(len(response.context["related_transactions"]), 25)
+        cursor = response.context["next_cursor"]
+        self.assertContains(response, f"?after={cursor}")
+
+        history_url = reverse("admin:core_gear_history", kwargs={"pk": self.gear.pk})
+        response = self.client.get(history_url, {"after": cursor})
+        self.assertEqual(len(response.context["transactions"]), 25)
+        self.assertContains(response, "Load more")
+
+        response = self.client.get(history_url, {"after": response.context["next_cursor"]})
+        self.assertEqual(len(response.context["transactions"]), 11)
+        self.assertNotContains(response, "Load more")
+
+    def test_gear_history_hidden_from_renter(self):
+        # The member with the gear checked out sees the gear, but not its history or the button to load more of it
+        self.member.move_to_group("Member")
+        Transaction.objects.make_checkout(ADMIN_RFID, self.other_gear.rfid, MEMBER_RFID, now().date())
+        self.client.force_login(self.member)
+        response = self.client.get(reverse("admin:core_gear_detail", kwargs={"pk": self.other_gear.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("related_transactions", response.context)
+        self.assertNotContains(response, "Load more")
+
+        history_url = reverse("admin:core_gear_history", kwargs={"pk": self.other_gear.pk})
+        self.assertEqual(self.client.get(history_url, {"after": 1}).status_code, 403)
+
+    def test_member_load_more(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("admin:core_member_detail", kwargs={"pk": self.member.pk}))
+        self.assertEqual(len(response.context["related_transactions"]), 25)
+
+        history_url = reverse("admin:core_member_history", kwargs={"pk": self.member.pk})
+        response = self.client.get(history_url, {"after": response.context["next_cursor"]})
+        self.assertContains(response, self.gear.name)
+
+    def test_load_more_requires_cursor(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse("admin:core_gear_history", kwargs={"pk": self.gear.pk}))
+        self.assertEqual(response.status_code, 400)
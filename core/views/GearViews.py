@@ -1,6 +1,7 @@
 from core.models.GearModels import Gear, GearType
 from core.models.TransactionModels import Transaction
 from core.views.common import ModelDetailView
+from core.views.TransactionViews import TransactionHistoryView
 from core.views.ViewList import RestrictedViewList
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.urls import reverse
@@ -12,6 +13,11 @@ class GearTypeDetailView(ModelDetailView):
     model = GearType
 
 
+def can_view_gear_history(user):
+    """Whether the user may see the transaction history of gear, both on its detail page and when loading more of it"""
+    return user.has_permission("core.view_all_transactions")
+
+
 class GearDetailView(UserPassesTestMixin, ModelDetailView):
 
     model = Gear
@@ -45,17 +51,32 @@ class GearDetailView(UserPassesTestMixin, ModelDetailView):
         context["geartype_url"] = reverse(
             "admin:core_geartype_detail", kwargs={"pk": gear.geartype.pk}
         )
-        context["related_transactions"] = Transaction.objects.filter(
-            gear=gear
-        ).order_by("-timestamp")
         if gear.checked_out_to:
             context["checked_out_to_url"] = reverse(
                 "admin:core_member_detail", kwargs={"pk": gear.checked_out_to.pk}
             )
-        context['view_transactions'] = self.request.user.has_permission("core.view_all_transactions")
+
+        # Only those who may load more of the history are shown any of it, along with the button to load more
+        context['view_transactions'] = can_view_gear_history(self.request.user)
+        if context['view_transactions']:
+            transactions, next_cursor = Transaction.objects.history().for_gear(gear).history_page()
+            context["related_transactions"] = transactions
+            context["next_cursor"] = next_cursor
+            context["history_url"] = reverse("admin:core_gear_history", kwargs={"pk": gear.pk})
         return super(GearDetailView, self).get_context_data(**context)
 
 
+class GearHistoryView(TransactionHistoryView):
+    model = Gear
+    history_url_name = "admin:core_gear_history"
+
+    def test_func(self):
+        return can_view_gear_history(self.request.user)
+
+    def get_history(self, gear):
+        return Transaction.objects.history().for_gear(gear)
+
+
 class GearViewList(RestrictedViewList):
     def __init__(self, *args, **kwargs):
         super(GearViewList, self).__init__(*args, **kwargs)
@@ -8,7 +8,9 @@ from core.forms.MemberForms import (
 )
 from core.models.MemberModels import Member, Staffer
 from core.models.GearModels import Gear
+from core.models.TransactionModels import Transaction
 from core.views.common import ModelDetailView, get_default_context
+from core.views.TransactionViews import TransactionHistoryView
 from core.views.ViewList import RestrictedViewList
 from django.contrib.auth.mixins import UserPassesTestMixin
 from django.urls import reverse
@@ -44,17 +46,17 @@ class ResendIntroEmailView(UserPassesTestMixin, ModelDetailView):
         return can_edit or is_self
 
     def get(self, *args, **kwargs):
-        """Do our best to send the membership email before rendering page"""
+        """Queue the membership email before rendering page, the email worker sends it shortly after"""
         member = self.get_object()
         try:
             finish_url = WEB_BASE + reverse("admin:core_member_finish", kwargs={"pk": member.pk})
-            member.send_intro_email(finish_url)
+            member.queue_intro_email(finish_url)
         except Exception as e:
             self.send_succeeded = False
             self.message = f"Failed to send email! Please send the following information to the system admin: \n{e}"
         else:
             self.send_succeeded = True
-            self.message = "Email sent successfully"
+            self.message = "Email queued, it will be sent in the next few minutes"
         return super(ResendIntroEmailView, self).get(*args, **kwargs)
 
     def get_context_data(self, **context):
@@ -101,9 +103,31 @@ class MemberDetailView(UserPassesTestMixin, ModelDetailView):
         context['promote_url'] = f"{reverse('admin:core_staffer_add')}?member={member.pk}"
         context['resend_email_url'] = reverse("admin:core_member_resendemail", kwargs={"pk": member.pk})
         context['is_new'] = member.group == 'Just Joined'
+
+        context['view_transactions'] = is_self or self.request.user.has_permission("core.view_all_transactions")
+        if context['view_transactions']:
+            transactions, next_cursor = Transaction.objects.history().for_member(member).history_page()
+            context['related_transactions'] = transactions
+            context['next_cursor'] = next_cursor
+            context['history_url'] = reverse("admin:core_member_history", kwargs={"pk": member.pk})
         return super(MemberDetailView, self).get_context_data(**context)
 
 
+class MemberHistoryView(TransactionHistoryView):
+    """The transactions of a member, both those they were the member in and those they authorized"""
+
+    model = Member
+    history_url_name = "admin:core_member_history"
+    show_gear = True
+
+    def test_func(self):
+        is_self = self.request.user.pk == int(self.kwargs["pk"])
+        return is_self or self.request.user.has_permission("core.view_all_transactions")
+
+    def get_history(self, member):
+        return Transaction.objects.history().for_member(member)
+
+
 class MemberFinishView(UserPassesTestMixin, UpdateView):
 
     model = Member
@@ -1,7 +1,11 @@
-from core.models.TransactionModels import Transaction
+from core.models.TransactionModels import ArchivedTransaction, Transaction
 from core.views.common import ModelDetailView
 from core.views.ViewList import RestrictedViewList
 from django.contrib.auth.mixins import UserPassesTestMixin
+from django.http import Http404, HttpResponseBadRequest
+from django.shortcuts import get_object_or_404, render
+from django.urls import reverse
+from django.views import View
 
 
 class TransactionListView(RestrictedViewList):
@@ -21,6 +25,13 @@ class TransactionDetailView(UserPassesTestMixin, ModelDetailView):
 
     model = Transaction
 
+    def get_object(self, queryset=None):
+        """Transactions from past years are shown from the archive"""
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            return get_object_or_404(ArchivedTransaction, pk=self.kwargs["pk"])
+
     def test_func(self):
         """Can view the detail of transaction of member is a staffer or transaction involves the member"""
         transaction_to_view = self.get_object()
@@ -34,3 +45,41 @@ class TransactionDetailView(UserPassesTestMixin, ModelDetailView):
     def post(self, request, *args, **kwargs):
         """Treat post requests as get requests"""
         return self.get(request, *args, **kwargs)
+
+
+class TransactionHistoryView(UserPassesTestMixin, View):
+    """
+    Render the next page of the transaction history of an object, as the fragment that the "load more" button fetches
+
+    The page to render is given by the "after" GET parameter, the cursor returned along with the previous page.
+    """
+
+    model = None
+    template_name = "admin/core/transaction/history_rows.html"
+    history_url_name = None
+    show_gear = False
+
+    raise_exception = True
+    permission_denied_message = "You are not allowed to view these transactions!"
+
+    def get_object(self):
+        return get_object_or_404(self.model, pk=self.kwargs["pk"])
+
+    def get_history(self, obj):
+        """Get the queryset of all the transactions in the history of the object"""
+        raise NotImplementedError
+
+    def get(self, request, pk):
+        try:
+            after = int(request.GET["after"])
+        except (KeyError, ValueError):
+            return HttpResponseBadRequest("A valid cursor is required to load more transactions")
+
+        transactions, next_cursor = self.get_history(self.get_object()).history_page(after)
+        context = {
+            "transactions": transactions,
+            "next_cursor": next_cursor,
+            "history_url": reverse(self.history_url_name, kwargs={"pk": pk}),
+            "show_gear": self.show_gear,
+        }
+        return render(request, self.template_name, context)
@@ -0,0 +1,305 @@
+"""
+Benchmarks for the hot paths of the system
+
+Every benchmark builds its own throwaway test database (exactly like the unit tests do), fills it with generated data and
+reports how long the measured operation took and how many queries it ran. This means that they are safe to run with any
+settings, and will never touch real data. Run a benchmark with:
+
+    python helper_scripts/benchmarks.py <benchmark_name>
+"""
+from helper_scripts import setup_django
+
+import time
+from contextlib import contextmanager
+from sys import argv
+
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+ADMIN_RFID = "0000000000"
+
+
+@contextmanager
+def benchmark_database():
+    """Create a fresh test database for the duration of the benchmark, and destroy it afterwards"""
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(name, func, repeat=5):
+    """Run the function several times, and print the best run time along with the number of queries run"""
+    timings = []
+    for _ in range(repeat):
+        # The query log has a maximum length, which building the benchmark data may already have filled
+        connection.queries_log.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+    print(f"{name}: best {min(timings) * 1000:.1f}ms of {repeat} runs, {len(queries)} queries per run")
+    return min(timings)
+
+
+def build_admin():
+    """Build the permission structure and a admin that is allowed to authorize anything"""
+    from helper_scripts.build_permissions import build_all as build_permissions
+    from core.models.MemberModels import Member
+
+    build_permissions()
+    return Member.objects.create_superuser("bench@admin.com", ADMIN_RFID, "pass")
+
+
+def build_gear(count, num_fields=5):
+    """Add count pieces of gear of a single gear type with num_fields custom data fields"""
+    from core.models.DepartmentModels import Department
+    from core.models.FileModels import AlreadyUploadedImage
+    from core.models.GearModels import CustomDataField, GearType
+    from core.models.TransactionModels import Transaction
+
+    department = Department.objects.create(name="Benchmark", description="")
+    geartype = GearType.objects.create(name="Bench Gear", department=department)
+    for i in range(num_fields):
+        field = CustomDataField.objects.create(
+            name=f"bench_field_{i}", label=f"Field {i}", data_type="int", suffix="cm"
+        )
+        geartype.data_fields.add(field)
+    image = AlreadyUploadedImage.objects.create(image_type="gear", name="Benchmark")
+
+    for i in range(count):
+        gear_data = {f"bench_field_{j}": i + j for j in range(num_fields)}
+        Transaction.objects.add_gear(
+            ADMIN_RFID, f"{5_000_000_000 + i}", geartype, image, **gear_data
+        )
+    return geartype
+
+
+def gear_changelist(num_gear=200):
+    """Render the gear list in the admin, showing num_gear rows with 5 custom fields each"""
+    from django.test import Client
+    from django.urls import reverse
+
+    with benchmark_database():
+        admin = build_admin()
+        build_gear(num_gear)
+
+        client = Client()
+        client.force_login(admin)
+        url = reverse("admin:core_gear_changelist") + "?all="
+
+        def render():
+            response = client.get(url)
+            assert response.status_code == 200, response.status_code
+
+        measure(f"Gear changelist ({num_gear} rows)", render)
+
+        # Reading all the custom fields on each row, like the gear templates do
+        from core.models.GearModels import Gear
+
+        def read_attributes():
+            for gear in Gear.objects.select_related("geartype"):
+                for field_num in range(5):
+                    getattr(gear, f"bench_field_{field_num}")
+
+        measure(f"Custom attributes ({num_gear} gear x 5 fields)", read_attributes)
+
+
+def build_members(count):
+    """Add count active members, returning their rfids"""
+    from django.utils.timezone import timedelta
+    from core.models.MemberModels import Member
+
+    rfids = []
+    for i in range(count):
+        rfid = f"{6_000_000_000 + i}"
+        member = Member.objects.create_member(f"bench{i}@member.com", rfid, timedelta(days=365), "pass")
+        member.move_to_group("Member")
+        rfids.append(rfid)
+    return rfids
+
+
+def kiosk_scan(num_gear=1000, num_members=200):
+    """Scan gear at the kiosk through the JSON scan endpoint, alternately checking it out and back in"""
+    from django.test import Client
+    from django.urls import reverse
+
+    with benchmark_database():
+        admin = build_admin()
+        build_gear(num_gear)
+        member_rfid = build_members(num_members)[0]
+
+        client = Client()
+        client.force_login(admin)
+        url = reverse("kiosk:scan")
+        gear_rfid = f"{5_000_000_000 + num_gear // 2}"
+
+        def scan():
+            data = {"rfid": gear_rfid, "context": "member", "context_rfid": member_rfid}
+            response = client.post(url, data)
+            assert response.json()["action"] in ("checkout", "checkin"), response.json()
+
+        measure(f"Kiosk scan ({num_gear} gear, {num_members} members)", scan, repeat=20)
+
+        # For comparison, the same scan through the page form, including the redirect and re-rendering of the page
+        page_url = reverse("kiosk:check_out", args=[member_rfid])
+
+        def page_scan():
+            response = client.post(page_url, {"rfid": gear_rfid}, follow=True)
+            assert response.status_code == 200, response.status_code
+
+        measure(f"Kiosk page scan ({num_gear} gear, {num_members} members)", page_scan, repeat=20)
+
+
+def bulk_members(count, groups=("Member", "Expired", "Just Joined", "Staff")):
+    """Add count members spread evenly over the groups, skipping the slow password hashing of create_member"""
+    from django.contrib.auth.models import Group
+    from django.utils.timezone import now, timedelta
+    from core.models.MemberModels import Member
+
+    group_pks = dict(Group.objects.filter(name__in=groups).values_list("name", "pk"))
+    members = [
+        Member(
+            email=f"bulk{i}@member.com",
+            rfid=f"{7_000_000_000 + i}",
+            date_expires=now() + timedelta(days=365),
+            group=groups[i % len(groups)],
+            password="!",
+        )
+        for i in range(count)
+    ]
+    Member.objects.bulk_create(members, batch_size=500)
+
+    links = [
+        Member.groups.through(member_id=member.pk, group_id=group_pks[member.group])
+        for member in Member.objects.filter(email__startswith="bulk")
+    ]
+    Member.groups.through.objects.bulk_create(links, batch_size=500)
+
+
+def active_members(num_members=10_000):
+    """Build the list of emails of all active members, as the active member view and the listserv sync do"""
+    from core.models.MemberModels import Member
+
+    with benchmark_database():
+        build_admin()
+        bulk_members(num_members)
+
+        def python_filter():
+            return [member.email for member in Member.objects.all() if member.is_active_member]
+
+        def sql_filter():
+            return list(Member.objects.active().values_list("email", flat=True))
+
+        assert sorted(python_filter()) == sorted(sql_filter())
+        measure(f"Active members, filtered in python ({num_members} members)", python_filter)
+        measure(f"Active members, filtered in SQL ({num_members} members)", sql_filter)
+
+
+def gear_replay(num_transactions=1_000_000, num_gear=1000):
+    """Replay the transaction history of all gear, both from the very beginning and from a recent snapshot"""
+    from django.utils.timezone import localdate
+    from core.models.GearModels import Gear
+    from core.models.MemberModels import Member
+    from core.models.SnapshotModels import GearSnapshot
+    from core.models.TransactionModels import Transaction
+
+    with benchmark_database():
+        admin = build_admin()
+        build_gear(num_gear, num_fields=0)
+        member = Member.objects.get(rfid=build_members(1)[0])
+        gear_pks = list(Gear.objects.order_by("pk").values_list("pk", flat=True))
+
+        # Every piece of gear is checked out and back in over and over, a batch at a time to keep the memory use down
+        comment = f"Return date = {localdate()}"
+        batch_size = 50_000
+        for start in range(0, num_transactions, batch_size):
+            Transaction.objects.bulk_create(
+                # Ids made this quickly would collide, so number the transactions instead
+                Transaction(
+                    primary_key=i + 1,
+                    type="CheckIn" if i // num_gear % 2 else "CheckOut",
+                    gear_id=gear_pks[i % num_gear],
+                    member=member,
+                    authorizer=admin,
+                    comments=comment,
+                )
+                for i in range(start, min(start + batch_size, num_transactions))
+            )
+        last_night = Transaction.objects.order_by("timestamp").values_list("timestamp", flat=True)[
+            num_transactions * 9 // 10
+        ]
+
+        def full_replay():
+            return GearSnapshot.objects.state_at()
+
+        measure(f"Gear replay from the start ({num_transactions} transactions)", full_replay, repeat=1)
+
+        GearSnapshot.objects.take(last_night)
+        measure(f"Gear replay from a snapshot ({num_transactions // 10} transactions since)", full_replay, repeat=3)
+        measure(f"Gear consistency check ({num_gear} gear)", GearSnapshot.objects.find_drift, repeat=3)
+
+
+def overdue_emails(num_members=5_000, gear_per_member=3):
+    """Render the overdue gear email of every member with overdue gear, as the email_overdue_gear task does"""
+    from django.template import Context
+    from django.utils.timezone import localdate, timedelta
+    from core import email_templates
+    from core.models.GearModels import Gear
+    from core.models.MemberModels import Member
+
+    # Rendering never touches the database, so the members and their gear do not need to be saved
+    due_date = localdate() - timedelta(days=3)
+    members_gear = [
+        (
+            Member(email=f"overdue{i}@member.com", first_name=f"Member{i}", last_name="Overdue"),
+            [Gear(display_name=f"Skis - {i}, {j}", due_date=due_date) for j in range(gear_per_member)],
+        )
+        for i in range(num_members)
+    ]
+
+    contexts = [{"first_name": member.first_name, "all_gear": all_gear} for member, all_gear in members_gear]
+
+    def compile_every_time():
+        # Reading and compiling the template for every email, like the emails were built before the registry
+        return [
+            email_templates.engine.get_template("missing_gear.txt").render(Context(context, autoescape=False))
+            for context in contexts
+        ]
+
+    def batch():
+        return email_templates.render_many("missing_gear", contexts)
+
+    def build_emails():
+        return Member.build_missing_gear_emails(members_gear)
+
+    with benchmark_database():
+        assert compile_every_time() == batch() == [email.body for email in build_emails()]
+        measure(f"Overdue emails, compiling the template for each ({num_members} emails)", compile_every_time, repeat=3)
+        measure(f"Overdue emails, rendered in one batch ({num_members} emails)", batch, repeat=3)
+        measure(f"Overdue emails, built ready to be queued ({num_members} emails)", build_emails, repeat=3)
+
+
+benchmarks = {
+    "gear_changelist": gear_changelist,
+    "kiosk_scan": kiosk_scan,
+    "active_members": active_members,
+    "gear_replay": gear_replay,
+    "overdue_emails": overdue_emails,
+}
+
+
+if __name__ == "__main__":
+    benchmark_name = argv[1].lower()
+    if benchmark_name in benchmarks:
+        benchmarks[benchmark_name]()
+    else:
+        print(f"Invalid benchmark name: '{benchmark_name}'!")
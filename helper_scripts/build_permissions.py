@@ -3,10 +3,11 @@ from helper_scripts import setup_django
 from core.models.CertificationModels import Certification
 from core.models.DepartmentModels import Department
 from core.models.GearModels import CustomDataField, Gear, GearType
-from core.models.MemberModels import Member, Staffer
+from core.models.MemberModels import Member, Staffer, build_permission_matrix
 from core.models.QuizModels import Answer, Question
 from core.models.TransactionModels import Transaction
 from core.models.FileModels import AlreadyUploadedImage
+from core.models.TaskModels import TaskRun
 from api.models import MemberRFIDCheck
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
@@ -31,10 +32,13 @@ question_type = ContentType.objects.get_for_model(Question)
 answer_type = ContentType.objects.get_for_model(Answer)
 image_type = ContentType.objects.get_for_model(AlreadyUploadedImage)
 rfid_check_type = ContentType.objects.get_for_model(MemberRFIDCheck)
+task_run_type = ContentType.objects.get_for_model(TaskRun)
 
 
 def build_all():
     """Build all the groups. Must be done in ascending order of power"""
+    # Start from scratch, permissions left over from an earlier build may since have been deleted (i.e. in tests)
+    all_permissions.clear()
     build_just_joined()
     build_expired()
     build_member()
@@ -42,6 +46,9 @@ def build_all():
     build_board()
     build_admin()
 
+    # Every process must stop using the permissions it knew before the rebuild
+    build_permission_matrix()
+
 
 def build_just_joined():
     """Create all the permissions for the lowest group, of freshly joined members"""
@@ -303,6 +310,11 @@ def build_admin():
         name="Can delete existing members",
         content_type=member_type,
     )
+    add_permission(
+        codename="view_taskrun",
+        name="Can see how the scheduled tasks ran",
+        content_type=task_run_type,
+    )
     add_group("Admin", all_permissions)
 
 
@@ -1,27 +1,57 @@
 from helper_scripts import setup_django
 import uwccsystem.settings as settings
-import time
+import logging
+import os
+import re
 import ssl
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support import expected_conditions, wait
+import tempfile
+import uuid
+from html.parser import HTMLParser
+from http.cookiejar import CookieJar
+from urllib.error import URLError
+from urllib.parse import urlencode, urljoin
+from urllib.request import HTTPCookieProcessor, HTTPSHandler, Request, build_opener
 
 from core.convinience import notify_info
+from core.models.ListservModels import ListservSubscriber
 from core.models.MemberModels import Member
+from core.models.TaskModels import record_progress
 
+logger = logging.getLogger(__name__)
+
+#: How long to wait for any page of the listserv to load
 LOAD_WAIT_SECS = 10
 
+#: The ids of the fields of the listserv's login and upload forms
+LOGIN_EMAIL_ID = "Email Address"
+LOGIN_PASSWORD_ID = "Password"
+UPLOAD_FILE_ID = "Input File"
+
+#: The ids of the radio buttons of the upload form that choose what the listserv does with the uploaded emails
+OPERATION_IDS = {"add": "radioa", "replace": "radiob", "remove": "radioc"}
+
+#: How the listserv confirms an upload that went through, with how many addresses were changed
+UPLOAD_SUCCESS = re.compile(r"^(\d+) addresses (added|deleted|removed|replaced|imported)\b", re.IGNORECASE)
+
+#: Words that mean the listserv did not make (all of) the change, even if its message reads as a confirmation
+UPLOAD_FAILURE = re.compile(r"\b(error|not|fail)", re.IGNORECASE)
+
+
+class ListservError(Exception):
+    """The listserv could not be reached, or its pages were not what was expected"""
+
+
+class UnsupportedOperation(ListservError):
+    """The listserv's upload form has no option for the change, i.e. only replacing everyone can be done through it"""
+
 
 def get_active_emails():
-    members = Member.objects.all()
-    emails = [f"{member.email}\n" for member in members if member.is_active_member]
-    return emails
+    return sorted(email.strip().lower() for email in Member.objects.active().values_list("email", flat=True))
 
 
-def write_emails(email_list):
-    filename = "listserv_emails.txt"
+def write_emails(email_list, filename="listserv_emails.txt"):
     with open(filename, "w") as email_file:
-        email_file.writelines(email_list)
+        email_file.writelines(f"{email}\n" for email in email_list)
     return filename
 
 
@@ -31,70 +61,356 @@ def get_email_file():
     return filename
 
 
-def push_to_listserv(emails_file):
+class ListservTransport:
+    """
+    A way of making changes to the subscribers of the listserv
 
-    profile = webdriver.FirefoxProfile()
-    profile.accept_untrusted_certs = True
-    profile.assume_untrusted_cert_issuer = True
-    capabilities = webdriver.DesiredCapabilities().FIREFOX.copy()
-    capabilities["acceptInsecureCerts"] = True
-    browser = webdriver.Firefox(firefox_profile=profile, capabilities=capabilities)
-    try:
-        _create_unverified_https_context = ssl._create_unverified_context
-    except AttributeError:
-        # Legacy Python that doesn't verify HTTPS certificates by default
+    Each change returns the message the listserv answered with, and raises a ListservError if it could not be made.
+    """
+
+    def add(self, emails):
+        return self.push("add", emails)
+
+    def remove(self, emails):
+        return self.push("remove", emails)
+
+    def replace(self, emails):
+        return self.push("replace", emails)
+
+    def push(self, operation, emails):
+        """Make the change, making sure from the listserv's answer that it went through"""
+        emails = list(emails)
+        message = self.upload(operation, emails) or ""
+        confirmed = UPLOAD_SUCCESS.match(message)
+        if UPLOAD_FAILURE.search(message) or not confirmed:
+            raise ListservError(f"The listserv did not {operation} the emails, it said: {message}")
+        count = int(confirmed.group(1))
+        if count == 0 and emails:
+            raise ListservError(f"The listserv did not {operation} any of the {len(emails)} emails, it said: {message}")
+        return message
+
+    def upload(self, operation, emails):
+        """Upload the emails with the option of the operation chosen, returning the message the listserv answers with"""
+        raise NotImplementedError
+
+    def close(self):
         pass
-    else:
-        # Handle target environment that doesn't support HTTPS verification
-        ssl._create_default_https_context = _create_unverified_https_context
 
-    # Open login page and wait till it loads
-    browser.get(settings.LISTSERV_FORM_ADDRESS)
-    wait.WebDriverWait(browser, 10).until(
-        expected_conditions.element_to_be_clickable((By.XPATH, "//form/p/input[1]"))
-    )
+    def __enter__(self):
+        return self
 
-    # Submit login info
-    email_field = browser.find_element_by_id("Email Address")
-    email_field.clear()
-    email_field.send_keys(settings.LISTSERV_USERNAME)
-    password_field = browser.find_element_by_id("Password")
-    password_field.clear()
-    password_field.send_keys(settings.LISTSERV_PASSWORD)
-    email_field.submit()
+    def __exit__(self, *exc_info):
+        self.close()
 
-    # Wait for login request to complete
-    wait.WebDriverWait(browser, 10).until(
-        expected_conditions.element_to_be_clickable((By.ID, "Input File"))
-    )
 
-    # Open the email upload page and submit the form
-    replace_all_button = browser.find_element_by_id("radiob")
-    replace_all_button.click()
-    file_upload = browser.find_element_by_id("Input File")
+class ListservForm:
+    def __init__(self, action, method):
+        self.action = action
+        self.method = method
+        self.fields = []
 
-    file_upload.send_keys(emails_file)
+    def has_field(self, field_id):
+        return any(field.get("id") == field_id for field in self.fields)
 
-    print("Waiting for file upload...")
-    time.sleep(LOAD_WAIT_SECS)
+    def values(self, filled=None, choose=None):
+        """
+        The name and value of each field that the browser would send when submitting the form
 
-    file_upload.submit()
+        :param filled: {field id: value} of the fields to fill in
+        :param choose: the id of the radio button to choose, instead of the one chosen by default
+        """
+        filled = filled or {}
+        chosen = {field["name"] for field in self.fields if field.get("id") == choose}
+        values = []
+        submitted = False
+        for field in self.fields:
+            kind = field.get("type", "text").lower()
+            if kind in ("submit", "image"):
+                if not submitted:
+                    values.append((field["name"], field.get("value", "")))
+                    submitted = True
+            elif kind in ("radio", "checkbox"):
+                if field["name"] in chosen:
+                    selected = field.get("id") == choose
+                else:
+                    selected = "checked" in field
+                if selected:
+                    values.append((field["name"], field.get("value", "on")))
+            elif kind not in ("file", "button", "reset"):
+                values.append((field["name"], filled.get(field.get("id"), field.get("value", ""))))
+        return values
 
-    # TODO: parse response and notify someone
-    print("Waiting for listserv to process...")
-    time.sleep(LOAD_WAIT_SECS)
 
-    print("pause")
-    change_message = browser.find_element_by_class_name("message").text
+class ListservPageParser(HTMLParser):
+    """Picks the forms and the message out of a page of the listserv"""
 
-    return change_message
+    def __init__(self):
+        super().__init__()
+        self.forms = []
+        self.message = None
+        self.__message_tag = None
+        self.__depth = 0
 
+    def handle_starttag(self, tag, attrs):
+        attrs = {name: "" if value is None else value for name, value in attrs}
+        if tag == "form":
+            self.forms.append(ListservForm(attrs.get("action", ""), attrs.get("method", "get").lower()))
+        elif tag in ("input", "select", "textarea") and "name" in attrs and self.forms:
+            self.forms[-1].fields.append(attrs)
 
-def run_update():
-    emails = get_active_emails()
-    email_file = write_emails(emails)
-    change_message = push_to_listserv(email_file)
-    notify_info("Listserv Updated", change_message)
+        if self.__message_tag == tag:
+            self.__depth += 1
+        elif self.__message_tag is None and self.message is None and "message" in attrs.get("class", "").split():
+            self.__message_tag, self.__depth, self.message = tag, 1, ""
+
+    def handle_endtag(self, tag):
+        if tag == self.__message_tag:
+            self.__depth -= 1
+            if not self.__depth:
+                self.__message_tag = None
+                self.message = " ".join(self.message.split())
+
+    def handle_data(self, data):
+        if self.__message_tag is not None:
+            self.message += data
+
+    def find_form(self, field_id):
+        for form in self.forms:
+            if form.has_field(field_id):
+                return form
+        raise ListservError(f'The listserv page has no form with a "{field_id}" field')
+
+
+def encode_multipart(values, files):
+    """Encode the form values and the {field name: (filename, content)} files as multipart/form-data"""
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in values:
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n')
+    for name, (filename, content) in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+            f"Content-Type: text/plain\r\n\r\n{content}\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n")
+    return "".join(parts).encode(), f"multipart/form-data; boundary={boundary}"
+
+
+class HttpListservTransport(ListservTransport):
+    """
+    Fills in the listserv's forms with plain HTTP requests, as a browser would but without running one
+
+    Logs in the first time a change is pushed, and keeps the session cookie for the rest of the changes.
+    """
+
+    def __init__(self, address=None, username=None, password=None, timeout=LOAD_WAIT_SECS):
+        self.address = address or settings.LISTSERV_FORM_ADDRESS
+        self.username = username or settings.LISTSERV_USERNAME
+        self.password = password or settings.LISTSERV_PASSWORD
+        self.timeout = timeout
+        self.upload_form = None
+        self.upload_url = None
+
+        # The listserv's certificate does not verify, as it never has
+        https = HTTPSHandler(context=ssl._create_unverified_context())
+        self.opener = build_opener(HTTPCookieProcessor(CookieJar()), https)
+
+    def __request(self, url, data=None, content_type=None):
+        """Load the page, returning its url (after any redirects) and its parsed contents"""
+        request = Request(url, data=data)
+        if content_type:
+            request.add_header("Content-Type", content_type)
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                charset = response.headers.get_content_charset() or "utf-8"
+                url, page = response.geturl(), response.read().decode(charset, errors="replace")
+        except (URLError, OSError) as error:
+            raise ListservError(f"Could not load {url}: {error}") from error
+
+        parser = ListservPageParser()
+        parser.feed(page)
+        return url, parser
+
+    def __submit(self, url, form, values, files=None):
+        action = urljoin(url, form.action)
+        if files is not None:
+            data, content_type = encode_multipart(values, files)
+            return self.__request(action, data, content_type)
+        if form.method == "post":
+            return self.__request(action, urlencode(values).encode(), "application/x-www-form-urlencoded")
+        return self.__request(f"{action}?{urlencode(values)}")
+
+    def login(self):
+        url, page = self.__request(self.address)
+        login_form = page.find_form(LOGIN_EMAIL_ID)
+        values = login_form.values({LOGIN_EMAIL_ID: self.username, LOGIN_PASSWORD_ID: self.password})
+        self.upload_url, page = self.__submit(url, login_form, values)
+        try:
+            self.upload_form = page.find_form(UPLOAD_FILE_ID)
+        except ListservError:
+            raise ListservError(f"Could not log in to the listserv: {page.message}")
+
+    def upload(self, operation, emails):
+        if self.upload_form is None:
+            self.login()
+
+        # Never fall back to the option chosen by default, as that would replace everyone with just these emails
+        if not self.upload_form.has_field(OPERATION_IDS[operation]):
+            raise UnsupportedOperation(f"The listserv upload form has no option to {operation} emails")
+        file_field = next(field["name"] for field in self.upload_form.fields if field.get("id") == UPLOAD_FILE_ID)
+        values = self.upload_form.values(choose=OPERATION_IDS[operation])
+        files = {file_field: ("listserv_emails.txt", "".join(f"{email}\n" for email in emails))}
+        _, page = self.__submit(self.upload_url, self.upload_form, values, files)
+        return page.message
+
+
+class SeleniumListservTransport(ListservTransport):
+    """Fills in the listserv's forms through Firefox, for when the plain HTTP requests can not get through"""
+
+    def __init__(self, address=None, username=None, password=None, timeout=LOAD_WAIT_SECS):
+        self.address = address or settings.LISTSERV_FORM_ADDRESS
+        self.username = username or settings.LISTSERV_USERNAME
+        self.password = password or settings.LISTSERV_PASSWORD
+        self.timeout = timeout
+        self.browser = None
+
+    def upload(self, operation, emails):
+        try:
+            from selenium.common.exceptions import WebDriverException
+        except ImportError as error:
+            raise ListservError(f"Selenium is not installed: {error}") from error
+
+        try:
+            if self.browser is None:
+                self.__login()
+            return self.__upload(operation, emails)
+        except WebDriverException as error:
+            raise ListservError(f"Firefox could not get through to the listserv: {error.msg}") from error
+
+    def __login(self):
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions, wait
+
+        profile = webdriver.FirefoxProfile()
+        profile.accept_untrusted_certs = True
+        profile.assume_untrusted_cert_issuer = True
+        capabilities = webdriver.DesiredCapabilities().FIREFOX.copy()
+        capabilities["acceptInsecureCerts"] = True
+        self.browser = webdriver.Firefox(firefox_profile=profile, capabilities=capabilities)
+
+        # Open login page and wait till it loads
+        self.browser.get(self.address)
+        wait.WebDriverWait(self.browser, self.timeout).until(
+            expected_conditions.element_to_be_clickable((By.ID, LOGIN_EMAIL_ID))
+        )
+
+        # Submit login info
+        email_field = self.browser.find_element_by_id(LOGIN_EMAIL_ID)
+        email_field.clear()
+        email_field.send_keys(self.username)
+        password_field = self.browser.find_element_by_id(LOGIN_PASSWORD_ID)
+        password_field.clear()
+        password_field.send_keys(self.password)
+        email_field.submit()
+
+        # Wait for login request to complete
+        wait.WebDriverWait(self.browser, self.timeout).until(
+            expected_conditions.element_to_be_clickable((By.ID, UPLOAD_FILE_ID))
+        )
+
+    def __upload(self, operation, emails):
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions, wait
+
+        # Wait for the upload page, which is also the page that the previous upload answered with
+        wait.WebDriverWait(self.browser, self.timeout).until(
+            expected_conditions.element_to_be_clickable((By.ID, UPLOAD_FILE_ID))
+        )
+        if not self.browser.find_elements_by_id(OPERATION_IDS[operation]):
+            raise UnsupportedOperation(f"The listserv upload form has no option to {operation} emails")
+
+        handle, emails_file = tempfile.mkstemp(suffix=".txt")
+        os.close(handle)
+        try:
+            write_emails(emails, emails_file)
+            self.browser.find_element_by_id(OPERATION_IDS[operation]).click()
+            file_upload = self.browser.find_element_by_id(UPLOAD_FILE_ID)
+            file_upload.send_keys(emails_file)
+            file_upload.submit()
+
+            message = wait.WebDriverWait(self.browser, self.timeout).until(
+                expected_conditions.presence_of_element_located((By.CLASS_NAME, "message"))
+            )
+            return message.text
+        finally:
+            os.remove(emails_file)
+
+    def close(self):
+        if self.browser is not None:
+            self.browser.quit()
+            self.browser = None
+
+
+def replace_all(transport, emails):
+    """Replace everyone on the listserv with the emails, returning the listserv's messages"""
+    messages = [transport.replace(emails)]
+    ListservSubscriber.objects.record_replaced(emails)
+    record_progress(changed=len(emails))
+    return messages
+
+
+def sync(transport, full=False):
+    """
+    Bring the listserv up to date with the emails of the active members, returning the listserv's messages
+
+    Only the emails that were added or removed since the last sync are pushed, unless there was no sync before or a
+    full sync is asked for, which replaces everyone on the listserv instead. Everyone is also replaced if the listserv
+    can not add or remove emails. What was pushed is remembered after each change that the listserv confirmed, so a
+    sync that fails half way is picked up where it left off by the next one.
+    """
+    active = get_active_emails()
+    record_progress(examined=len(active))
+
+    if full or not ListservSubscriber.objects.exists():
+        return replace_all(transport, active)
+
+    adds, removes = ListservSubscriber.objects.diff(active)
+    messages = []
+    try:
+        if removes:
+            messages.append(transport.remove(sorted(removes)))
+            ListservSubscriber.objects.record_removed(removes)
+        if adds:
+            messages.append(transport.add(sorted(adds)))
+            ListservSubscriber.objects.record_added(adds)
+    except UnsupportedOperation as error:
+        logger.warning(f"{error}, replacing everyone on the listserv instead")
+        return messages + replace_all(transport, active)
+    record_progress(changed=len(adds) + len(removes))
+    logger.info(f"Added {len(adds)} and removed {len(removes)} listserv subscribers")
+    return messages
+
+
+def default_transports():
+    """The transports to sync the listserv through, in the order to try them in"""
+    return [HttpListservTransport(), SeleniumListservTransport()]
+
+
+def run_update(full=False, transports=None):
+    """Sync the listserv through the first transport that gets through to it, and tell the board what changed"""
+    error = None
+    for transport in default_transports() if transports is None else transports:
+        try:
+            with transport:
+                messages = sync(transport, full)
+        except ListservError as transport_error:
+            logger.warning(f"Could not sync the listserv with {type(transport).__name__}: {transport_error}")
+            error = transport_error
+        else:
+            notify_info("Listserv Updated", "\n".join(messages) or "Nothing changed")
+            return messages
+    raise error
 
 
 if __name__ == "__main__":
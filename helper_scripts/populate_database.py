@@ -246,6 +246,10 @@ for field_name in field_data.keys():
     )
     if "suffix" in field_data[field_name].keys():
         field.suffix = field_data[field_name]["suffix"]
+    if "choices" in field_data[field_name].keys():
+        field.choices = "\n".join(
+            f"{name}; {description}" for name, description in field_data[field_name]["choices"]
+        )
     try:
         field.save()
     except IntegrityError as ex:
@@ -253,6 +257,9 @@ for field_name in field_data.keys():
         field = CustomDataField.objects.get(name=field_name)
     custom_fields.append(field)
 
+# Only the values are stored on the gear, everything else is defined by the custom fields above
+gear_values = {field_name: data["initial"] for field_name, data in field_data.items()}
+
 geartype_names = [
     "Sleeping Bag",
     "Sleeping Pad",
@@ -306,7 +313,7 @@ for i in bar(range(number_gear)):
         gear_rfid=gear_rfid,
         geartype=geartype,
         gear_image=pick_random(all_gear_images),
-        **field_data,
+        **gear_values,
     )
     gear_rfids.append(gear_rfid)
 
@@ -341,7 +348,7 @@ for gear_rfid in RFIDS_TO_HAND_OUT:
             gear_rfid,
             gear_type,
             gear_image=pick_random(all_gear_images),
-            **field_data,
+            **gear_values,
         )
     except (IntegrityError, ValidationError) as ex:
         pass
@@ -0,0 +1,172 @@
+"""
+A small in-process scheduler, to run the scheduled tasks from a single warm process instead of a cold start per task
+
+The schedule of every task is given as a cron expression (minute hour day month weekday, with *, lists, ranges and
+steps), in the local time of the server. Every task runs in its own thread, and a task whose previous run is still
+going is skipped instead of run twice at the same time.
+"""
+import logging
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import timedelta
+
+from django.db import close_old_connections, connection
+from django.utils.timezone import localtime
+
+logger = logging.getLogger(__name__)
+
+#: The smallest and largest allowed value of each field of a cron expression. Weekday 0 is Sunday
+CRON_FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+#: How many runs of all tasks together the worker remembers
+RUN_HISTORY = 1000
+
+TaskRunRecord = namedtuple("TaskRunRecord", ["name", "started_at", "duration", "error"])
+
+
+def parse_cron_field(field, low, high):
+    """Parse one field of a cron expression into the set of values it allows"""
+    values = set()
+    for part in field.split(","):
+        spread, _, step = part.partition("/")
+        step = int(step) if step else 1
+        if spread == "*":
+            start, end = low, high
+        elif "-" in spread:
+            start, end = (int(value) for value in spread.split("-"))
+        else:
+            start = int(spread)
+            end = high if step > 1 else start
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"'{part}' is not within {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+
+class CronSchedule:
+    """When a task should run, as given by a cron expression"""
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != len(CRON_FIELDS):
+            raise ValueError(f"The cron expression '{expression}' should have {len(CRON_FIELDS)} fields")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            parse_cron_field(field, low, high) for field, (low, high) in zip(fields, CRON_FIELDS)
+        )
+
+        # Like cron, when both the day and the weekday are given, a day matching either of them will do
+        self.either_day = fields[2] != "*" and fields[4] != "*"
+
+    def __str__(self):
+        return self.expression
+
+    def matches_day(self, at):
+        day = at.day in self.days
+        weekday = (at.weekday() + 1) % 7 in self.weekdays
+        if self.either_day:
+            return at.month in self.months and (day or weekday)
+        return at.month in self.months and day and weekday
+
+    def next_after(self, at):
+        """The first time after the given (naive, local) time that the schedule matches"""
+        at = at.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+        # Skip ahead a day or an hour at a time where possible, the schedule might only match once a year
+        limit = at + timedelta(days=366 * 5)
+        while at < limit:
+            if not self.matches_day(at):
+                at = at.replace(hour=0, minute=0) + timedelta(days=1)
+            elif at.hour not in self.hours:
+                at = at.replace(minute=0) + timedelta(hours=1)
+            elif at.minute not in self.minutes:
+                at += timedelta(minutes=1)
+            else:
+                return at
+        raise ValueError(f"The cron expression '{self.expression}' never matches")
+
+
+def local_clock():
+    """The current local time of the server, without a timezone so that stepping through it ignores DST changes"""
+    return localtime().replace(tzinfo=None)
+
+
+class TaskWorker:
+    """
+    Runs tasks when their schedules say so, from a single process that stays up
+
+    :param schedule: dict of {task name: cron expression}
+    :param get_task: function to get the function of a task from its name, only called when the task is run
+    """
+
+    def __init__(self, schedule, get_task, clock=local_clock):
+        self.get_task = get_task
+        self.clock = clock
+        self.schedules = {name: CronSchedule(expression) for name, expression in schedule.items()}
+        self.locks = {name: threading.Lock() for name in schedule}
+        self.runs = deque(maxlen=RUN_HISTORY)
+
+        started = self.clock()
+        self.next_runs = {name: cron.next_after(started) for name, cron in self.schedules.items()}
+
+    def run_task(self, name):
+        """
+        Run a task right now, unless the previous run of it is still going
+
+        :return: TaskRunRecord of the run, or None if it was skipped
+        """
+        lock = self.locks.setdefault(name, threading.Lock())
+        if not lock.acquire(blocking=False):
+            logger.warning(f"Skipped {name}, its previous run is still going")
+            return None
+
+        try:
+            close_old_connections()
+            started_at = self.clock()
+            start = time.perf_counter()
+            error = None
+            try:
+                self.get_task(name)()
+            except Exception as task_error:
+                logger.exception(f"Task {name} failed")
+                error = task_error
+            duration = time.perf_counter() - start
+
+            run = TaskRunRecord(name, started_at, duration, error)
+            self.runs.append(run)
+            logger.info(f"Ran {name} in {duration:.2f}s" + (f", it failed with {error!r}" if error else ""))
+            return run
+        finally:
+            lock.release()
+
+    def _run_in_thread(self, name):
+        try:
+            self.run_task(name)
+        finally:
+            # Every thread gets its own database connection, which would be left open otherwise
+            connection.close()
+
+    def start_task(self, name):
+        """Run a task in a thread of its own"""
+        thread = threading.Thread(target=self._run_in_thread, args=(name,), name=f"task-{name}", daemon=True)
+        thread.start()
+        return thread
+
+    def run_pending(self):
+        """Start all the tasks that are due, and work out when they are next due"""
+        at = self.clock()
+        started = []
+        for name, next_run in self.next_runs.items():
+            if next_run <= at:
+                self.next_runs[name] = self.schedules[name].next_after(at)
+                started.append(self.start_task(name))
+        return started
+
+    def run_forever(self):
+        for name, next_run in sorted(self.next_runs.items(), key=lambda item: item[1]):
+            logger.info(f"Scheduled {name} ({self.schedules[name]}), next run at {next_run}")
+        while True:
+            self.run_pending()
+            wait = (min(self.next_runs.values()) - self.clock()).total_seconds()
+            time.sleep(min(max(wait, 1), 60))
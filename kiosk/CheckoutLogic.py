@@ -1,12 +1,18 @@
 from core.models.TransactionModels import Transaction
-from django.utils.timezone import now, timedelta
+from django.utils.timezone import localdate, timedelta
 
 
-def do_checkout(staffer_rfid: str, member_rfid: str, gear_rfid: str) -> None:
+def do_checkout(staffer_rfid: str, member_rfid: str, gear_rfid: str, version: int = None) -> tuple:
     # TODO: make return date a choose-able parameter, currently just a week from rental date
-    return_date = now().today() + timedelta(days=7)
-    Transaction.objects.make_checkout(staffer_rfid, gear_rfid, member_rfid, return_date)
+    return_date = localdate() + timedelta(days=7)
+    return Transaction.objects.make_checkout(staffer_rfid, gear_rfid, member_rfid, return_date, version=version)
 
 
-def do_checkin(staffer_rfid: str, gear_rfid: str) -> None:
-    Transaction.objects.check_in_gear(staffer_rfid, gear_rfid)
+def do_checkout_many(staffer_rfid: str, member_rfid: str, gear_rfids: list) -> tuple:
+    # TODO: make return date a choose-able parameter, currently just a week from rental date
+    return_date = localdate() + timedelta(days=7)
+    return Transaction.objects.make_checkout_many(staffer_rfid, member_rfid, gear_rfids, return_date)
+
+
+def do_checkin(staffer_rfid: str, gear_rfid: str, version: int = None) -> tuple:
+    return Transaction.objects.check_in_gear(staffer_rfid, gear_rfid, version=version)
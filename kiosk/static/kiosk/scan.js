@@ -0,0 +1,89 @@
+// Submit kiosk scans to the JSON scan endpoint, and update the page in place instead of reloading it
+(function () {
+    "use strict";
+
+    function showMessage(message, level) {
+        var messages = document.getElementById("scan-messages");
+        if (!messages || !message) {
+            return;
+        }
+        var alert = document.createElement("div");
+        alert.className = "alert alert-" + level;
+        alert.setAttribute("role", "alert");
+        alert.textContent = message;
+        messages.innerHTML = "";
+        messages.appendChild(alert);
+    }
+
+    function updateMemberPage(data) {
+        var list = document.getElementById("gear-list");
+        var existing = list.querySelector("[data-rfid='" + data.rfid + "']");
+        if (existing) {
+            list.removeChild(existing);
+        }
+        if (data.action === "checkout" && data.html) {
+            list.insertAdjacentHTML("afterbegin", data.html);
+        }
+        document.getElementById("no-gear").hidden = list.children.length > 0;
+    }
+
+    function updateGearPage(data) {
+        var status = document.getElementById("gear-status");
+        if (data.html) {
+            status.outerHTML = data.html;
+        }
+        if (data.status) {
+            document.getElementById("gear-status-name").textContent = data.status;
+        }
+    }
+
+    function handleResponse(form, data) {
+        if (data.url) {
+            window.location.href = data.url;
+            return;
+        }
+        showMessage(data.message, data.level);
+        if (data.action === "checkout" || data.action === "checkin") {
+            if (form.dataset.context === "member") {
+                updateMemberPage(data);
+            } else if (form.dataset.context === "gear") {
+                updateGearPage(data);
+            }
+        }
+    }
+
+    function submitScan(event) {
+        var form = event.target;
+        if (!window.fetch || !window.FormData) {
+            return;  // Fall back to the normal form submission
+        }
+        event.preventDefault();
+
+        var body = new FormData(form);
+        body.append("context", form.dataset.context);
+        body.append("context_rfid", form.dataset.contextRfid || "");
+        var input = form.querySelector("input[name='rfid']");
+        input.value = "";
+
+        fetch(form.dataset.scanUrl, {method: "POST", body: body, credentials: "same-origin"})
+            .then(function (response) {
+                return response.json();
+            })
+            .then(function (data) {
+                handleResponse(form, data);
+            })
+            .catch(function () {
+                showMessage("The scan could not be processed, please try again", "danger");
+            })
+            .finally(function () {
+                input.focus();
+            });
+    }
+
+    document.addEventListener("DOMContentLoaded", function () {
+        var forms = document.querySelectorAll("form.scan-form");
+        for (var i = 0; i < forms.length; i++) {
+            forms[i].addEventListener("submit", submitScan);
+        }
+    });
+})();
@@ -1,3 +1,5 @@
+from unittest import mock
+
 from helper_scripts.build_permissions import build_all as build_permissions
 from core.models.DepartmentModels import Department
 from core.models.GearModels import Gear, GearType
@@ -5,9 +7,12 @@ from core.models.MemberModels import Member
 from core.models.TransactionModels import Transaction
 from core.models.FileModels import AlreadyUploadedImage
 from django.core.exceptions import ValidationError
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.utils.timezone import timedelta
-from kiosk.CheckoutLogic import do_checkin, do_checkout
+from kiosk.CheckoutLogic import do_checkin, do_checkout, do_checkout_many
+from core.models.CertificationModels import Certification
 
 ADMIN_RFID = "0000000000"
 MEMBER_RFID1 = "0000000001"
@@ -166,9 +171,83 @@ class CheckoutLogicTest(TestCase):
         self.assertEqual(gear.is_rented_out(), True)
 
     def test_checkin_of_already_returned_gear(self):
-        """Test checkin of available gear by valid staffer is fine"""
+        """Test checkin of available gear is rejected, and leaves the gear available"""
         gear = Gear.objects.get(rfid=GEAR_RFID)
         self.assertEqual(gear.is_available(), True)
-        do_checkin(ADMIN_RFID, GEAR_RFID)
+        with self.assertRaises(ValidationError):
+            do_checkin(ADMIN_RFID, GEAR_RFID)
         gear = Gear.objects.get(rfid=GEAR_RFID)
         self.assertEqual(gear.is_available(), True)
+
+
+class CheckoutManyTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        Member.objects.create_superuser("john@bro.com", ADMIN_RFID, "pass")
+        self.member = Member.objects.create_member(
+            email="testemail@test.com",
+            rfid=MEMBER_RFID1,
+            membership_duration=timedelta(days=7),
+            password="password",
+        )
+        self.member.promote_to_active()
+
+        department = Department.objects.create(name="Camping", description="oops")
+        pad = GearType.objects.create(name="Crash Pad", department=department)
+        rope = GearType.objects.create(name="Rope", department=department)
+        self.climbing = Certification.objects.create(title="Climbing", requirements="Climb")
+        rope.min_required_certs.add(self.climbing)
+
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        self.pad_rfids = [f"01000000{i:02}" for i in range(10)]
+        for rfid in self.pad_rfids:
+            Transaction.objects.add_gear(ADMIN_RFID, rfid, pad, img)
+        self.rope_rfid = "0200000000"
+        Transaction.objects.add_gear(ADMIN_RFID, self.rope_rfid, rope, img)
+
+    def test_checkout_many(self):
+        transactions, failures = do_checkout_many(ADMIN_RFID, MEMBER_RFID1, self.pad_rfids)
+        self.assertEqual(failures, {})
+        self.assertEqual(len(transactions), 10)
+        self.assertEqual(Gear.objects.filter(checked_out_to=self.member, status=1).count(), 10)
+        self.assertEqual(Transaction.objects.filter(type="CheckOut", member=self.member).count(), 10)
+
+    def test_transaction_ids_are_distinct(self):
+        # As if every id were drawn twice within the same millisecond
+        repeated_ids = (big_id for big_id in range(1, 100) for _ in range(2))
+        with mock.patch("core.models.fields.PrimaryKeyField.make_id", side_effect=repeated_ids):
+            transactions, _ = do_checkout_many(ADMIN_RFID, MEMBER_RFID1, self.pad_rfids)
+        self.assertEqual(sorted(transaction.pk for transaction in transactions), list(range(1, 11)))
+
+    def test_query_count_independent_of_cart_size(self):
+        # The first checkout loads the cached certification requirements
+        do_checkout_many(ADMIN_RFID, MEMBER_RFID1, self.pad_rfids[:1])
+        with CaptureQueriesContext(connection) as small:
+            do_checkout_many(ADMIN_RFID, MEMBER_RFID1, self.pad_rfids[1:3])
+        with CaptureQueriesContext(connection) as large:
+            do_checkout_many(ADMIN_RFID, MEMBER_RFID1, self.pad_rfids[3:])
+        self.assertEqual(len(small), len(large))
+
+    def test_per_item_failures(self):
+        do_checkout(ADMIN_RFID, ADMIN_RFID, self.pad_rfids[0])
+        rfids = self.pad_rfids[:3] + [self.rope_rfid, "0999999999", self.pad_rfids[1]]
+        transactions, failures = do_checkout_many(ADMIN_RFID, MEMBER_RFID1, rfids)
+
+        self.assertEqual(len(transactions), 2)
+        self.assertEqual(set(failures.keys()), {self.pad_rfids[0], self.rope_rfid, "0999999999"})
+        self.assertIn("Climbing", failures[self.rope_rfid])
+        self.assertEqual(Gear.objects.get(rfid=self.pad_rfids[0]).checked_out_to.rfid, ADMIN_RFID)
+        self.assertTrue(Gear.objects.get(rfid=self.rope_rfid).is_available())
+
+    def test_certified_member(self):
+        self.member.certifications.add(self.climbing)
+        transactions, failures = do_checkout_many(ADMIN_RFID, MEMBER_RFID1, [self.rope_rfid])
+        self.assertEqual((len(transactions), failures), (1, {}))
+
+    def test_nonexistent_member_rejects_whole_cart(self):
+        with self.assertRaises(Member.DoesNotExist):
+            do_checkout_many(ADMIN_RFID, "0000010002", self.pad_rfids)
+        self.assertFalse(Gear.objects.filter(status=1).exists())
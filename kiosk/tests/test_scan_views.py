@@ -0,0 +1,172 @@
+from unittest import mock
+
+from helper_scripts.build_permissions import build_all as build_permissions
+from core.models.CertificationModels import Certification
+from core.models.DepartmentModels import Department
+from core.models.FileModels import AlreadyUploadedImage
+from core.models.GearModels import Gear, GearType
+from core.models.MemberModels import Member
+from core.models.RfidModels import rfid_cache
+from core.models.TransactionModels import Transaction
+from django.test import TestCase
+from django.urls import reverse
+from django.utils.timezone import timedelta
+
+STAFFER_RFID = "0000000000"
+MEMBER_RFID = "1234567890"
+GEAR_RFID = "0123456789"
+
+
+class ScanViewsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        rfid_cache.clear()
+        self.staffer = Member.objects.create_superuser("staff@bro.com", STAFFER_RFID, "pass")
+        self.member = Member.objects.create_member(
+            email="member@test.com",
+            rfid=MEMBER_RFID,
+            membership_duration=timedelta(days=7),
+            password="password",
+        )
+        self.member.move_to_group("Member")
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        geartype = GearType.objects.create(name="Skis", department=department)
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        Transaction.objects.add_gear(STAFFER_RFID, GEAR_RFID, geartype, img)
+
+        self.client.force_login(self.staffer)
+
+    def test_home_scan_gear(self):
+        response = self.client.post(reverse("kiosk:home"), {"rfid": GEAR_RFID})
+        self.assertRedirects(response, reverse("kiosk:gear", args=[GEAR_RFID]))
+
+    def test_home_scan_member(self):
+        response = self.client.post(reverse("kiosk:home"), {"rfid": MEMBER_RFID})
+        self.assertRedirects(response, reverse("kiosk:check_out", args=[MEMBER_RFID]))
+
+    def test_home_scan_unknown(self):
+        response = self.client.post(reverse("kiosk:home"), {"rfid": "9999999999"})
+        self.assertRedirects(response, reverse("kiosk:home"))
+
+    def test_gear_view_check_out_and_in(self):
+        url = reverse("kiosk:gear", args=[GEAR_RFID])
+
+        self.client.post(url, {"rfid": MEMBER_RFID})
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertEqual(gear.checked_out_to, self.member)
+
+        self.client.post(url, {"rfid": GEAR_RFID})
+        gear = Gear.objects.get(rfid=GEAR_RFID)
+        self.assertTrue(gear.is_available())
+
+    def test_cart_checkout(self):
+        url = reverse("kiosk:check_out_cart", args=[MEMBER_RFID])
+        response = self.client.post(url, {"rfids": [GEAR_RFID, "9999999999"]})
+        self.assertRedirects(response, reverse("kiosk:check_out", args=[MEMBER_RFID]))
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID).checked_out_to, self.member)
+
+    def test_cart_checkout_to_unknown_member(self):
+        url = reverse("kiosk:check_out_cart", args=["9999999999"])
+        response = self.client.post(url, {"rfids": [GEAR_RFID]})
+        self.assertRedirects(response, reverse("kiosk:home"))
+        self.assertTrue(Gear.objects.get(rfid=GEAR_RFID).is_available())
+
+    def test_cart_checkout_needs_login(self):
+        self.client.logout()
+        url = reverse("kiosk:check_out_cart", args=[MEMBER_RFID])
+        response = self.client.post(url, {"rfids": [GEAR_RFID]})
+        self.assertRedirects(response, f"{reverse('kiosk:login')}?next={url}", fetch_redirect_response=False)
+        self.assertTrue(Gear.objects.get(rfid=GEAR_RFID).is_available())
+
+    def test_member_view_lists_gear(self):
+        self.client.post(reverse("kiosk:check_out", args=[MEMBER_RFID]), {"rfid": GEAR_RFID})
+        response = self.client.get(reverse("kiosk:check_out", args=[MEMBER_RFID]))
+        self.assertEqual(response.context["member"], self.member)
+        self.assertEqual([gear.rfid for gear in response.context["checked_out_gear"]], [GEAR_RFID])
+
+    def test_member_view_marks_ineligible_gear_types(self):
+        climbing = Certification.objects.create(title="Climbing", requirements="Climb")
+        GearType.objects.get(name="Skis").min_required_certs.add(climbing)
+
+        response = self.client.get(reverse("kiosk:check_out", args=[MEMBER_RFID]))
+        gear_types = response.context["gear_types"]
+        self.assertEqual([(gear_type.name, gear_type.available) for gear_type in gear_types], [("Skis", 1)])
+        self.assertEqual(gear_types[0].missing_certs, ["Climbing"])
+        self.assertContains(response, "needs Climbing")
+
+
+    def test_member_view_skips_deleted_certs(self):
+        # The cached mask of required certs still names a certification for a moment after it is deleted
+        climbing = Certification.objects.create(title="Climbing", requirements="Climb")
+        stale_mask = 1 << climbing.pk
+        climbing.delete()
+
+        with mock.patch.object(GearType, "get_required_cert_mask", return_value=stale_mask):
+            response = self.client.get(reverse("kiosk:check_out", args=[MEMBER_RFID]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["gear_types"][0].missing_certs, [])
+
+
+class JsonScanTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        build_permissions()
+
+    def setUp(self):
+        rfid_cache.clear()
+        self.staffer = Member.objects.create_superuser("staff@bro.com", STAFFER_RFID, "pass")
+        self.member = Member.objects.create_member(
+            email="member@test.com",
+            rfid=MEMBER_RFID,
+            membership_duration=timedelta(days=7),
+            password="password",
+        )
+        self.member.move_to_group("Member")
+
+        department = Department.objects.create(name="Skiing", description="Snow")
+        geartype = GearType.objects.create(name="Skis", department=department)
+        img = AlreadyUploadedImage.objects.create(image_type="gear", picture="shaka.webp")
+        Transaction.objects.add_gear(STAFFER_RFID, GEAR_RFID, geartype, img)
+
+        self.client.force_login(self.staffer)
+
+    def scan(self, rfid, context="home", context_rfid=""):
+        response = self.client.post(
+            reverse("kiosk:scan"), {"rfid": rfid, "context": context, "context_rfid": context_rfid}
+        )
+        return response.json()
+
+    def test_home(self):
+        self.assertEqual(self.scan(GEAR_RFID)["url"], reverse("kiosk:gear", args=[GEAR_RFID]))
+        self.assertEqual(self.scan(MEMBER_RFID)["url"], reverse("kiosk:check_out", args=[MEMBER_RFID]))
+        self.assertEqual(self.scan("9999999999")["action"], "none")
+
+    def test_member_page(self):
+        data = self.scan(GEAR_RFID, "member", MEMBER_RFID)
+        self.assertEqual((data["action"], data["rfid"], data["url"]), ("checkout", GEAR_RFID, None))
+        self.assertIn(f'data-rfid="{GEAR_RFID}"', data["html"])
+        self.assertEqual(Gear.objects.get(rfid=GEAR_RFID).checked_out_to, self.member)
+
+        data = self.scan(GEAR_RFID, "member", MEMBER_RFID)
+        self.assertEqual(data["action"], "checkin")
+        self.assertTrue(Gear.objects.get(rfid=GEAR_RFID).is_available())
+
+    def test_gear_page(self):
+        data = self.scan(MEMBER_RFID, "gear", GEAR_RFID)
+        self.assertEqual((data["action"], data["status"]), ("checkout", "Checked Out"))
+        self.assertIn(str(self.member), data["html"])
+
+        # Scanning the member again while the gear is out just moves to the member
+        data = self.scan(MEMBER_RFID, "gear", GEAR_RFID)
+        self.assertEqual(data["url"], reverse("kiosk:check_out", args=[MEMBER_RFID]))
+
+        data = self.scan(GEAR_RFID, "gear", GEAR_RFID)
+        self.assertEqual((data["action"], data["status"]), ("checkin", "In Stock"))
+
+    def test_invalid_scan(self):
+        response = self.client.post(reverse("kiosk:scan"), {"rfid": ""})
+        self.assertEqual(response.status_code, 400)
@@ -7,7 +7,9 @@ app_name = "kiosk"
 urlpatterns = [
     path("", views.HomeView.as_view(), name="home"),
     path("", include("django.contrib.auth.urls")),
+    path("scan/", views.ScanView.as_view(), name="scan"),
     path("gear/<slug:rfid>/", views.GearView.as_view(), name="gear"),
     path("member/<slug:rfid>/", views.CheckOutView.as_view(), name="check_out"),
+    path("member/<slug:rfid>/cart/", views.CheckOutCartView.as_view(), name="check_out_cart"),
     path("retag-gear/<slug:rfid>/", views.RetagGearView.as_view(), name="retag_gear"),
 ]
@@ -1,15 +1,19 @@
 from typing import List
 
-from core.models.GearModels import Gear
+from core.models.CertificationModels import Certification, cert_ids_in
+from core.models.GearModels import Gear, GearType
 from core.models.MemberModels import Member
+from core.models.RfidModels import RfidRegistry, resolve_rfid
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.exceptions import ValidationError
-from django.http import Http404
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db.models import Count
+from django.http import Http404, JsonResponse
+from django.template.loader import render_to_string
 from django.urls import reverse
 from django.shortcuts import redirect, render
 from django.views import View, generic
-from kiosk.CheckoutLogic import do_checkin, do_checkout
+from kiosk.CheckoutLogic import do_checkin, do_checkout, do_checkout_many
 from kiosk.forms import HomeForm, RetagGearForm
 
 
@@ -38,20 +42,15 @@ class HomeView(LoginRequiredMixin, generic.TemplateView):
 
         if form.is_valid():
             rfid = form.cleaned_data["rfid"]
+            kind, _ = resolve_rfid(rfid)
 
             # If the scaned RFID belongs to gear, go to the relevant gear view
-            try:
-                Gear.objects.get(rfid=rfid)
+            if kind == RfidRegistry.GEAR:
                 return redirect("kiosk:gear", rfid)
-            except Gear.DoesNotExist:
-                pass
 
             # If the scaned RFID belongs to a member, go to the relevant member view
-            try:
-                Member.objects.get(rfid=rfid)
+            if kind == RfidRegistry.MEMBER:
                 return redirect("kiosk:check_out", rfid)
-            except Member.DoesNotExist:
-                pass
 
             # Something probably went wrong, so try and figure out what it might be
             if rfid.isdigit() and len(rfid) == 10:
@@ -88,12 +87,14 @@ class CheckOutView(View):
             alert_message = "Members must be active (have filled out new member email) to rent gear!"
             messages.add_message(request, messages.WARNING, alert_message)
 
-        checked_out_gear = get_checked_out_gear(rfid)
+        checked_out_gear = get_checked_out_gear(rfid, member)
+        gear_types = get_available_gear_types(member)
 
         args = {
             "form": form,
             "member": member,
             "checked_out_gear": checked_out_gear,
+            "gear_types": gear_types,
             "kiosk_home": reverse("kiosk:home")}
         return render(request, self.template_name, args)
 
@@ -105,21 +106,22 @@ class CheckOutView(View):
             staffer_rfid = request.user.rfid
             member_rfid = rfid
 
-            try:
-                gear = Gear.objects.get(rfid=gear_rfid)
-            except Gear.DoesNotExist:
-                gear = None
+            gear = get_gear(gear_rfid)
 
             if gear:
                 # Check the scanned piece of gear in or out, depending on the current state
-                if gear.is_available():
-                    do_checkout(staffer_rfid, member_rfid, gear_rfid)
-                    alert_message = f"{gear.name} was checked out successfully"
-                    messages.add_message(request, messages.INFO, alert_message)
-                else:
-                    do_checkin(staffer_rfid, gear_rfid)
-                    alert_message = f"{gear.name} was checked in successfully"
-                    messages.add_message(request, messages.WARNING, alert_message)
+                try:
+                    if gear.is_available():
+                        do_checkout(staffer_rfid, member_rfid, gear_rfid, version=gear.version)
+                        alert_message = f"{gear.name} was checked out successfully"
+                        messages.add_message(request, messages.INFO, alert_message)
+                    else:
+                        do_checkin(staffer_rfid, gear_rfid, version=gear.version)
+                        alert_message = f"{gear.name} was checked in successfully"
+                        messages.add_message(request, messages.WARNING, alert_message)
+                except ValidationError as e:
+                    # Most likely another kiosk changed the gear at the same time
+                    messages.add_message(request, messages.ERROR, e.message)
             else:
                 alert_message = "The RFID tag is not registered to a piece of gear"
                 messages.add_message(request, messages.WARNING, alert_message)
@@ -127,13 +129,45 @@ class CheckOutView(View):
             return redirect("kiosk:check_out", member_rfid)
 
 
+class CheckOutCartView(LoginRequiredMixin, View):
+    """
+    Check out a whole cart of gear to a member at once
+
+    The gear RFIDs are collected on the member page as they are scanned, and then all submitted together
+    """
+
+    login_url = "kiosk:login"
+
+    @staticmethod
+    def post(request, rfid):
+        gear_rfids = [gear_rfid for gear_rfid in request.POST.getlist("rfids") if gear_rfid]
+
+        if gear_rfids:
+            try:
+                transactions, failures = do_checkout_many(request.user.rfid, rfid, gear_rfids)
+            except ValidationError as e:
+                messages.add_message(request, messages.ERROR, e.message)
+            except ObjectDoesNotExist:
+                messages.add_message(request, messages.WARNING, "The RFID is not registered to a member")
+                return redirect("kiosk:home")
+            else:
+                if transactions:
+                    alert_message = f"{len(transactions)} items were checked out successfully"
+                    messages.add_message(request, messages.INFO, alert_message)
+                for message in failures.values():
+                    messages.add_message(request, messages.WARNING, message)
+        else:
+            messages.add_message(request, messages.WARNING, "No gear was scanned into the cart")
+
+        return redirect("kiosk:check_out", rfid)
+
+
 class GearView(View):
     template_name = "kiosk/gear.html"
 
     def get(self, request, rfid: str):
-        try:
-            gear = Gear.objects.get(rfid=rfid)
-        except Gear.DoesNotExist:
+        gear = get_gear(rfid)
+        if gear is None:
             raise Http404()
 
         args = {"form": HomeForm(), "gear": gear, "kiosk_home": reverse("kiosk:home")}
@@ -152,26 +186,16 @@ class GearView(View):
             form_rfid = form.cleaned_data["rfid"]
             staffer_rfid = request.user.rfid
 
-            try:
-                this_gear = Gear.objects.get(rfid=rfid)
-            except Gear.DoesNotExist:
+            this_gear = get_gear(rfid)
+            if this_gear is None:
                 raise Http404()
 
-            # See if the newly scanned RFID belongs to a piece of gear
-            try:
-                gear = Gear.objects.get(rfid=form_rfid)
-                gear_rfid = form_rfid
-            except Gear.DoesNotExist:
-                gear = None
-                gear_rfid = None
-
-            # See if the available RFID belong to members
-            try:
-                member = Member.objects.get(rfid=form_rfid)
-                member_rfid = form_rfid
-            except Member.DoesNotExist:
-                member = None
-                member_rfid = None
+            # See if the newly scanned RFID belongs to a piece of gear or to a member
+            kind, scanned = resolve_rfid(form_rfid)
+            gear = scanned if kind == RfidRegistry.GEAR else None
+            gear_rfid = form_rfid if gear else None
+            member = scanned if kind == RfidRegistry.MEMBER else None
+            member_rfid = form_rfid if member else None
 
             # If we scanned a member RFID, then try to check this piece of gear out to a member
             if member:
@@ -183,7 +207,7 @@ class GearView(View):
                 # If this gear is not yet checked out, then try to check it our the just scanned member
                 else:
                     try:
-                        do_checkout(staffer_rfid, member_rfid, rfid)
+                        do_checkout(staffer_rfid, member_rfid, rfid, version=this_gear.version)
                     except ValidationError as e:
                         messages.add_message(request, messages.ERROR, e.message)
                     else:
@@ -198,7 +222,7 @@ class GearView(View):
                 if gear_rfid == rfid:
                     if gear.is_rented_out():
                         try:
-                            do_checkin(staffer_rfid, gear.rfid)
+                            do_checkin(staffer_rfid, gear.rfid, version=gear.version)
                         except ValidationError as e:
                             messages.add_message(request, messages.ERROR, e.message)
                         else:
@@ -220,6 +244,104 @@ class GearView(View):
                 return redirect("kiosk:gear", rfid)
 
 
+class ScanView(LoginRequiredMixin, View):
+    """
+    Handle a scan made on any of the kiosk pages, without reloading the page
+
+    The scanned rfid is posted along with the context it was scanned in (the "home", "member" or "gear" page, and the
+    rfid of the member or gear on that page). The response describes what happened:
+        action: what was done, one of "checkout", "checkin", "navigate" or "none"
+        message, level: a message to show to the staffer, and how urgent it is
+        url: the page to go to, if the scan should switch to another page
+        rfid, status, html: the gear that changed, its new status and the updated html for it on the current page
+    """
+
+    login_url = "kiosk:login"
+
+    def post(self, request):
+        form = HomeForm(request.POST)
+        if not form.is_valid():
+            return self.respond("none", "Please scan a 10 digit RFID", level="warning", status=400)
+
+        rfid = form.cleaned_data["rfid"]
+        context = request.POST.get("context", "home")
+        context_rfid = request.POST.get("context_rfid", "")
+        kind, scanned = resolve_rfid(rfid)
+
+        try:
+            if context == "member":
+                return self.member_scan(request, context_rfid, rfid, kind, scanned)
+            elif context == "gear":
+                return self.gear_scan(request, context_rfid, rfid, kind, scanned)
+            else:
+                return self.home_scan(rfid, kind)
+        except ValidationError as e:
+            return self.respond("none", e.message, level="danger")
+        except ObjectDoesNotExist:
+            return self.respond("none", "The page's RFID is no longer registered", level="danger")
+
+    def home_scan(self, rfid, kind):
+        if kind == RfidRegistry.GEAR:
+            return self.respond("navigate", url=reverse("kiosk:gear", args=[rfid]))
+        elif kind == RfidRegistry.MEMBER:
+            return self.respond("navigate", url=reverse("kiosk:check_out", args=[rfid]))
+        elif rfid.isdigit() and len(rfid) == 10:
+            return self.respond("none", f"The RFID {rfid} is not registered", level="warning")
+        else:
+            return self.respond("none", f"{rfid} is not a valid RFID", level="warning")
+
+    def member_scan(self, request, member_rfid, rfid, kind, scanned):
+        if kind == RfidRegistry.MEMBER:
+            return self.respond("navigate", url=reverse("kiosk:check_out", args=[rfid]))
+        elif kind != RfidRegistry.GEAR:
+            return self.respond("none", "The RFID tag is not registered to a piece of gear", level="warning")
+
+        # Check the scanned piece of gear in or out, depending on the current state
+        if scanned.is_available():
+            _, gear = do_checkout(request.user.rfid, member_rfid, rfid, version=scanned.version)
+            message = f"{gear.name} was checked out successfully"
+            return self.respond("checkout", message, gear=gear, template="kiosk/fragments/gear_row.html")
+        else:
+            _, gear = do_checkin(request.user.rfid, rfid, version=scanned.version)
+            message = f"{gear.name} was checked in successfully"
+            return self.respond("checkin", message, level="warning", gear=gear)
+
+    def gear_scan(self, request, gear_rfid, rfid, kind, scanned):
+        template = "kiosk/fragments/gear_status.html"
+        if kind == RfidRegistry.MEMBER:
+            this_gear = get_gear(gear_rfid)
+            if this_gear is None:
+                raise Http404()
+
+            # If this gear is already rented out, just go to the member
+            if this_gear.is_rented_out():
+                return self.respond("navigate", url=reverse("kiosk:check_out", args=[rfid]))
+            _, gear = do_checkout(request.user.rfid, rfid, gear_rfid, version=this_gear.version)
+            return self.respond("checkout", f"Gear checked out to: {scanned}!", gear=gear, template=template)
+
+        elif kind == RfidRegistry.GEAR:
+            # Scanning another piece of gear moves to that gear, scanning the same one again checks it in
+            if rfid != gear_rfid:
+                return self.respond("navigate", url=reverse("kiosk:gear", args=[rfid]))
+            if not scanned.is_rented_out():
+                return self.respond("none", "Gear is already checked in", level="warning")
+            _, gear = do_checkin(request.user.rfid, rfid, version=scanned.version)
+            message = f"{gear.name} was checked in successfully"
+            return self.respond("checkin", message, gear=gear, template=template)
+
+        else:
+            return self.respond("none", "The RFID is not registered to any gear", level="warning")
+
+    @staticmethod
+    def respond(action, message="", level="info", url=None, gear=None, template=None, status=200):
+        data = {"action": action, "message": message, "level": level, "url": url}
+        if gear is not None:
+            data["rfid"] = gear.rfid
+            data["status"] = gear.get_status()
+            data["html"] = render_to_string(template, {"gear": gear}) if template else ""
+        return JsonResponse(data, status=status)
+
+
 class RetagGearView(View):
     template_name = "kiosk/retag_gear.html"
 
@@ -229,18 +351,23 @@ class RetagGearView(View):
         return render(request, self.template_name, args)
 
 
+def get_gear(gear_rfid: str) -> Gear:
+    """Get the piece of gear with the rfid, or None if the rfid does not belong to gear"""
+    kind, gear = resolve_rfid(gear_rfid)
+    return gear if kind == RfidRegistry.GEAR else None
+
+
 def get_member(member_rfid: str, member=None) -> Member:
-    try:
-        member = Member.objects.get(rfid=member_rfid)
-    except Member.DoesNotExist:
+    kind, member = resolve_rfid(member_rfid)
+    if kind != RfidRegistry.MEMBER:
         raise ValidationError("This RFID is not assiciated with a member!")
-    else:
-        return member
+    return member
 
 
-def get_checked_out_gear(member_rfid: str) -> List[object]:
+def get_checked_out_gear(member_rfid: str, current_member=None) -> List[object]:
 
-    current_member = get_member(member_rfid)
+    if current_member is None:
+        current_member = get_member(member_rfid)
 
     try:
         checked_out_gear = list(Gear.objects.filter(checked_out_to=current_member).order_by('due_date'))
@@ -248,3 +375,34 @@ def get_checked_out_gear(member_rfid: str) -> List[object]:
         raise ValidationError(f"Failed to get a gear list for {current_member.get_full_name()}")
     else:
         return checked_out_gear
+
+
+def get_available_gear_types(member) -> List[GearType]:
+    """
+    Get the gear types that have gear in stock, with the number available and whether the member can rent them
+
+    Each gear type gets an "available" count, and a "missing_certs" list of the titles of the certifications that the
+    member would need to rent it, which is empty if they can rent it already.
+    """
+    gear_types = list(
+        GearType.objects.filter(gear__status=0)
+        .annotate(available=Count("gear"))
+        .order_by("department__name", "name")
+    )
+
+    member_mask = member.get_cert_mask()
+    missing_masks = {gear_type.pk: gear_type.get_required_cert_mask() & ~member_mask for gear_type in gear_types}
+
+    # Fetch the titles of all the missing certifications at once, they are rarely needed but are shown to the staffer
+    titles = {}
+    all_missing = 0
+    for mask in missing_masks.values():
+        all_missing |= mask
+    if all_missing:
+        titles = dict(Certification.objects.filter(pk__in=cert_ids_in(all_missing)).values_list("pk", "title"))
+
+    # A cached mask can still name a certification that was just deleted, which is no longer needed so is left out
+    for gear_type in gear_types:
+        cert_ids = cert_ids_in(missing_masks[gear_type.pk])
+        gear_type.missing_certs = [titles[cert_id] for cert_id in cert_ids if cert_id in titles]
+    return gear_types
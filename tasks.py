@@ -1,9 +1,6 @@
 import sys
 from helper_scripts import setup_django
-from core.tasks import expire_members, update_listserv, expire_gear, email_overdue_gear
-from helper_scripts.build_permissions import build_all as build_all_perms
-from helper_scripts.listserv_interface import get_email_file
-from helper_scripts.fix_member_group import fix_all_group_names
+from django.utils.module_loading import import_string
 
 
 def populate_database():
@@ -14,26 +11,52 @@ def reset_database():
     import helper_scripts.restart_database
 
 
+# The tasks are only imported when they are run, so that a task never pays for the imports of the others (i.e. Selenium)
 tasks = {
-    "expire_members": expire_members,
-    "expire_gear": expire_gear,
-    "email_overdue_gear": email_overdue_gear,
-    "update_listserv": update_listserv,
-    "get_email_file": get_email_file,
-    "build_permissions": build_all_perms,
+    "expire_members": "core.tasks.expire_members",
+    "send_queued_emails": "core.tasks.send_queued_emails",
+    "email_worker": "core.tasks.email_worker",
+    "expire_gear": "core.tasks.expire_gear",
+    "catch_up_expired_gear": "core.tasks.catch_up_expired_gear",
+    "email_overdue_gear": "core.tasks.email_overdue_gear",
+    "update_listserv": "core.tasks.update_listserv",
+    "replace_listserv": "core.tasks.replace_listserv",
+    "update_gear_names": "core.tasks.update_gear_names",
+    "rebuild_gear_attributes": "core.tasks.rebuild_gear_attributes",
+    "rebuild_rfid_registry": "core.tasks.rebuild_rfid_registry",
+    "take_gear_snapshot": "core.tasks.take_gear_snapshot",
+    "check_gear_state": "core.tasks.check_gear_state",
+    "archive_transactions": "core.tasks.archive_transactions",
+    "get_email_file": "helper_scripts.listserv_interface.get_email_file",
+    "build_permissions": "helper_scripts.build_permissions.build_all",
     "populate_database": populate_database,
     "reset_database": reset_database,
-    "fix_group": fix_all_group_names,
+    "fix_group": "helper_scripts.fix_member_group.fix_all_group_names",
 }
 
+# When the worker runs each of the scheduled tasks, as cron expressions in the local time of the server
+schedule = {
+    "expire_gear": "0 1 * * 1-6",
+    "catch_up_expired_gear": "0 1 * * 0",
+    "email_overdue_gear": "30 1 * * *",
+    "expire_members": "0 2 * * *",
+    "take_gear_snapshot": "0 3 * * *",
+    "update_listserv": "0 4 * * *",
+    "archive_transactions": "0 5 1 1 *",
+}
 
-def run_task(task_name):
+
+def get_task(task_name):
+    """Get the function of a task, importing it if needed"""
     task_name = task_name.lower()
-    if task_name in tasks.keys():
-        func = tasks[task_name]
-        return func()
-    else:
+    if task_name not in tasks.keys():
         raise KeyError("Unknown task name!")
+    task = tasks[task_name]
+    return import_string(task) if isinstance(task, str) else task
+
+
+def run_task(task_name):
+    return get_task(task_name)()
 
 
 if __name__ == "__main__":
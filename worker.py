@@ -0,0 +1,15 @@
+"""
+Runs all the scheduled tasks from a single process, which only has to set up django once
+
+Start it with ```python worker.py``` and leave it running. The schedule is in tasks.py.
+"""
+import logging
+
+from helper_scripts import setup_django
+from helper_scripts.scheduler import TaskWorker
+from tasks import get_task, schedule
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(threadName)s %(levelname)s: %(message)s")
+    TaskWorker(schedule, get_task).run_forever()